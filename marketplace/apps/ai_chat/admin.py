@@ -14,4 +14,5 @@ class ChatSessionAdmin(admin.ModelAdmin):
     list_display = ('title', 'user', 'created_at', 'updated_at', 'is_active')
     list_filter = ('is_active',)
     search_fields = ('title', 'user__email')
+    readonly_fields = ('summary', 'summary_until')
     inlines = [ChatMessageInline]
\ No newline at end of file
@@ -4,4 +4,7 @@ from django.apps import AppConfig
 class AiChatConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.ai_chat'
-    verbose_name = 'AI Чат'
\ No newline at end of file
+    verbose_name = 'AI Чат'
+
+    def ready(self):
+        from . import receivers  # noqa: F401
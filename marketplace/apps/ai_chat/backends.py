@@ -0,0 +1,397 @@
+"""
+LLM backends and routing between them.
+
+settings.LLM_BACKENDS lists the servers the chat may use. Each entry is a
+dict:
+
+- name: label for logs and metrics (also the scheduler's key);
+- type: 'ollama' (/api/chat) or 'openai' (an OpenAI-compatible
+  /v1/chat/completions server such as llama.cpp's server or vLLM);
+- url, model, and api_key for servers that want a bearer token;
+- weight: share of the traffic relative to the other backends (default 1);
+- timeout and connect_timeout: seconds; the read timeout (OLLAMA_TIMEOUT
+  by default) applies between streamed chunks, not to the whole answer;
+- max_connections and max_keepalive: the backend's own connection pool;
+- concurrency: generations admitted at once (scheduler.py).
+
+The router sends a request to the healthy backend with the fewest requests
+in flight per unit of weight (ties are broken at random, in proportion to
+weight), so a slow or saturated host gets less traffic. A backend whose
+circuit is open (health.py) gets none until it recovers.
+
+Backends speak their own protocol and hand back the same Chunk and
+(content, tool_calls) shapes, with tool calls in Ollama's form
+({'id', 'function': {'name', 'arguments'}}), so ollama_service.py doesn't
+care which one answered.
+"""
+import asyncio
+import json
+import os
+import random
+import threading
+import weakref
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+import httpx
+from django.conf import settings
+
+from .health import BackendHealth
+
+
+class BackendError(Exception):
+    """The backend reported an error inside a successful response"""
+
+
+class ToolsUnsupported(Exception):
+    """The backend rejected the tools field (the model has no tool support)"""
+
+
+@dataclass
+class Chunk:
+    text: str = ''
+    tool_calls: list = field(default_factory=list)
+    done: bool = False
+
+
+class LLMBackend:
+    kind = None
+    chat_path = None
+    probe_path = None
+
+    def __init__(self, name, url, model, weight=1, timeout=None, connect_timeout=5.0,
+                 max_connections=None, max_keepalive=None, concurrency=None, api_key=None):
+        self.name = name
+        self.url = url.rstrip('/')
+        self.model = model
+        self.weight = max(float(weight), 0.01)
+        self.timeout = httpx.Timeout(float(timeout or settings.OLLAMA_TIMEOUT), connect=float(connect_timeout))
+        self.limits = httpx.Limits(
+            max_connections=max_connections or settings.OLLAMA_MAX_CONNECTIONS,
+            max_keepalive_connections=max_keepalive or settings.OLLAMA_MAX_KEEPALIVE,
+        )
+        self.concurrency = concurrency or settings.LLM_CONCURRENCY
+        self.headers = {'Authorization': f'Bearer {api_key}'} if api_key else {}
+        self.health = BackendHealth(name, self.url, self.probe_path, self.headers)
+        self.tools_supported = True
+        self.inflight = 0
+        self.served = 0
+        self._lock = threading.Lock()
+        # One pooled client per event loop: httpx connections belong to the loop that
+        # opened them. Under ASGI that is one client, and one keep-alive pool, per
+        # process. Code on a short-lived loop closes its client with aclose(); sync
+        # callers use client() rather than async_to_sync, which would make a loop per call.
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._client = None
+        self._client_pid = None
+
+    def __repr__(self):
+        return f'<{type(self).__name__} {self.name} {self.url} {self.model}>'
+
+    # ── Clients ───────────────────────────────────────────────────────────────
+
+    def async_client(self):
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = self._async_clients[loop] = httpx.AsyncClient(
+                base_url=self.url, headers=self.headers, timeout=self.timeout, limits=self.limits,
+            )
+        return client
+
+    async def aclose(self):
+        """Close the running loop's client, before a loop of its own ends"""
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    def client(self):
+        # httpx.Client is thread-safe, but its sockets must not be shared across a fork
+        if self._client is None or self._client_pid != os.getpid():
+            self._client = httpx.Client(
+                base_url=self.url, headers=self.headers, timeout=self.timeout, limits=self.limits,
+            )
+            self._client_pid = os.getpid()
+        return self._client
+
+    @contextmanager
+    def _track(self):
+        with self._lock:
+            self.inflight += 1
+            self.served += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.inflight -= 1
+
+    # ── Protocol (per backend type) ───────────────────────────────────────────
+
+    def body(self, messages, stream, tools, options):
+        raise NotImplementedError
+
+    def parse_line(self, line, state):
+        """One line of a streamed response -> Chunk, or None for nothing new"""
+        raise NotImplementedError
+
+    def parse_message(self, data):
+        """Non-streamed response body -> (content, tool_calls)"""
+        raise NotImplementedError
+
+    def _check(self, response, tools):
+        # Ollama answers "... does not support tools", llama.cpp and vLLM name the
+        # tool flags they need; any other 400 is a plain error, not a reason to
+        # stop offering tools to this backend for good
+        if tools and response.status_code == 400 and 'tool' in response.text.lower():
+            self.tools_supported = False
+            raise ToolsUnsupported(self.name)
+        response.raise_for_status()
+
+    # ── Requests ──────────────────────────────────────────────────────────────
+
+    async def astream(self, messages, tools=None, options=None):
+        """Yield Chunks as the answer is generated; the last one has done=True"""
+        with self._track():
+            async with self.async_client().stream(
+                'POST', self.chat_path, json=self.body(messages, True, tools, options or {}),
+            ) as response:
+                if response.status_code >= 400:
+                    await response.aread()
+                self._check(response, tools)
+                state = {}
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    chunk = self.parse_line(line, state)
+                    if chunk is None:
+                        continue
+                    yield chunk
+                    if chunk.done:
+                        break
+
+    async def achat(self, messages, tools=None, options=None):
+        """(content, tool_calls) of a complete answer"""
+        with self._track():
+            response = await self.async_client().post(
+                self.chat_path, json=self.body(messages, False, tools, options or {}),
+            )
+            self._check(response, tools)
+            return self.parse_message(response.json())
+
+    def chat(self, messages, tools=None, options=None):
+        with self._track():
+            response = self.client().post(self.chat_path, json=self.body(messages, False, tools, options or {}))
+            self._check(response, tools)
+            return self.parse_message(response.json())
+
+    def snapshot(self):
+        return {
+            'name': self.name,
+            'type': self.kind,
+            'url': self.url,
+            'model': self.model,
+            'weight': self.weight,
+            'inflight': self.inflight,
+            'served': self.served,
+            'tools': self.tools_supported,
+            **self.health.snapshot(),
+        }
+
+
+class OllamaBackend(LLMBackend):
+    kind = 'ollama'
+    chat_path = '/api/chat'
+    probe_path = '/api/tags'
+
+    def body(self, messages, stream, tools, options):
+        body = {
+            'model': self.model,
+            'messages': messages,
+            'stream': stream,
+            'options': {
+                'temperature': options.get('temperature', 0.7),
+                'top_p': options.get('top_p', 0.9),
+                'num_predict': options.get('max_tokens', 512),
+            },
+        }
+        if tools:
+            body['tools'] = tools
+        return body
+
+    def parse_line(self, line, state):
+        chunk = json.loads(line)
+        if chunk.get('error'):
+            raise BackendError(chunk['error'])
+        message = chunk.get('message', {})
+        return Chunk(message.get('content', ''), message.get('tool_calls') or [], bool(chunk.get('done')))
+
+    def parse_message(self, data):
+        if data.get('error'):
+            raise BackendError(data['error'])
+        message = data.get('message', {})
+        return message.get('content', ''), message.get('tool_calls') or []
+
+
+class OpenAIBackend(LLMBackend):
+    """OpenAI-compatible chat completions (llama.cpp server, vLLM, LM Studio, ...)"""
+    kind = 'openai'
+    chat_path = '/v1/chat/completions'
+    probe_path = '/v1/models'
+
+    def body(self, messages, stream, tools, options):
+        body = {
+            'model': self.model,
+            'messages': self._convert(messages),
+            'stream': stream,
+            'temperature': options.get('temperature', 0.7),
+            'top_p': options.get('top_p', 0.9),
+            'max_tokens': options.get('max_tokens', 512),
+        }
+        if tools:
+            body['tools'] = tools
+        return body
+
+    @staticmethod
+    def _convert(messages):
+        """Ollama-style history -> OpenAI's: tool calls carry ids that tool results refer to"""
+        converted, pending = [], []
+        for message in messages:
+            if message['role'] == 'assistant' and message.get('tool_calls'):
+                calls = []
+                for i, call in enumerate(message['tool_calls']):
+                    function = call.get('function', {})
+                    arguments = function.get('arguments', {})
+                    calls.append({
+                        'id': call.get('id') or f'call_{len(converted)}_{i}',
+                        'type': 'function',
+                        'function': {
+                            'name': function.get('name', ''),
+                            'arguments': arguments if isinstance(arguments, str) else json.dumps(arguments),
+                        },
+                    })
+                pending = [c['id'] for c in calls]
+                converted.append({'role': 'assistant', 'content': message.get('content') or None, 'tool_calls': calls})
+            elif message['role'] == 'tool':
+                converted.append({
+                    'role': 'tool',
+                    'tool_call_id': pending.pop(0) if pending else '',
+                    'content': message['content'],
+                })
+            else:
+                converted.append({'role': message['role'], 'content': message['content']})
+        return converted
+
+    @staticmethod
+    def _calls(raw):
+        calls = []
+        for call in raw:
+            function = call.get('function', {})
+            arguments = function.get('arguments') or '{}'
+            try:
+                arguments = json.loads(arguments) if isinstance(arguments, str) else arguments
+            except ValueError:
+                pass  # handed to the tool as is; it reports the bad arguments back to the model
+            calls.append({'id': call.get('id'), 'function': {'name': function.get('name', ''), 'arguments': arguments}})
+        return calls
+
+    def parse_line(self, line, state):
+        if not line.startswith('data:'):
+            return None
+        data = line[5:].strip()
+        if data == '[DONE]':
+            return Chunk(tool_calls=self._calls(state.pop('calls', {}).values()), done=True)
+        chunk = json.loads(data)
+        if chunk.get('error'):
+            raise BackendError(chunk['error'].get('message', chunk['error']))
+        if not chunk.get('choices'):
+            return None
+        choice = chunk['choices'][0]
+        delta = choice.get('delta') or {}
+        # Tool calls arrive in pieces: the id and name first, then the arguments string in parts
+        calls = state.setdefault('calls', {})
+        for part in delta.get('tool_calls') or []:
+            call = calls.setdefault(part.get('index', 0), {'id': None, 'function': {'name': '', 'arguments': ''}})
+            call['id'] = part.get('id') or call['id']
+            function = part.get('function') or {}
+            call['function']['name'] += function.get('name') or ''
+            call['function']['arguments'] += function.get('arguments') or ''
+        if choice.get('finish_reason'):
+            return Chunk(delta.get('content') or '', self._calls(state.pop('calls', {}).values()), done=True)
+        return Chunk(delta.get('content') or '') if delta.get('content') else None
+
+    def parse_message(self, data):
+        if data.get('error'):
+            raise BackendError(data['error'].get('message', data['error']))
+        message = data['choices'][0]['message']
+        return message.get('content') or '', self._calls(message.get('tool_calls') or [])
+
+
+BACKEND_TYPES = {
+    'ollama': OllamaBackend,
+    'openai': OpenAIBackend,
+}
+
+
+def make_backend(config):
+    options = dict(config)
+    kind = options.pop('type', 'ollama')
+    try:
+        backend_class = BACKEND_TYPES[kind]
+    except KeyError:
+        raise ValueError(f'Unknown LLM backend type: {kind}')
+    options.setdefault('name', f"{kind}:{options.get('url')}")
+    return backend_class(**options)
+
+
+class LLMRouter:
+
+    def __init__(self, backends):
+        if not backends:
+            raise ValueError('At least one LLM backend is required')
+        self.backends = list(backends)
+
+    def available(self):
+        return any(backend.health.available() for backend in self.backends)
+
+    def pick(self, exclude=()):
+        """
+        Backend for the next request: the healthy one with the least load
+        per weight. With none healthy, the first one not excluded (its open
+        circuit makes the request fail fast); None when all are excluded.
+        """
+        candidates = [b for b in self.backends if b not in exclude and b.health.available()]
+        if not candidates:
+            rest = [b for b in self.backends if b not in exclude]
+            return rest[0] if rest else None
+        load = {b: b.inflight / b.weight for b in candidates}
+        least = min(load.values())
+        best = [b for b in candidates if load[b] == least]
+        return random.choices(best, weights=[b.weight for b in best])[0]
+
+    def signature(self):
+        """The models answers may come from, for keys of cached answers"""
+        return ','.join(sorted({backend.model for backend in self.backends}))
+
+    def snapshot(self):
+        return [backend.snapshot() for backend in self.backends]
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = LLMRouter([make_backend(config) for config in settings.LLM_BACKENDS])
+    return _router
+
+
+def set_router(router):
+    """Swap the process' router (load tests); returns the previous one"""
+    global _router
+    with _router_lock:
+        previous, _router = _router, router
+    return previous
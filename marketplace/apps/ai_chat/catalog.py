@@ -0,0 +1,64 @@
+"""
+Catalog summary for the AI system prompt.
+
+The summary (root categories and top-rated products in stock) used to be
+rebuilt from the database for every chat message. It is now built by a
+background task and kept in the cache: product and category saves schedule
+a rebuild (coalesced over AI_CATALOG_CONTEXT_DEBOUNCE seconds, so an import
+triggers one rebuild, not thousands), and a periodic rebuild catches bulk
+writes that send no signals. `version` is a hash of the summary text: it
+changes when the summary does and survives rebuilds that produce the same
+text, so caches keyed on it (cached answers, tool results) live out their
+TTL instead of being dropped every refresh.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from apps.products.models import Category, Product
+
+CACHE_KEY = 'ai_chat:catalog_context'
+DIRTY_KEY = 'ai_chat:catalog_context:dirty'
+
+
+def build_catalog_context():
+    """Get brief catalog context for AI"""
+    categories = Category.objects.filter(is_active=True, parent=None).values_list('name', flat=True)[:20]
+    top_products = Product.objects.filter(is_active=True, stock__gt=0).order_by('-avg_rating')[:10]
+
+    context = f"Доступные категории: {', '.join(categories)}\n\n"
+    context += "Популярные товары:\n"
+    for p in top_products:
+        context += f"- {p.name} | Цена: {p.price}₸ | Рейтинг: {p.avg_rating}\n"
+    return context
+
+
+def refresh_catalog_context():
+    cache.delete(DIRTY_KEY)
+    text = build_catalog_context()
+    snapshot = {
+        'text': text,
+        'version': hashlib.sha256(text.encode()).hexdigest()[:16],
+        'built_at': timezone.now(),
+    }
+    # Outlives the refresh interval so a stalled worker doesn't put the build back on requests
+    cache.set(CACHE_KEY, snapshot, timeout=settings.AI_CATALOG_CONTEXT_REFRESH * 10)
+    return snapshot
+
+
+def get_catalog_snapshot():
+    snapshot = cache.get(CACHE_KEY)
+    if snapshot is None:
+        snapshot = refresh_catalog_context()
+    return snapshot
+
+
+def get_catalog_context():
+    return get_catalog_snapshot()['text']
+
+
+def catalog_version():
+    return get_catalog_snapshot()['version']
+
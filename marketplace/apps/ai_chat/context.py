@@ -0,0 +1,90 @@
+"""
+Conversation context within a token budget.
+
+Instead of a fixed "last 8 messages", the prompt is filled newest-first
+until AI_CONTEXT_TOKEN_BUDGET (system prompt, catalog and product context,
+summary, history and the new message together) is spent. Older turns are
+not simply lost: once the history not yet covered by the session's summary
+grows past AI_SUMMARY_TRIGGER_TOKENS, a background task folds everything
+but the most recent AI_SUMMARY_KEEP_TOKENS into ChatSession.summary, which
+is sent ahead of the recent turns. Constraints stated early on ("бюджет
+50000", "для ребёнка") survive that way at a fraction of the tokens.
+
+Token counts are estimated from the text length; the model's tokenizer is
+not available here, and the budget only needs to be roughly right.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+CHARS_PER_TOKEN = 3  # Cyrillic text tokenizes denser than English (~4)
+MESSAGE_OVERHEAD = 4  # role and separators per message
+SUMMARY_QUEUED_KEY = 'ai_chat:summary_queued:{}'
+
+SUMMARY_PREFIX = 'Краткое содержание предыдущей части разговора:\n'
+
+
+def estimate_tokens(text):
+    return MESSAGE_OVERHEAD + (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def fit_history(messages, budget):
+    """The most recent messages (oldest first) whose estimated tokens fit in budget"""
+    kept = []
+    for message in reversed(messages):
+        budget -= estimate_tokens(message.content)
+        if budget < 0:
+            break
+        kept.append(message)
+    kept.reverse()
+    return kept
+
+
+def summary_message(summary):
+    return {'role': 'system', 'content': SUMMARY_PREFIX + summary}
+
+
+def load_history(session):
+    """Messages not yet covered by the session summary, oldest first (bounded)"""
+    messages = session.messages.order_by('-created_at')
+    if session.summary_until:
+        messages = messages.filter(created_at__gt=session.summary_until)
+    return list(reversed(messages[:settings.AI_CONTEXT_MAX_MESSAGES]))
+
+
+aload_history = sync_to_async(load_history)
+
+
+def queue_summary(session, history):
+    """Schedule a summary update if the unsummarized history has grown too long"""
+    from .tasks import summarize_chat_session
+
+    if sum(estimate_tokens(m.content) for m in history) < settings.AI_SUMMARY_TRIGGER_TOKENS:
+        return
+    # One update at a time per session; the task clears the flag when it is done
+    if cache.add(SUMMARY_QUEUED_KEY.format(session.pk), 1, timeout=600):
+        summarize_chat_session.delay(session_id=session.pk)
+
+
+aqueue_summary = sync_to_async(queue_summary)
+
+
+def update_summary(session):
+    """Fold all but the most recent turns into the session summary"""
+    from .ollama_service import summarize_conversation
+
+    try:
+        messages = session.messages.order_by('created_at')
+        if session.summary_until:
+            messages = messages.filter(created_at__gt=session.summary_until)
+        messages = list(messages)
+        keep = fit_history(messages, settings.AI_SUMMARY_KEEP_TOKENS)
+        older = messages[:len(messages) - len(keep)]
+        if not older:
+            return False
+        session.summary = summarize_conversation(session.summary, older)
+        session.summary_until = older[-1].created_at
+        session.save(update_fields=['summary', 'summary_until'])
+        return True
+    finally:
+        cache.delete(SUMMARY_QUEUED_KEY.format(session.pk))
@@ -0,0 +1,231 @@
+"""
+In-process fake LLM server for offline load tests.
+
+Speaks enough of both protocols in backends.py (Ollama's /api/chat and
+OpenAI's /v1/chat/completions, streamed and not, plus their health
+endpoints) to stand in for a real server. Answers are canned text emitted
+at `rate` tokens per second after `first_token` seconds; at most `parallel`
+answers are generated at once and the rest wait, like a GPU server with a
+fixed number of slots. Nothing is computed, so one process can play a whole
+farm of backends and the chat's own overhead is what gets measured.
+
+    server = FakeLLMServer(rate=30, parallel=2)
+    url = server.start()   # serves from a background thread
+    ...
+    server.stop()
+"""
+import asyncio
+import json
+import threading
+import time
+
+WORDS = (
+    'Могу', 'предложить', 'несколько', 'вариантов', 'из', 'нашего', 'каталога:', 'смартфон',
+    'с', 'хорошей', 'камерой', 'и', 'ёмким', 'аккумулятором,', 'ноутбук', 'для', 'работы',
+    'или', 'наушники', 'с', 'шумоподавлением.', 'Уточните', 'бюджет,', 'и', 'я', 'подберу', 'точнее.',
+)
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}
+
+
+class FakeLLMServer:
+
+    def __init__(self, host='127.0.0.1', port=0, model='fake', rate=50.0, first_token=0.1,
+                 tokens=64, parallel=4):
+        self.host = host
+        self.port = port
+        self.model = model
+        self.rate = float(rate)
+        self.first_token = float(first_token)
+        self.tokens = int(tokens)
+        self.parallel = int(parallel)
+        self.stats = {'requests': 0, 'generating': 0, 'waiting': 0, 'tokens': 0, 'disconnects': 0}
+        self._server = None
+        self._slots = None
+        self._connections = set()
+        self._loop = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f'http://{self.host}:{self.port}'
+
+    # ── Lifecycle ─────────────────────────────────────────────────────────────
+
+    async def serve(self):
+        """Start listening on the running loop; returns the server's URL"""
+        self._slots = asyncio.Semaphore(self.parallel)
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.url
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.serve()
+        await self._server.serve_forever()
+
+    def start(self):
+        """Serve from a background thread with its own event loop; returns the URL"""
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.serve())
+            ready.set()
+            self._loop.run_forever()
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name=f'fake-llm-{self.port}', daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self.url
+
+    async def close(self):
+        self._server.close()
+        # Open connections too, mid-answer ones included, so clients see the server as gone
+        for task in list(self._connections):
+            task.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        await self._server.wait_closed()
+
+    def stop(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.close(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop = None
+
+    # ── HTTP ──────────────────────────────────────────────────────────────────
+
+    async def _handle(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    return
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length') or 0)
+                body = await reader.readexactly(length) if length else b''
+                await self._route(method, path.split('?')[0], body, writer)
+                if headers.get('connection', '').lower() == 'close':
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self.stats['disconnects'] += 1
+        except ValueError:
+            pass  # malformed request line; drop the connection
+        except asyncio.CancelledError:
+            pass  # stop(): the connection is dropped mid-request
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    def _head(self, status, content_type, chunked=False, length=0):
+        lines = [f'HTTP/1.1 {status} {REASONS.get(status, "")}', f'Content-Type: {content_type}']
+        lines.append('Transfer-Encoding: chunked' if chunked else f'Content-Length: {length}')
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode()
+
+    async def _json(self, writer, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode()
+        writer.write(self._head(status, 'application/json', length=len(body)) + body)
+        await writer.drain()
+
+    async def _chunk(self, writer, text):
+        data = text.encode()
+        writer.write(b'%x\r\n%s\r\n' % (len(data), data))
+        await writer.drain()
+
+    async def _route(self, method, path, body, writer):
+        if method == 'GET' and path == '/api/tags':
+            return await self._json(writer, 200, {'models': [{'name': self.model, 'model': self.model}]})
+        if method == 'GET' and path == '/v1/models':
+            return await self._json(writer, 200, {'object': 'list', 'data': [{'id': self.model, 'object': 'model'}]})
+        if path not in ('/api/chat', '/v1/chat/completions'):
+            return await self._json(writer, 404, {'error': 'not found'})
+        if method != 'POST':
+            return await self._json(writer, 405, {'error': 'method not allowed'})
+        try:
+            request = json.loads(body or b'{}')
+        except ValueError:
+            return await self._json(writer, 400, {'error': 'invalid JSON'})
+        self.stats['requests'] += 1
+        if path == '/api/chat':
+            limit = (request.get('options') or {}).get('num_predict')
+            await self._ollama(writer, request.get('stream', True), self._count(limit))
+        else:
+            await self._openai(writer, request.get('stream', False), self._count(request.get('max_tokens')))
+
+    def _count(self, limit):
+        return min(self.tokens, limit) if isinstance(limit, int) and limit > 0 else self.tokens
+
+    # ── Generation ────────────────────────────────────────────────────────────
+
+    async def _generate(self, count):
+        """Yield `count` tokens on the configured schedule, holding a slot"""
+        self.stats['waiting'] += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.stats['waiting'] -= 1
+        self.stats['generating'] += 1
+        try:
+            started = time.monotonic()
+            for i in range(count):
+                # Against the start time, so slow writes don't stretch the answer
+                delay = started + self.first_token + i / self.rate - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                self.stats['tokens'] += 1
+                yield ('' if i == 0 else ' ') + WORDS[i % len(WORDS)]
+        finally:
+            self.stats['generating'] -= 1
+            self._slots.release()
+
+    async def _ollama(self, writer, stream, count):
+        if not stream:
+            text = ''.join([piece async for piece in self._generate(count)])
+            return await self._json(writer, 200, {
+                'model': self.model, 'message': {'role': 'assistant', 'content': text},
+                'done': True, 'done_reason': 'stop', 'eval_count': count,
+            })
+        writer.write(self._head(200, 'application/x-ndjson', chunked=True))
+        async for piece in self._generate(count):
+            await self._chunk(writer, json.dumps({
+                'model': self.model, 'message': {'role': 'assistant', 'content': piece}, 'done': False,
+            }, ensure_ascii=False) + '\n')
+        await self._chunk(writer, json.dumps({
+            'model': self.model, 'message': {'role': 'assistant', 'content': ''},
+            'done': True, 'done_reason': 'stop', 'eval_count': count,
+        }) + '\n')
+        await self._chunk(writer, '')
+
+    async def _openai(self, writer, stream, count):
+        if not stream:
+            text = ''.join([piece async for piece in self._generate(count)])
+            return await self._json(writer, 200, {
+                'id': 'fake', 'object': 'chat.completion', 'model': self.model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}],
+                'usage': {'completion_tokens': count},
+            })
+
+        def event(delta, finish_reason=None):
+            return 'data: ' + json.dumps({
+                'id': 'fake', 'object': 'chat.completion.chunk', 'model': self.model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}],
+            }, ensure_ascii=False) + '\n\n'
+
+        writer.write(self._head(200, 'text/event-stream', chunked=True))
+        async for piece in self._generate(count):
+            await self._chunk(writer, event({'content': piece}))
+        await self._chunk(writer, event({}, 'stop'))
+        await self._chunk(writer, 'data: [DONE]\n\n')
+        await self._chunk(writer, '')
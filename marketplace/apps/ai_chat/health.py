@@ -0,0 +1,109 @@
+"""
+Cached LLM backend health with circuit-breaker semantics.
+
+Page loads and chat requests read the state from memory instead of calling
+the backend. Each backend (backends.py) has its own state, kept up to date
+by a background thread per backend and process that probes the backend's
+health endpoint every OLLAMA_HEALTH_INTERVAL seconds, and by the outcome of
+real chat requests:
+
+- closed: the backend is used normally.
+- open: OLLAMA_HEALTH_FAILURES failures in a row; the router sends requests
+  elsewhere (or they fail fast), and nothing is probed for
+  OLLAMA_HEALTH_COOLDOWN seconds.
+- half_open: the cooldown is over; the next probe or request decides
+  between closed and open again.
+"""
+import logging
+import os
+import threading
+import time
+
+import httpx
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class BackendHealth:
+
+    def __init__(self, name, base_url, probe_path, headers=None):
+        self.name = name
+        self.base_url = base_url
+        self.probe_path = probe_path
+        self.headers = headers or {}
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.checked_at = None
+        self._prober = None
+        self._pid = None
+
+    def available(self):
+        """Whether requests should go to the backend. Never blocks on the network."""
+        self._ensure_prober()
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= settings.OLLAMA_HEALTH_COOLDOWN:
+                self.state = HALF_OPEN
+            return self.state != OPEN
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info('LLM backend %s is reachable again', self.name)
+            self.state = CLOSED
+            self.failures = 0
+            self.checked_at = time.monotonic()
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.checked_at = time.monotonic()
+            if self.state == HALF_OPEN or self.failures >= settings.OLLAMA_HEALTH_FAILURES:
+                if self.state != OPEN:
+                    logger.warning('LLM backend %s unavailable after %s failures, opening the circuit',
+                                   self.name, self.failures)
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def snapshot(self):
+        with self._lock:
+            return {'state': self.state, 'failures': self.failures}
+
+    # ── Prober ────────────────────────────────────────────────────────────────
+
+    def _ensure_prober(self):
+        if self._pid == os.getpid() and self._prober is not None and self._prober.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._prober is not None and self._prober.is_alive():
+                return
+            # Also after a fork: the parent's prober thread didn't come along
+            self._pid = os.getpid()
+            self._prober = threading.Thread(
+                target=self._probe_forever, name=f'llm-health-{self.name}', daemon=True,
+            )
+            self._prober.start()
+
+    def _probe_forever(self):
+        with httpx.Client(base_url=self.base_url, headers=self.headers, timeout=3.0) as client:
+            while True:
+                if self.available():
+                    self.probe(client)
+                time.sleep(settings.OLLAMA_HEALTH_INTERVAL)
+
+    def probe(self, client):
+        try:
+            ok = client.get(self.probe_path).status_code == 200
+        except httpx.HTTPError:
+            ok = False
+        if ok:
+            self.record_success()
+        else:
+            self.record_failure()
+        return ok
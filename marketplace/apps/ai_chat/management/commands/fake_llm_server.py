@@ -0,0 +1,40 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from apps.ai_chat.fake_llm import FakeLLMServer
+
+
+class Command(BaseCommand):
+    help = 'Serve a fake LLM (Ollama and OpenAI-compatible APIs) that emits canned tokens at a fixed rate'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=11435)
+        parser.add_argument('--model', default='fake')
+        parser.add_argument('--rate', type=float, default=50.0, help='Tokens per second per answer')
+        parser.add_argument('--first-token', type=float, default=0.1, help='Seconds before the first token')
+        parser.add_argument('--tokens', type=int, default=64, help='Tokens per answer')
+        parser.add_argument('--parallel', type=int, default=4, help='Answers generated at once; the rest wait')
+
+    def handle(self, *args, **options):
+        server = FakeLLMServer(
+            host=options['host'], port=options['port'], model=options['model'], rate=options['rate'],
+            first_token=options['first_token'], tokens=options['tokens'], parallel=options['parallel'],
+        )
+
+        async def run():
+            url = await server.serve()
+            self.stdout.write(self.style.SUCCESS(
+                f"Fake LLM '{server.model}' on {url}: {server.rate:g} tokens/s, "
+                f"{server.tokens} tokens per answer, {server.parallel} at once"
+            ))
+            self.stdout.write(
+                f'  LLM_BACKENDS=\'[{{"name": "fake", "type": "ollama", "url": "{url}", "model": "{server.model}"}}]\''
+            )
+            await server.serve_forever()
+
+        try:
+            asyncio.run(run())
+        except KeyboardInterrupt:
+            self.stdout.write(f"Stopped after {server.stats['requests']} requests")
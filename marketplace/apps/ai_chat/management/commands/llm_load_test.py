@@ -0,0 +1,135 @@
+import asyncio
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.ai_chat.backends import LLMRouter, make_backend, set_router
+from apps.ai_chat.fake_llm import FakeLLMServer
+from apps.ai_chat.ollama_service import OllamaError, ToolRound, astream_ollama
+from apps.ai_chat.scheduler import Busy, get_scheduler, metrics
+
+PROMPT = [
+    {'role': 'system', 'content': 'Ты — AI-помощник маркетплейса. Отвечай кратко.'},
+    {'role': 'user', 'content': 'Посоветуй смартфон до 150000 тенге с хорошей камерой'},
+]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)] if values else 0.0
+
+
+class Command(BaseCommand):
+    help = ('Stream chat answers concurrently through the LLM router and scheduler and report throughput, '
+            'time to first token and latency. Uses fake in-process backends unless --fake-backends 0')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=50, help='Simulated users sending at once')
+        parser.add_argument('--fake-backends', type=int, default=2,
+                            help='Fake servers to start; 0 sends the load to settings.LLM_BACKENDS')
+        parser.add_argument('--openai', action='store_true', help='Talk to the fake servers over the OpenAI API')
+        parser.add_argument('--rate', type=float, default=50.0, help='Fake tokens per second per answer')
+        parser.add_argument('--first-token', type=float, default=0.1)
+        parser.add_argument('--tokens', type=int, default=64, help='Fake tokens per answer')
+        parser.add_argument('--parallel', type=int, default=4, help='Answers each fake server generates at once')
+        parser.add_argument('--stop-one', type=float, metavar='SECONDS',
+                            help='Stop the first fake server this many seconds in, to exercise failover')
+
+    def handle(self, *args, **options):
+        servers = []
+        if options['fake_backends']:
+            for i in range(options['fake_backends']):
+                server = FakeLLMServer(
+                    rate=options['rate'], first_token=options['first_token'],
+                    tokens=options['tokens'], parallel=options['parallel'],
+                )
+                server.start()
+                servers.append(server)
+            configs = [{
+                'name': f'fake{i}', 'type': 'openai' if options['openai'] else 'ollama',
+                'url': server.url, 'model': server.model, 'concurrency': options['parallel'],
+            } for i, server in enumerate(servers)]
+        elif options['stop_one']:
+            raise CommandError('--stop-one needs fake backends')
+        else:
+            configs = settings.LLM_BACKENDS
+        router = LLMRouter([make_backend(config) for config in configs])
+        previous = set_router(router)
+        try:
+            results, elapsed, scheduler_metrics = asyncio.run(self.run(router, servers, options))
+        finally:
+            set_router(previous)
+            for server in servers:
+                server.stop()
+        self.report(results, elapsed, router, scheduler_metrics)
+
+    async def run(self, router, servers, options):
+        results = []
+        pending = iter(range(options['requests']))
+
+        async def user():
+            for n in pending:
+                results.append(await self.request(router, n))
+
+        async def stop_one():
+            await asyncio.sleep(options['stop_one'])
+            await asyncio.to_thread(servers[0].stop)
+            self.stdout.write(f'  stopped {servers[0].url}')
+
+        started = time.perf_counter()
+        extra = [asyncio.create_task(stop_one())] if options['stop_one'] else []
+        await asyncio.gather(*(user() for _ in range(options['concurrency'])))
+        elapsed = time.perf_counter() - started
+        for task in extra:
+            task.cancel()
+        for backend in router.backends:
+            await backend.aclose()
+        return results, elapsed, metrics()
+
+    async def request(self, router, n):
+        backend = router.pick()
+        scheduler = get_scheduler(backend.name, backend.concurrency)
+        started = time.perf_counter()
+        result = {'outcome': 'ok', 'tokens': 0, 'ttft': None}
+        try:
+            async with scheduler.slot(f'load:{n}'):
+                async for piece in astream_ollama(PROMPT, backend):
+                    if isinstance(piece, ToolRound):
+                        continue
+                    if result['ttft'] is None:
+                        result['ttft'] = time.perf_counter() - started
+                    result['tokens'] += 1
+        except Busy:
+            result['outcome'] = 'shed'
+        except OllamaError:
+            result['outcome'] = 'error'
+        result['latency'] = time.perf_counter() - started
+        return result
+
+    def report(self, results, elapsed, router, scheduler_metrics):
+        ok = [r for r in results if r['outcome'] == 'ok']
+        tokens = sum(r['tokens'] for r in results)
+        ttft = [r['ttft'] for r in ok if r['ttft'] is not None]
+        latency = [r['latency'] for r in ok]
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(results)} requests in {elapsed:.2f}s: {len(ok) / elapsed:.1f} answers/s, {tokens / elapsed:.0f} tokens/s'
+        ))
+        self.stdout.write(
+            f"  ok {len(ok)}, shed {sum(r['outcome'] == 'shed' for r in results)}, "
+            f"errors {sum(r['outcome'] == 'error' for r in results)}"
+        )
+        self.stdout.write(
+            f'  first token p50 {percentile(ttft, 0.5) * 1000:.0f} ms, p95 {percentile(ttft, 0.95) * 1000:.0f} ms; '
+            f'answer p50 {percentile(latency, 0.5):.2f}s, p95 {percentile(latency, 0.95):.2f}s'
+        )
+        for backend in router.snapshot():
+            self.stdout.write(f"  {backend['name']} ({backend['type']}, {backend['url']}): "
+                              f"{backend['served']} requests, circuit {backend['state']}")
+        for scheduler in scheduler_metrics['backends']:
+            self.stdout.write(
+                f"  scheduler {scheduler['backend']}: admitted {scheduler['admitted']}, shed {scheduler['shed']}, "
+                f"timed out {scheduler['timed_out']}, queue wait p50 {scheduler['wait_p50']}s, "
+                f"p95 {scheduler['wait_p95']}s"
+            )
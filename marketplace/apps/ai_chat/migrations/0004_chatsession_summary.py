@@ -0,0 +1,28 @@
+# Generated by Django 5.2.11 on 2026-10-19 09:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_chat', '0003_initial'),
+        ('products', '0003_trigram_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatsession',
+            name='summary',
+            field=models.TextField(blank=True, verbose_name='Краткое содержание'),
+        ),
+        migrations.AddField(
+            model_name='chatsession',
+            name='summary_until',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Содержание до'),
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['session', 'created_at'], name='ai_chat_cha_session_ff1289_idx'),
+        ),
+    ]
@@ -9,6 +9,9 @@ class ChatSession(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
+    # Rolling summary of the turns up to summary_until (see context.py)
+    summary = models.TextField(blank=True, verbose_name='Краткое содержание')
+    summary_until = models.DateTimeField(null=True, blank=True, verbose_name='Содержание до')
 
     class Meta:
         ordering = ['-updated_at']
@@ -23,6 +26,10 @@ class ChatSession(models.Model):
         messages = self.messages.order_by('-created_at')[:limit]
         return list(reversed(messages))
 
+    async def aget_context(self, limit=10):
+        messages = [m async for m in self.messages.order_by('-created_at')[:limit]]
+        return list(reversed(messages))
+
 
 class ChatMessage(models.Model):
     class Role(models.TextChoices):
@@ -43,6 +50,7 @@ class ChatMessage(models.Model):
     class Meta:
         ordering = ['created_at']
         verbose_name = 'Сообщение чата'
+        indexes = [models.Index(fields=['session', 'created_at'])]
 
     def __str__(self):
         return f"{self.role}: {self.content[:50]}"
\ No newline at end of file
@@ -1,13 +1,18 @@
 import httpx
-import json
 import logging
+import time
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from apps.products.models import Product, Category
+from . import response_cache, tools
+from .backends import BackendError, ToolsUnsupported, get_router
+from .catalog import get_catalog_context
+from .context import estimate_tokens, fit_history, summary_message
+from .retrieval import retrieve
+from .scheduler import get_scheduler
 
 logger = logging.getLogger(__name__)
 
-OLLAMA_BASE_URL = 'http://localhost:11434'
-OLLAMA_MODEL = "gpt-oss:120b-cloud"
+GENERATION_OPTIONS = {"temperature": 0.7, "top_p": 0.9, "max_tokens": 512}
 
 SYSTEM_PROMPT = """Ты — дружелюбный AI-помощник маркетплейса. Твоя задача — помогать покупателям найти нужные товары, отвечать на вопросы об ассортименте, ценах и категориях.
 
@@ -21,33 +26,26 @@ SYSTEM_PROMPT = """Ты — дружелюбный AI-помощник марк
 
 Ты имеешь доступ к информации о товарах магазина и можешь помочь найти нужные позиции."""
 
+TOOLS_HINT = """Если товаров ниже не хватает для ответа или покупатель уточняет запрос (цена, бренд, категория, наличие),
+вызови search_products с нужными фильтрами; для характеристик — get_product, для сравнения — compare.
+Называй только товары из каталога и результатов инструментов."""
 
-def get_catalog_context():
-    """Get brief catalog context for AI"""
-    categories = Category.objects.filter(is_active=True, parent=None).values_list('name', flat=True)[:20]
-    top_products = Product.objects.filter(is_active=True, stock__gt=0).order_by('-avg_rating')[:10]
 
-    context = f"Доступные категории: {', '.join(categories)}\n\n"
-    context += "Популярные товары:\n"
-    for p in top_products:
-        context += f"- {p.name} | Цена: {p.price}₸ | Рейтинг: {p.avg_rating}\n"
-    return context
+def search_products_for_context(query: str, limit: int = 5) -> list:
+    """Search products relevant to query (ranked, see retrieval.py)"""
+    return retrieve(query, k=limit)
 
 
-def search_products_for_context(query: str, limit: int = 5) -> list:
-    """Search products relevant to query"""
-    from django.db.models import Q
-    products = Product.objects.filter(
-        Q(name__icontains=query) | Q(description__icontains=query) | Q(category__name__icontains=query),
-        is_active=True
-    ).order_by('-avg_rating')[:limit]
-    return list(products)
+class OllamaError(Exception):
+    """Ollama failed; the message is what the user gets instead of an answer"""
 
 
-def chat_with_ollama(messages: list, user_message: str, search_products: bool = True) -> tuple[str, list]:
+def build_messages(messages: list, user_message: str, search_products: bool = True,
+                   summary: str = '') -> tuple[list, list]:
     """
-    Send message to Ollama and get response.
-    Returns (response_text, mentioned_products)
+    Build the Ollama message list for a user message.
+    History is cut to the newest messages that fit the token budget (see context.py).
+    Returns (ollama_messages, relevant_products)
     """
     # Search for relevant products
     relevant_products = []
@@ -63,13 +61,18 @@ def chat_with_ollama(messages: list, user_message: str, search_products: bool =
                     f"{'В наличии' if p.in_stock else 'Нет в наличии'}\n"
                 )
 
-    # Build messages for Ollama
+    system_prompt = SYSTEM_PROMPT
+    if settings.AI_TOOLS_ENABLED:
+        system_prompt += "\n\n" + TOOLS_HINT
     ollama_messages = [
-        {"role": "system", "content": SYSTEM_PROMPT + "\n\n" + get_catalog_context() + product_context}
+        {"role": "system", "content": system_prompt + "\n\n" + get_catalog_context() + product_context}
     ]
+    if summary:
+        ollama_messages.append(summary_message(summary))
 
     # Add conversation history
-    for msg in messages[-8:]:  # Last 8 messages for context
+    budget = settings.AI_CONTEXT_TOKEN_BUDGET - sum(estimate_tokens(m["content"]) for m in ollama_messages)
+    for msg in fit_history(messages, budget - estimate_tokens(user_message)):
         ollama_messages.append({
             "role": msg.role,
             "content": msg.content,
@@ -77,50 +80,328 @@ def chat_with_ollama(messages: list, user_message: str, search_products: bool =
 
     # Add current message
     ollama_messages.append({"role": "user", "content": user_message})
+    return ollama_messages, relevant_products
 
-    try:
-        response = httpx.post(
-            f"{OLLAMA_BASE_URL}/api/chat",
-            json={
-                "model": OLLAMA_MODEL,
-                "messages": ollama_messages,
-                "stream": False,
-                "options": {
-                    "temperature": 0.7,
-                    "top_p": 0.9,
-                    "num_predict": 512,
-                }
-            },
-            timeout=60.0,
-        )
-        response.raise_for_status()
-        data = response.json()
-        reply = data.get('message', {}).get('content', 'Извините, не могу ответить прямо сейчас.')
-        return reply, relevant_products
-    except httpx.ConnectError:
-        logger.error("Cannot connect to Ollama. Is it running?")
-        return "Извините, AI-ассистент недоступен. Убедитесь, что Ollama запущена (`ollama serve`).", []
-    except httpx.HTTPStatusError as e:
-        if e.response.status_code == 502:
-            logger.error(f"Ollama 502: model '{OLLAMA_MODEL}' not loaded.")
+
+async def abuild_messages(messages: list, user_message: str, search_products: bool = True,
+                          summary: str = '') -> tuple[list, list]:
+    # Stock and image properties query lazily, so the prompt is built in one hop to the sync thread
+    return await sync_to_async(build_messages)(messages, user_message, search_products, summary)
+
+
+# ── Tool calling ──────────────────────────────────────────────────────────────
+# The model may answer with tool calls instead of text (see tools.py). They
+# are executed and their results appended, and the model is asked again, for
+# at most AI_TOOL_MAX_ROUNDS rounds; the last round offers no tools, so it
+# has to answer from what it has. Backends whose model rejected the tools
+# field (400) are asked without tools from then on.
+
+def _offered_tools(backend, round_: int):
+    if not settings.AI_TOOLS_ENABLED or not backend.tools_supported:
+        return None
+    if round_ >= settings.AI_TOOL_MAX_ROUNDS:
+        return None
+    return tools.TOOLS
+
+
+class ToolRound:
+    """Yielded by astream_ollama between text pieces when the model used the catalog tools"""
+
+    def __init__(self, names: list, products: list):
+        self.names = names
+        self.products = products
+
+
+def _log_round(backend, round_: int, started: float, calls: list) -> None:
+    logger.info(
+        "LLM %s round %s took %.0f ms%s", backend.name, round_ + 1, (time.perf_counter() - started) * 1000,
+        f", tools: {', '.join(c.get('function', {}).get('name', '?') for c in calls)}" if calls else "",
+    )
+
+
+def _tools_rejected(backend) -> None:
+    logger.warning("Model '%s' on %s does not accept tools, answering without them", backend.model, backend.name)
+
+
+# ── Errors and failover ───────────────────────────────────────────────────────
+# A request that fails on the transport or with a 5xx before any text reached
+# the user is retried on another healthy backend; each failure also counts
+# against the failed backend's circuit (health.py).
+
+UNAVAILABLE_REPLY = "Извините, AI-ассистент недоступен. Убедитесь, что Ollama запущена (`ollama serve`)."
+
+
+def _retryable(exc: Exception) -> bool:
+    return isinstance(exc, httpx.TransportError) or (
+        isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code >= 500
+    )
+
+
+def _failed(exc: Exception, backend) -> str:
+    """Feed the failure to the backend's circuit breaker; returns the user-facing message"""
+    if _retryable(exc):
+        backend.health.record_failure()
+    return _error_reply(exc, backend)
+
+
+def _error_reply(exc: Exception, backend) -> str:
+    if isinstance(exc, BackendError):
+        return f"Ошибка AI: {str(exc)[:100]}"
+    if isinstance(exc, httpx.ConnectError):
+        logger.error("Cannot connect to LLM backend %s (%s). Is it running?", backend.name, backend.url)
+        return UNAVAILABLE_REPLY
+    if isinstance(exc, httpx.HTTPStatusError):
+        if exc.response.status_code == 502:
+            logger.error(f"{backend.name} 502: model '{backend.model}' not loaded.")
             return (
-                f"Модель '{OLLAMA_MODEL}' не загружена. "
-                f"Выполните в терминале: ollama pull {OLLAMA_MODEL}",
-                []
+                f"Модель '{backend.model}' не загружена. "
+                f"Выполните в терминале: ollama pull {backend.model}"
             )
-        logger.exception(f"Ollama HTTP error: {e}")
-        return f"Ошибка сервера AI: {e.response.status_code}", []
-    except httpx.TimeoutException:
-        return "Время ожидания истекло. Модель может быть ещё загружается.", []
+        logger.exception(f"{backend.name} HTTP error: {exc}")
+        return f"Ошибка сервера AI: {exc.response.status_code}"
+    if isinstance(exc, httpx.TimeoutException):
+        return "Время ожидания истекло. Модель может быть ещё загружается."
+    logger.exception(f"{backend.name} error: {exc}")
+    return f"Произошла ошибка: {str(exc)[:100]}"
+
+
+def _failover(exc: Exception, backend, tried: list, queue_key=None, slots=None):
+    """
+    Another healthy backend to retry on after exc, or None (then report it with _failed).
+    With queue_key (the async views, which hold a slot on the first backend's
+    scheduler) the request also needs a free slot on the other backend's, so
+    it can't run there past that backend's concurrency; the slot taken is
+    added to `slots` for the caller to release.
+    """
+    if not _retryable(exc):
+        return None
+    other = get_router().pick(exclude=[*tried, backend])
+    if other is None or not other.health.available():
+        return None
+    if queue_key is not None:
+        scheduler = get_scheduler(other.name, other.concurrency)
+        ticket = scheduler.try_acquire(queue_key)
+        if ticket is None:
+            logger.warning("LLM backend %s failed, and %s has no free slot to take over", backend.name, other.name)
+            return None
+        slots.append((scheduler, ticket))
+    tried.append(backend)
+    backend.health.record_failure()
+    logger.warning("LLM backend %s failed (%s), retrying on %s", backend.name, type(exc).__name__, other.name)
+    return other
+
+
+def _release(slots):
+    for scheduler, ticket in slots:
+        scheduler.release(ticket)
+
+
+async def astream_ollama(ollama_messages: list, backend=None, queue_key=None):
+    """
+    Yield the reply piece by piece as the backend generates it, and a
+    ToolRound after each round of catalog tool calls.
+    backend defaults to the router's pick; if it fails before the first
+    piece of text, another backend gets the request (see _failover for
+    queue_key).
+    Raises OllamaError, carrying the user-facing message, if the request
+    fails before or during generation. Closing or cancelling the generator
+    closes the upstream request, which stops generation.
+    """
+    backend = backend or get_router().pick()
+    if not backend.health.available():
+        raise OllamaError(UNAVAILABLE_REPLY)
+    conversation = list(ollama_messages)
+    round_ = 0
+    tried, slots = [], []
+    streamed = False
+    try:
+        while True:
+            try:
+                while True:
+                    offered = _offered_tools(backend, round_)
+                    started = time.perf_counter()
+                    pieces, calls = [], []
+                    try:
+                        async for chunk in backend.astream(conversation, offered, GENERATION_OPTIONS):
+                            calls.extend(chunk.tool_calls)
+                            if chunk.text:
+                                pieces.append(chunk.text)
+                                streamed = True
+                                yield chunk.text
+                    except ToolsUnsupported:
+                        _tools_rejected(backend)
+                        continue
+                    _log_round(backend, round_, started, calls)
+                    if not calls or not offered:
+                        break
+                    conversation.append({"role": "assistant", "content": "".join(pieces), "tool_calls": calls})
+                    results, products = await tools.arun_tools(calls)
+                    conversation.extend(results)
+                    yield ToolRound([c.get('function', {}).get('name') for c in calls], products)
+                    round_ += 1
+                backend.health.record_success()
+                return
+            except Exception as e:
+                other = None if streamed else _failover(e, backend, tried, queue_key, slots)
+                if other is None:
+                    raise OllamaError(_failed(e, backend)) from e
+                backend = other
+    finally:
+        _release(slots)
+
+
+def merge_products(products: list, found: list) -> list:
+    """Products the answer is about: the ones from tool calls first, then the initial ones"""
+    merged = {}
+    for product in [*found, *products]:
+        merged.setdefault(product.pk, product)
+    return list(merged.values())[:settings.AI_TOOL_MAX_PRODUCTS]
+
+
+async def _agenerate(backend, ollama_messages: list) -> tuple[str, list]:
+    """Complete answer from one backend, running tool rounds; returns (reply, products from tools)"""
+    round_ = 0
+    found = []
+    while True:
+        offered = _offered_tools(backend, round_)
+        started = time.perf_counter()
+        try:
+            content, calls = await backend.achat(ollama_messages, offered, GENERATION_OPTIONS)
+        except ToolsUnsupported:
+            _tools_rejected(backend)
+            continue
+        _log_round(backend, round_, started, calls)
+        if not calls or not offered:
+            return content, found
+        ollama_messages.append({"role": "assistant", "content": content, "tool_calls": calls})
+        results, products = await tools.arun_tools(calls)
+        ollama_messages.extend(results)
+        found = merge_products(found, products)
+        round_ += 1
+
+
+async def achat_with_ollama(messages: list, user_message: str, search_products: bool = True,
+                            use_cache: bool = True, summary: str = '', backend=None,
+                            queue_key=None) -> tuple[str, list]:
+    """
+    Send message to the LLM and get response.
+    Returns (response_text, mentioned_products)
+    Opening questions are answered from the response cache when possible;
+    a backend failing on the transport or with a 5xx is replaced by another
+    (see _failover for queue_key).
+    """
+    if use_cache and search_products and not summary:
+        cached = await response_cache.alookup(messages, user_message)
+        if cached is not None:
+            return cached.text, cached.products
+    backend = backend or get_router().pick()
+    if not backend.health.available():
+        return UNAVAILABLE_REPLY, []
+    ollama_messages, relevant_products = await abuild_messages(messages, user_message, search_products, summary)
+    tried, slots = [], []
+    try:
+        while True:
+            try:
+                reply, found = await _agenerate(backend, list(ollama_messages))
+                backend.health.record_success()
+                break
+            except Exception as e:
+                other = _failover(e, backend, tried, queue_key, slots)
+                if other is None:
+                    return _failed(e, backend), []
+                backend = other
+    finally:
+        _release(slots)
+    reply = reply or 'Извините, не могу ответить прямо сейчас.'
+    relevant_products = merge_products(relevant_products, found)
+    if search_products and not summary:
+        await response_cache.astore(messages, user_message, reply, relevant_products)
+    return reply, relevant_products
+
+
+def _generate(backend, ollama_messages: list) -> tuple[str, list]:
+    """Sync _agenerate, over the backend's pooled httpx.Client"""
+    round_ = 0
+    found = []
+    while True:
+        offered = _offered_tools(backend, round_)
+        started = time.perf_counter()
+        try:
+            content, calls = backend.chat(ollama_messages, offered, GENERATION_OPTIONS)
+        except ToolsUnsupported:
+            _tools_rejected(backend)
+            continue
+        _log_round(backend, round_, started, calls)
+        if not calls or not offered:
+            return content, found
+        ollama_messages.append({"role": "assistant", "content": content, "tool_calls": calls})
+        results, products = tools.run_tools(calls)
+        ollama_messages.extend(results)
+        found = merge_products(found, products)
+        round_ += 1
+
+
+def chat_with_ollama(messages: list, user_message: str, search_products: bool = True,
+                     use_cache: bool = True, summary: str = '', backend=None) -> tuple[str, list]:
+    """Sync achat_with_ollama, for code outside the async views"""
+    if use_cache and search_products and not summary:
+        cached = response_cache.lookup(messages, user_message)
+        if cached is not None:
+            return cached.text, cached.products
+    backend = backend or get_router().pick()
+    if not backend.health.available():
+        return UNAVAILABLE_REPLY, []
+    ollama_messages, relevant_products = build_messages(messages, user_message, search_products, summary)
+    tried = []
+    while True:
+        try:
+            reply, found = _generate(backend, list(ollama_messages))
+            backend.health.record_success()
+            break
+        except Exception as e:
+            other = _failover(e, backend, tried)
+            if other is None:
+                return _failed(e, backend), []
+            backend = other
+    reply = reply or 'Извините, не могу ответить прямо сейчас.'
+    relevant_products = merge_products(relevant_products, found)
+    if search_products and not summary:
+        response_cache.store(messages, user_message, reply, relevant_products)
+    return reply, relevant_products
+
+
+SUMMARY_PROMPT = """Сожми разговор покупателя с AI-помощником маркетплейса в краткое содержание (не больше 120 слов).
+Сохрани то, что важно для дальнейших ответов: что ищет покупатель, бюджет, требования и предпочтения,
+названия и цены обсуждавшихся товаров, принятые решения. Пиши фактами, без вступлений."""
+
+
+def summarize_conversation(summary: str, messages: list) -> str:
+    """
+    New rolling summary: the previous one plus the given older messages.
+    Raises OllamaError if no backend is available or the request fails.
+    """
+    backend = get_router().pick()
+    if not backend.health.available():
+        raise OllamaError(UNAVAILABLE_REPLY)
+    transcript = "\n".join(
+        f"{'Покупатель' if m.role == 'user' else 'Помощник'}: {m.content}" for m in messages
+    )
+    if summary:
+        transcript = f"Содержание раньше:\n{summary}\n\nДальше:\n{transcript}"
+    try:
+        text, _ = backend.chat([
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": transcript},
+        ], options={"temperature": 0.2, "top_p": 0.9, "max_tokens": settings.AI_SUMMARY_MAX_TOKENS})
+        backend.health.record_success()
     except Exception as e:
-        logger.exception(f"Ollama error: {e}")
-        return f"Произошла ошибка: {str(e)[:100]}", []
+        raise OllamaError(_failed(e, backend)) from e
+    text = text.strip()
+    if not text:
+        raise OllamaError("Пустое краткое содержание")
+    return text
 
 
 def is_ollama_available() -> bool:
-    """Check if Ollama is available"""
-    try:
-        response = httpx.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=3.0)
-        return response.status_code == 200
-    except Exception:
-        return False
\ No newline at end of file
+    """Whether any LLM backend is available (cached state, no request is made)"""
+    return get_router().available()
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.products.models import Category, Product
+from .catalog import DIRTY_KEY
+from .tasks import refresh_ai_catalog_context
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def queue_catalog_context_refresh(sender, **kwargs):
+    # One rebuild per burst of changes; the rebuild clears the flag when it starts
+    debounce = settings.AI_CATALOG_CONTEXT_DEBOUNCE
+    if cache.add(DIRTY_KEY, 1, timeout=debounce * 2):
+        refresh_ai_catalog_context.delay(countdown=debounce)
@@ -0,0 +1,158 @@
+"""
+Cached answers to opening chat questions.
+
+The suggestion chips make thousands of users send the same first message,
+and each would cost a full generation. Answers to messages without history
+are kept in the cache for AI_RESPONSE_CACHE_TTL seconds, keyed on the
+normalized message (case, punctuation and spacing don't matter), the
+configured models and the catalog snapshot version (catalog.py, a hash of
+the summary text): a changed catalog summary means new keys, so answers
+about the old catalog are never served again and simply expire, while
+periodic rebuilds of an unchanged catalog keep the cache.
+
+With AI_RESPONSE_CACHE_SIMILARITY set, a miss is also compared by
+embedding (apps.products.vectors) against the questions answered under the
+current snapshot, and a close enough one ("лучшие ноутбуки для работы?" vs
+"лучший ноутбук для работы") is answered from the cache too. Numbers must
+match exactly, so "до 30000" never gets the answer for "до 50000". The
+comparison only uses an embedding that is already cached (the first ask
+starts it in the background), so a lookup never waits on the embedder.
+
+Only the text and product ids are stored; products are re-read on a hit so
+prices and stock are current.
+"""
+import hashlib
+import re
+from dataclasses import dataclass
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.products.models import Product, attach_reserved_stock
+from apps.products.vectors import embed_query
+
+from .catalog import catalog_version
+from .retrieval import normalize
+
+KEY_PREFIX = 'ai_chat:reply'
+_WORD_RE = re.compile(r'\w+')
+_NUMBER_RE = re.compile(r'\d+')
+
+stats = {'hits': 0, 'near_hits': 0, 'misses': 0, 'stores': 0}
+
+
+@dataclass
+class CachedReply:
+    text: str
+    products: list
+    near: bool = False
+
+
+def normalize_prompt(text):
+    return ' '.join(_WORD_RE.findall(normalize(text)))
+
+
+def _scope():
+    from .backends import get_router
+
+    return f'{get_router().signature()}:{catalog_version()}'
+
+
+def _key(scope, prompt):
+    digest = hashlib.sha256(prompt.encode()).hexdigest()[:32]
+    return f'{KEY_PREFIX}:{scope}:{digest}'
+
+
+def _index_key(scope):
+    return f'{KEY_PREFIX}:{scope}:questions'
+
+
+def _products(ids):
+    by_id = Product.objects.filter(pk__in=ids, is_active=True).select_related('category', 'brand').in_bulk()
+    products = [by_id[pk] for pk in ids if pk in by_id]
+    attach_reserved_stock(products)
+    return products
+
+
+def _nearest(scope, prompt):
+    """Cache key of a question answered under this snapshot that means the same as prompt"""
+    questions = cache.get(_index_key(scope))
+    if not questions:
+        return None
+    vector = embed_query(prompt)
+    if vector is None or len(vector) != questions['vectors'].shape[1]:
+        return None
+    scores = questions['vectors'] @ vector
+    numbers = _NUMBER_RE.findall(prompt)
+    for i in np.argsort(-scores):
+        if scores[i] < settings.AI_RESPONSE_CACHE_SIMILARITY:
+            break
+        if _NUMBER_RE.findall(questions['prompts'][i]) == numbers:
+            return questions['keys'][i]
+    return None
+
+
+def lookup(history, user_message):
+    """CachedReply for an opening message, or None"""
+    if history:
+        return None
+    prompt = normalize_prompt(user_message)
+    if not prompt:
+        return None
+    scope = _scope()
+    near = False
+    entry = cache.get(_key(scope, prompt))
+    if entry is None and settings.AI_RESPONSE_CACHE_SIMILARITY:
+        key = _nearest(scope, prompt)
+        entry = cache.get(key) if key else None
+        near = entry is not None
+    if entry is None:
+        stats['misses'] += 1
+        return None
+    stats['near_hits' if near else 'hits'] += 1
+    return CachedReply(entry['text'], _products(entry['product_ids']), near=near)
+
+
+def store(history, user_message, reply, products):
+    """Keep a complete answer to an opening message"""
+    if history or not reply.strip():
+        return
+    prompt = normalize_prompt(user_message)
+    if not prompt:
+        return
+    scope = _scope()
+    key = _key(scope, prompt)
+    ttl = settings.AI_RESPONSE_CACHE_TTL
+    cache.set(key, {'text': reply, 'product_ids': [p.pk for p in products]}, ttl)
+    stats['stores'] += 1
+    if not settings.AI_RESPONSE_CACHE_SIMILARITY:
+        return
+    vector = embed_query(prompt)
+    if vector is None:
+        return
+    # Read-modify-write without a lock: a concurrent store may drop an entry, which only costs a miss
+    questions = cache.get(_index_key(scope)) or {
+        'vectors': np.zeros((0, len(vector)), dtype=np.float32), 'keys': [], 'prompts': [],
+    }
+    if key in questions['keys'] or questions['vectors'].shape[1] != len(vector):
+        return
+    limit = settings.AI_RESPONSE_CACHE_QUESTIONS
+    questions = {
+        'vectors': np.vstack([questions['vectors'], vector[None, :]])[-limit:],
+        'keys': (questions['keys'] + [key])[-limit:],
+        'prompts': (questions['prompts'] + [prompt])[-limit:],
+    }
+    cache.set(_index_key(scope), questions, ttl)
+
+
+alookup = sync_to_async(lookup)
+astore = sync_to_async(store)
+
+
+def replay(text, words=4):
+    """A cached answer in pieces of a few words, for the token stream"""
+    pieces = re.findall(r'\s*\S+', text)
+    for start in range(0, len(pieces), words):
+        yield ''.join(pieces[start:start + words])
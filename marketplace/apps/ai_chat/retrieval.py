@@ -0,0 +1,536 @@
+"""
+Product retrieval for grounding chat answers.
+
+A chat message is a sentence, not a product name ("найди смартфон до
+30000₸"), so it is parsed first: price caps and floors, "in stock", and
+mentions of a known category or brand become filters, and the remaining
+words are stemmed into query terms. Terms are ranked with BM25 over an
+in-memory inverted index of active products (name, brand and category
+weigh more than the description), so a lookup touches only the postings of
+the query terms instead of scanning the products table.
+
+Each process builds the index in a background thread on first use (chat
+falls back to a plain database lookup until it is ready) and keeps it
+fresh from that thread: every AI_RETRIEVAL_REFRESH seconds it re-reads
+products updated since the last pass, and it rebuilds from scratch when
+rows disappeared or AI_RETRIEVAL_REBUILD seconds have passed (category
+and brand renames).
+Stock changes made by orders don't touch updated_at, so "in stock" is
+re-checked against the database for the returned products.
+
+Nearest products by embedding (apps.products.vectors) are filtered the
+same way and merged with the BM25 ranking by reciprocal rank fusion.
+"""
+import heapq
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+
+from apps.products.models import Brand, Category, Product, attach_reserved_stock
+from apps.products.vectors import semantic_search
+
+logger = logging.getLogger(__name__)
+
+K1 = 1.2
+B = 0.75
+FIELD_WEIGHTS = {'name': 3.0, 'brand': 2.0, 'category': 2.0, 'short_description': 1.0, 'description': 1.0}
+DESCRIPTION_CHARS = 1000     # longer descriptions add noise, not recall
+MIN_RELATIVE_SCORE = 0.25    # drop matches scoring under this share of the best one
+RATING_BOOST = 0.05          # per rating point, breaks ties between similar matches
+STOCK_BOOST = 0.1           # available products first among similar matches
+MIN_PRICE = 100              # smaller numbers after "до"/"от" are quantities or years, not prices
+BUILD_CHUNK = 2000
+COMMON_TERM_SHARE = 0.1      # terms in more of the catalog than this don't widen the candidates
+RRF_K = 60                   # rank fusion damping; higher flattens the gap between ranks
+SEMANTIC_CANDIDATES = 20     # embedding hits considered before filters
+
+# ── Text ──────────────────────────────────────────────────────────────────────
+
+_WORD_RE = re.compile(r'\w+')
+_SUFFIXES = sorted((
+    # Russian noun and adjective endings, longest first
+    'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'иях',
+    'ов', 'ев', 'ей', 'ий', 'ый', 'ой', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие',
+    'ом', 'ем', 'ах', 'ях', 'ам', 'ям', 'ую', 'юю',
+    'а', 'я', 'ы', 'и', 'е', 'у', 'ю', 'о', 'ь',
+    # English plurals
+    'es', 's',
+), key=len, reverse=True)
+MIN_STEM = 4
+
+STOPWORDS = frozenset('''
+    и или в во на с со по к ко у о об из за для до от не ни но а же ли бы мне меня мой
+    я ты вы мы он она они это этот эта эти что чтобы как какой какая какое какие где
+    есть нужен нужна нужно нужны надо хочу хотел хотела купить найти найди найдите
+    покажи покажите подбери подберите посоветуй посоветуйте порекомендуй ищу подскажи
+    подскажите пожалуйста можно будет был была были очень самый самая самые
+    цена цене цены стоимость рублей тенге теңге тг руб
+    маған керек табу тап көрсет қандай үшін және немесе бар ма ме
+    a an the and or for of to in on with find show me i want need buy some any please
+    what which is are under below over above from price cheap
+'''.split())
+
+
+def stem(word):
+    if word.isdigit() or len(word) <= MIN_STEM:
+        return word
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM:
+            return word[:-len(suffix)]
+    return word
+
+
+def normalize(text):
+    return text.lower().replace('ё', 'е').replace('\xa0', ' ')
+
+
+def terms(text, keep_stopwords=False):
+    return [
+        stem(word) for word in _WORD_RE.findall(normalize(text))
+        if keep_stopwords or word not in STOPWORDS
+    ]
+
+
+# ── Query parsing ─────────────────────────────────────────────────────────────
+
+_NUMBER = r'(\d[\d ]{0,12}\d|\d)(?:[.,]\d+)?\s*(к|k|тыс\.?|тысяч\w*|млн)?\s*(₸|тг|тенге|теңге|kzt|tg)?'
+_CAP_RE = re.compile(
+    r'(?<!\w)(?:не дороже|дешевле|меньше|ниже|максимум|макс\.?|до|under|below|less than|up to|cheaper than|max|<=?|≤)\s*'
+    + _NUMBER
+)
+_CAP_KK_RE = re.compile(_NUMBER + r'\s*(?:-?\w{1,3})?\s+дейін')  # "30000-ға дейін"
+_FLOOR_RE = re.compile(
+    r'(?<!\w)(?:не дешевле|дороже|больше|выше|минимум|мин\.?|от|over|above|more than|from|min|>=?|≥)\s*' + _NUMBER
+)
+_IN_STOCK_RE = re.compile(r'в\s+наличии|есть\s+в\s+наличии|наличие|in stock|available|қолда бар|қоймада бар')
+_SKU_RE = re.compile(r'^\w+(?:[-./_]\w+)+[.,;:!?)]*$')
+_MULTIPLIERS = {'к': 1000, 'k': 1000, 'тыс': 1000, 'тыс.': 1000, 'млн': 1_000_000}
+
+
+def _amount(digits, unit, currency):
+    value = Decimal(digits.replace(' ', ''))
+    if unit:
+        value *= _MULTIPLIERS.get(unit, 1000)  # тысяч, тысячи ...
+    elif value < MIN_PRICE and not currency:
+        return None
+    return value
+
+
+@dataclass
+class ParsedQuery:
+    text: str
+    terms: list = field(default_factory=list)
+    max_price: Decimal = None
+    min_price: Decimal = None
+    in_stock: bool = False
+    category_ids: frozenset = frozenset()
+    brand_ids: frozenset = frozenset()
+
+
+def parse_query(text, index=None):
+    """Split a chat message into filters and ranked terms"""
+    rest = normalize(text)
+    query = ParsedQuery(text=text)
+
+    for regex, attr in ((_CAP_RE, 'max_price'), (_CAP_KK_RE, 'max_price'), (_FLOOR_RE, 'min_price')):
+        for match in regex.finditer(rest):
+            value = _amount(*match.group(1, 2, 3))
+            if value is not None:
+                setattr(query, attr, value)
+                rest = rest.replace(match.group(0), ' ')
+    if query.max_price and query.min_price and query.min_price > query.max_price:
+        query.min_price, query.max_price = query.max_price, query.min_price
+
+    if _IN_STOCK_RE.search(rest):
+        query.in_stock = True
+        rest = _IN_STOCK_RE.sub(' ', rest)
+
+    query.terms = terms(rest)
+    # Article numbers ("AB-123/4") are indexed whole
+    query.terms += [word.strip('.,;:!?()"\'') for word in rest.split() if _SKU_RE.match(word)]
+    if index is not None:
+        stems = set(query.terms)
+        query.category_ids = index.match_categories(stems)
+        query.brand_ids = index.match_brands(stems)
+    return query
+
+
+# ── Index ─────────────────────────────────────────────────────────────────────
+
+class _Doc:
+    __slots__ = ('pk', 'sku', 'price', 'stock', 'rating', 'category_id', 'brand_id', 'length', 'terms')
+
+
+class ProductIndex:
+    """BM25 inverted index over active products"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.postings = defaultdict(dict)   # term -> {slot: weighted tf}
+        self.docs = []                      # slot -> _Doc or None
+        self.slots = {}                     # product pk -> slot
+        self.skus = {}                      # normalized sku -> slot
+        self._free = []
+        self.total_length = 0.0
+        self.watermark = None               # newest updated_at seen
+        self.built_at = 0.0
+        self.category_names = {}
+        self.brand_names = {}
+        self.categories = {}                # head stem -> {category ids, with descendants}
+        self.brands = {}                    # stem -> {brand ids}
+
+    def __len__(self):
+        return len(self.slots)
+
+    # Building
+
+    @classmethod
+    def build(cls):
+        index = cls()
+        index._load_vocabulary()
+        rows = Product.objects.filter(is_active=True).values(*_ROW_FIELDS)
+        for row in rows.iterator(chunk_size=BUILD_CHUNK):
+            index._add(row)
+        index.built_at = time.monotonic()
+        return index
+
+    def _load_vocabulary(self):
+        children = defaultdict(list)
+        for pk, name, parent_id in Category.objects.values_list('pk', 'name', 'parent_id'):
+            self.category_names[pk] = name
+            children[parent_id].append(pk)
+
+        def subtree(pk):
+            ids, stack = set(), [pk]
+            while stack:
+                current = stack.pop()
+                ids.add(current)
+                stack.extend(children.get(current, ()))
+            return ids
+
+        categories = defaultdict(set)
+        for pk, name in self.category_names.items():
+            stems = terms(name)
+            if stems:
+                # "Смартфоны и гаджеты" is matched by its head word
+                categories[stems[0]] |= subtree(pk)
+        self.categories = dict(categories)
+
+        brands = defaultdict(set)
+        for pk, name in Brand.objects.values_list('pk', 'name'):
+            self.brand_names[pk] = name
+            for term in terms(name, keep_stopwords=True):
+                if len(term) >= 2:
+                    brands[term].add(pk)
+        self.brands = dict(brands)
+
+    def _add(self, row):
+        texts = {
+            'name': row['name'],
+            'brand': self.brand_names.get(row['brand_id'], ''),
+            'category': self.category_names.get(row['category_id'], ''),
+            'short_description': row['short_description'],
+            'description': (row['description'] or '')[:DESCRIPTION_CHARS],
+        }
+        weights = defaultdict(float)
+        for field_name, text in texts.items():
+            for term in terms(text or ''):
+                weights[term] += FIELD_WEIGHTS[field_name]
+
+        doc = _Doc()
+        doc.pk = row['pk']
+        doc.sku = normalize(row['sku'])
+        doc.price = row['price']
+        doc.stock = row['stock']
+        doc.rating = float(row['avg_rating'] or 0)
+        doc.category_id = row['category_id']
+        doc.brand_id = row['brand_id']
+        doc.length = sum(weights.values())
+        doc.terms = tuple(weights)
+
+        slot = self._free.pop() if self._free else len(self.docs)
+        if slot == len(self.docs):
+            self.docs.append(doc)
+        else:
+            self.docs[slot] = doc
+        self.slots[doc.pk] = slot
+        self.skus[doc.sku] = slot
+        self.total_length += doc.length
+        for term, weight in weights.items():
+            self.postings[term][slot] = weight
+        if self.watermark is None or row['updated_at'] > self.watermark:
+            self.watermark = row['updated_at']
+
+    def _remove(self, pk):
+        slot = self.slots.pop(pk, None)
+        if slot is None:
+            return
+        doc = self.docs[slot]
+        self.skus.pop(doc.sku, None)
+        for term in doc.terms:
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(slot, None)
+                if not postings:
+                    del self.postings[term]
+        self.total_length -= doc.length
+        self.docs[slot] = None
+        self._free.append(slot)
+
+    def apply_changes(self):
+        """Re-read products updated since the last pass; False if a full rebuild is due"""
+        if self.watermark is None:
+            return False
+        rows = list(Product.objects.filter(updated_at__gt=self.watermark).values(*_ROW_FIELDS, 'is_active'))
+        with self._lock:
+            for row in rows:
+                self._remove(row['pk'])
+                if row['is_active']:
+                    self._add(row)
+        # Deleted products leave no updated rows behind; a count mismatch means a rebuild
+        return Product.objects.filter(is_active=True).count() == len(self)
+
+    # Matching
+
+    def match_categories(self, stems):
+        ids = set()
+        for stem_ in stems:
+            ids |= self.categories.get(stem_, set())
+        return frozenset(ids)
+
+    def match_brands(self, stems):
+        ids = set()
+        for stem_ in stems:
+            ids |= self.brands.get(stem_, set())
+        return frozenset(ids)
+
+    @staticmethod
+    def _allowed(doc, query, categories, brands):
+        return (
+            (query.max_price is None or doc.price <= query.max_price)
+            and (query.min_price is None or doc.price >= query.min_price)
+            and (not query.in_stock or doc.stock > 0)
+            and (not categories or doc.category_id in categories)
+            and (not brands or doc.brand_id in brands)
+        )
+
+    def filter(self, pks, query, use_entities=True):
+        """The pks (order kept) of indexed products that pass the query's filters"""
+        categories = query.category_ids if use_entities else frozenset()
+        brands = query.brand_ids if use_entities else frozenset()
+        with self._lock:
+            return [
+                pk for pk in pks
+                if pk in self.slots and self._allowed(self.docs[self.slots[pk]], query, categories, brands)
+            ]
+
+    def search(self, query, k=5, use_entities=True):
+        """Top-k (product pk, score) for a ParsedQuery"""
+        categories = query.category_ids if use_entities else frozenset()
+        brands = query.brand_ids if use_entities else frozenset()
+
+        def allowed(doc):
+            return self._allowed(doc, query, categories, brands)
+
+        with self._lock:
+            count = len(self.slots)
+            if not count:
+                return []
+            exact = [self.docs[self.skus[term]].pk for term in query.terms if term in self.skus]
+            if exact:
+                # A pasted article number means that product, whatever else the message says
+                return [(pk, 100.0) for pk in exact[:k]]
+            average_length = self.total_length / count
+            scores = {}
+            verdicts = {}
+            # Rarest terms first; a term found across much of the catalog
+            # only re-scores what the rarer ones matched instead of adding its whole posting list
+            for term in sorted({t for t in query.terms if t in self.postings}, key=lambda t: len(self.postings[t])):
+                postings = self.postings[term]
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                if scores and len(postings) > count * COMMON_TERM_SHARE:
+                    matches = [(slot, postings[slot]) for slot in scores if slot in postings]
+                else:
+                    matches = postings.items()
+                for slot, tf in matches:
+                    ok = verdicts.get(slot)
+                    if ok is None:
+                        ok = verdicts[slot] = allowed(self.docs[slot])
+                    if ok:
+                        norm = K1 * (1 - B + B * self.docs[slot].length / average_length)
+                        scores[slot] = scores.get(slot, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+
+            if not scores and (categories or brands or query.max_price or query.min_price):
+                # Nothing to rank by ("что-нибудь до 5000"): the best-rated products that fit
+                scores = {slot: 0.0 for slot, doc in enumerate(self.docs) if doc is not None and allowed(doc)}
+            if not scores:
+                return []
+
+            for slot in scores:
+                doc = self.docs[slot]
+                scores[slot] += RATING_BOOST * doc.rating + (STOCK_BOOST if doc.stock > 0 else 0)
+            best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            floor = best[0][1] * MIN_RELATIVE_SCORE
+            return [(self.docs[slot].pk, round(score, 4)) for slot, score in best if score >= floor]
+
+
+_ROW_FIELDS = (
+    'pk', 'name', 'sku', 'short_description', 'description', 'price', 'stock', 'avg_rating',
+    'category_id', 'brand_id', 'updated_at',
+)
+
+
+# ── Process-wide index ────────────────────────────────────────────────────────
+
+class _Holder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.index = None
+        self._pid = None
+
+    def get(self):
+        """The index, or None while this process is still building it"""
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # First use in this process (or after a fork): build off the request path
+                    self.index = None
+                    self._pid = os.getpid()
+                    threading.Thread(target=self._maintain, name='chat-retrieval', daemon=True).start()
+        return self.index
+
+    def _maintain(self):
+        pid = os.getpid()
+        delay = 0
+        while self._pid == pid:
+            time.sleep(delay)
+            delay = settings.AI_RETRIEVAL_REFRESH
+            try:
+                index = self.index
+                if (
+                    index is None
+                    or time.monotonic() - index.built_at > settings.AI_RETRIEVAL_REBUILD
+                    or not index.apply_changes()
+                ):
+                    self.index = ProductIndex.build()
+            except Exception:
+                logger.warning('Chat retrieval index refresh failed', exc_info=True)
+            finally:
+                close_old_connections()
+
+
+_holder = _Holder()
+
+
+def get_index():
+    return _holder.get()
+
+
+def _search_database(query, k, category=None, brand=None):
+    """Until the index is ready: the filters, plus any query term in the name"""
+    products = Product.objects.filter(is_active=True)
+    if query.max_price is not None:
+        products = products.filter(price__lte=query.max_price)
+    if query.min_price is not None:
+        products = products.filter(price__gte=query.min_price)
+    if query.in_stock:
+        products = products.filter(stock__gt=0)
+    if category:
+        products = products.filter(category__name__icontains=category)
+    if brand:
+        products = products.filter(brand__name__icontains=brand)
+    if query.terms:
+        products = products.filter(reduce(or_, (Q(name__icontains=term) for term in query.terms)))
+    elif query.max_price is None and query.min_price is None and not category and not brand:
+        return []
+    return list(products.select_related('category', 'brand').order_by('-avg_rating')[:k])
+
+
+def _fuse(*rankings):
+    """Reciprocal rank fusion: {pk: score} from several best-first lists of pks"""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, pk in enumerate(ranking):
+            scores[pk] += 1 / (RRF_K + rank + 1)
+    return scores
+
+
+def retrieve(text, k=5, category=None, brand=None, max_price=None, min_price=None, in_stock=None):
+    """
+    Products for a chat message, best first, each with `.relevance` (its
+    fused rank score, None before the index is built). Keyword (BM25) and
+    semantic (embedding) matches are merged, so a message worded unlike
+    the product card still finds it. Filters on category or brand found in
+    the text are dropped if nothing matches them, price and stock filters
+    are not.
+
+    Semantic matches need the vector index and a cached query embedding;
+    a new query is embedded in the background and this call goes on with
+    keywords alone, so no network request happens here.
+
+    The keyword arguments are explicit filters (the assistant's catalog
+    tools): they override what is parsed from the text and are never dropped.
+    """
+    index = get_index()
+    if index is None:
+        query = parse_query(text)
+        _override(query, max_price, min_price, in_stock)
+        products = _search_database(query, k, category, brand)
+        attach_reserved_stock(products)
+        for product in products:
+            product.relevance = None
+        return products
+
+    query = parse_query(text, index)
+    _override(query, max_price, min_price, in_stock)
+    if category:
+        query.category_ids = index.match_categories(set(terms(category)))
+        if not query.category_ids:
+            return []
+    if brand:
+        query.brand_ids = index.match_brands(set(terms(brand)))
+        if not query.brand_ids:
+            return []
+    explicit = bool(category or brand)
+    use_entities = True
+    hits = index.search(query, k)
+    if not hits and not explicit and (query.category_ids or query.brand_ids):
+        use_entities = False
+        hits = index.search(query, k, use_entities=False)
+    exact = hits and hits[0][1] == 100.0
+    similar = [] if exact else index.filter(
+        [pk for pk, _ in semantic_search(text, k=SEMANTIC_CANDIDATES)], query, use_entities,
+    )[:k]
+    if not hits and not similar:
+        return []
+
+    scores = _fuse([pk for pk, _ in hits], similar)
+    products = Product.objects.filter(pk__in=scores, is_active=True).select_related('category', 'brand')
+    if query.in_stock:
+        products = products.filter(stock__gt=0)
+    products = sorted(products, key=lambda p: scores[p.pk], reverse=True)[:k]
+    attach_reserved_stock(products)
+    for product in products:
+        product.relevance = round(scores[product.pk], 4)
+    return products
+
+
+def _override(query, max_price, min_price, in_stock):
+    if max_price is not None:
+        query.max_price = Decimal(str(max_price))
+    if min_price is not None:
+        query.min_price = Decimal(str(min_price))
+    if in_stock is not None:
+        query.in_stock = in_stock
@@ -0,0 +1,228 @@
+"""
+Admission control for LLM requests.
+
+Ollama generates one answer at a time per model and queues the rest
+internally, so under a spike every chat slows down until requests hit the
+timeout. Requests are admitted here instead: at most `concurrency` run
+against a backend at once, the rest wait in a bounded FIFO queue, and each
+chat session holds at most one place (queued or running), so one impatient
+user can't crowd out the others.
+
+A request whose expected wait (its place in the queue times the recent
+generation time) exceeds the deadline budget is turned away immediately
+with Busy, and so is one that has waited out the budget in the queue.
+
+State lives in the event loop that serves the chat, i.e. one scheduler per
+backend per ASGI process; metrics() reports that process.
+"""
+import asyncio
+import os
+import time
+import weakref
+from collections import deque
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+
+WAIT_SAMPLES = 500     # recent queue waits kept for the percentiles
+SERVICE_TIME_WEIGHT = 0.2  # weight of the newest run in the generation time average
+
+
+class Busy(Exception):
+    """The request wasn't admitted; the message is shown to the user"""
+
+
+class Ticket:
+    __slots__ = ('key', 'enqueued', 'started', 'granted')
+
+    def __init__(self, key, now):
+        self.key = key
+        self.enqueued = now
+        self.started = None
+        self.granted = False
+
+
+class LLMScheduler:
+
+    def __init__(self, name, concurrency, max_queue, max_wait, expected_seconds):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.service_time = float(expected_seconds)
+        self.running = 0
+        self._queue = deque()
+        self._holders = {}  # key -> its ticket, queued or running
+        self._moved = asyncio.Event()
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self.admitted = self.shed = self.timed_out = self.completed = 0
+
+    # ── Admission ─────────────────────────────────────────────────────────────
+
+    def expected_wait(self, ahead=None):
+        """Seconds a request joining behind `ahead` queued ones is likely to wait"""
+        ahead = len(self._queue) if ahead is None else ahead
+        if self.running < self.concurrency and not ahead:
+            return 0.0
+        return (ahead // self.concurrency + 1) * self.service_time
+
+    def check(self, key):
+        """Raise Busy if `key` would be turned away right now (no state change)"""
+        if key in self._holders:
+            raise Busy('Дождитесь ответа на предыдущее сообщение.')
+        if self.running < self.concurrency and not self._queue:
+            return
+        if len(self._queue) >= self.max_queue or self.expected_wait() > self.max_wait:
+            raise Busy('AI-ассистент сейчас перегружен. Попробуйте через минуту.')
+
+    def admit(self, key):
+        """Take a place for `key`; pair with release() in a finally block"""
+        try:
+            self.check(key)
+        except Busy:
+            self.shed += 1
+            raise
+        ticket = Ticket(key, time.monotonic())
+        self._holders[key] = ticket
+        self._queue.append(ticket)
+        self.admitted += 1
+        self._grant()
+        return ticket
+
+    def try_acquire(self, key):
+        """
+        A running place for `key` if one is free right now, else None: never
+        queues. For a request moved here from a failed backend, which has
+        already waited its turn once. Pair with release().
+        """
+        if key in self._holders or self.running >= self.concurrency or self._queue:
+            self.shed += 1
+            return None
+        return self.admit(key)
+
+    def position(self, ticket):
+        """1-based place in the queue, 0 once running"""
+        if ticket.granted:
+            return 0
+        try:
+            return self._queue.index(ticket) + 1
+        except ValueError:
+            return 0
+
+    async def wait(self, ticket):
+        """
+        Yield the ticket's queue position each time it changes until it may
+        run. Raises Busy when the deadline budget runs out first.
+        """
+        deadline = ticket.enqueued + self.max_wait
+        last = None
+        while not ticket.granted:
+            position = self.position(ticket)
+            if position != last:
+                last = position
+                yield position
+            moved = self._moved
+            try:
+                await asyncio.wait_for(moved.wait(), deadline - time.monotonic())
+            except TimeoutError:
+                if ticket.granted:
+                    break
+                self.timed_out += 1
+                self.release(ticket)
+                raise Busy('Слишком долгое ожидание ответа AI. Попробуйте ещё раз.')
+
+    @asynccontextmanager
+    async def slot(self, key):
+        """Admit, wait without position updates, run the block, release"""
+        ticket = self.admit(key)
+        try:
+            async for _ in self.wait(ticket):
+                pass
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def release(self, ticket):
+        """Give back the place, queued or running. Safe to call twice."""
+        if self._holders.get(ticket.key) is not ticket:
+            return
+        del self._holders[ticket.key]
+        if ticket.granted:
+            self.running -= 1
+            self.completed += 1
+            duration = time.monotonic() - ticket.started
+            self.service_time += SERVICE_TIME_WEIGHT * (duration - self.service_time)
+        else:
+            try:
+                self._queue.remove(ticket)
+            except ValueError:
+                pass
+        self._grant()
+        self._notify()
+
+    def _grant(self):
+        granted = False
+        while self.running < self.concurrency and self._queue:
+            ticket = self._queue.popleft()
+            ticket.granted = True
+            ticket.started = time.monotonic()
+            self._waits.append(ticket.started - ticket.enqueued)
+            self.running += 1
+            granted = True
+        if granted:
+            self._notify()
+
+    def _notify(self):
+        # Wake every waiter so each can report its new position
+        moved, self._moved = self._moved, asyncio.Event()
+        moved.set()
+
+    # ── Metrics ───────────────────────────────────────────────────────────────
+
+    def metrics(self):
+        waits = sorted(self._waits)
+
+        def percentile(p):
+            return round(waits[min(int(len(waits) * p), len(waits) - 1)], 3) if waits else 0.0
+
+        return {
+            'backend': self.name,
+            'concurrency': self.concurrency,
+            'running': self.running,
+            'queue_depth': len(self._queue),
+            'max_queue': self.max_queue,
+            'max_wait': self.max_wait,
+            'expected_wait': round(self.expected_wait(), 3),
+            'service_time': round(self.service_time, 3),
+            'admitted': self.admitted,
+            'shed': self.shed,
+            'timed_out': self.timed_out,
+            'completed': self.completed,
+            'wait_p50': percentile(0.5),
+            'wait_p95': percentile(0.95),
+            'wait_max': round(waits[-1], 3) if waits else 0.0,
+        }
+
+
+# Asyncio primitives belong to one loop, so schedulers are kept per loop
+_schedulers = weakref.WeakKeyDictionary()
+
+
+def get_scheduler(backend='ollama', concurrency=None):
+    schedulers = _schedulers.setdefault(asyncio.get_running_loop(), {})
+    scheduler = schedulers.get(backend)
+    if scheduler is None:
+        scheduler = schedulers[backend] = LLMScheduler(
+            backend,
+            concurrency=concurrency or settings.LLM_CONCURRENCY,
+            max_queue=settings.LLM_QUEUE_MAX,
+            max_wait=settings.LLM_QUEUE_MAX_WAIT,
+            expected_seconds=settings.LLM_EXPECTED_SECONDS,
+        )
+    return scheduler
+
+
+def metrics():
+    """Metrics of every scheduler in this process' event loop"""
+    schedulers = _schedulers.get(asyncio.get_running_loop(), {})
+    return {'pid': os.getpid(), 'backends': [s.metrics() for s in schedulers.values()]}
@@ -0,0 +1,18 @@
+from django.conf import settings
+
+from apps.tasks.queue import task
+from .catalog import refresh_catalog_context
+from .context import update_summary
+from .models import ChatSession
+
+
+@task(every=settings.AI_CATALOG_CONTEXT_REFRESH, max_attempts=1)
+def refresh_ai_catalog_context():
+    refresh_catalog_context()
+
+
+@task(max_attempts=3)
+def summarize_chat_session(session_id):
+    session = ChatSession.objects.filter(pk=session_id).first()
+    if session is not None:
+        update_summary(session)
@@ -0,0 +1,278 @@
+"""
+Catalog tools the model can call during a chat.
+
+The products put in the prompt up front only cover the current message;
+follow-ups ("а подешевле?", "только Samsung") need a fresh query with
+other filters. The model gets these tools (Ollama's `tools` field) and
+decides when to call them:
+
+- search_products: ranked search (retrieval.py) with explicit category,
+  brand, price and stock filters;
+- get_product: one product's card with its attributes;
+- compare: attributes of up to COMPARE_LIMIT products side by side.
+
+Results are compact JSON, cached for AI_TOOL_CACHE_TTL seconds per catalog
+snapshot version. Every call is timed; metrics() reports counts, errors and
+latency percentiles per tool for this process.
+"""
+import hashlib
+import json
+import logging
+import time
+import uuid
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.products.models import Product, ProductAttribute, attach_reserved_stock
+
+from .catalog import catalog_version
+from .retrieval import retrieve
+
+logger = logging.getLogger(__name__)
+
+SEARCH_LIMIT = 8
+COMPARE_LIMIT = 4
+DESCRIPTION_CHARS = 600
+LATENCY_SAMPLES = 500
+
+TOOLS = [
+    {
+        'type': 'function',
+        'function': {
+            'name': 'search_products',
+            'description': 'Поиск товаров в каталоге магазина с фильтрами. Используй для любых вопросов '
+                           'о наличии, ценах и подборе товаров, в том числе для уточнений («подешевле», «только Samsung»).',
+            'parameters': {
+                'type': 'object',
+                'properties': {
+                    'query': {'type': 'string', 'description': 'Что ищет покупатель, своими словами'},
+                    'category': {'type': 'string', 'description': 'Название категории, например «Смартфоны»'},
+                    'brand': {'type': 'string', 'description': 'Бренд, например «Samsung»'},
+                    'price_max': {'type': 'number', 'description': 'Максимальная цена в тенге'},
+                    'price_min': {'type': 'number', 'description': 'Минимальная цена в тенге'},
+                    'in_stock': {'type': 'boolean', 'description': 'Только товары в наличии'},
+                },
+            },
+        },
+    },
+    {
+        'type': 'function',
+        'function': {
+            'name': 'get_product',
+            'description': 'Подробная карточка товара: описание, характеристики, цена, наличие.',
+            'parameters': {
+                'type': 'object',
+                'properties': {
+                    'slug': {'type': 'string', 'description': 'slug или id товара из результатов поиска'},
+                },
+                'required': ['slug'],
+            },
+        },
+    },
+    {
+        'type': 'function',
+        'function': {
+            'name': 'compare',
+            'description': f'Сравнение характеристик нескольких товаров (до {COMPARE_LIMIT}).',
+            'parameters': {
+                'type': 'object',
+                'properties': {
+                    'ids': {
+                        'type': 'array', 'items': {'type': 'string'},
+                        'description': 'id или slug товаров из результатов поиска',
+                    },
+                },
+                'required': ['ids'],
+            },
+        },
+    },
+]
+
+
+class ToolError(Exception):
+    """A bad call from the model; the message goes back to it as the tool result"""
+
+
+def _card(product):
+    return {
+        'id': str(product.pk),
+        'slug': product.slug,
+        'name': product.name,
+        'price': float(product.price),
+        'brand': product.brand.name if product.brand_id else None,
+        'category': product.category.name if product.category_id else None,
+        'rating': float(product.avg_rating),
+        'in_stock': product.in_stock,
+    }
+
+
+def _lookup(keys):
+    """Active products by id or slug, in the order given"""
+    ids, slugs = [], []
+    for key in keys:
+        try:
+            ids.append(uuid.UUID(str(key)))
+        except ValueError:
+            slugs.append(str(key))
+    products = list(
+        Product.objects.filter(is_active=True, pk__in=ids).select_related('category', 'brand')
+    ) + list(
+        Product.objects.filter(is_active=True, slug__in=slugs).select_related('category', 'brand')
+    )
+    order = {str(key): i for i, key in enumerate(keys)}
+    products.sort(key=lambda p: order.get(str(p.pk), order.get(p.slug, 0)))
+    attach_reserved_stock(products)
+    return products
+
+
+def _attributes(products):
+    values = {}
+    for product_id, name, value, unit in ProductAttribute.objects.filter(
+        product__in=products,
+    ).values_list('product_id', 'attribute__name', 'value', 'attribute__unit'):
+        values.setdefault(product_id, {})[name] = f'{value} {unit}'.strip()
+    return values
+
+
+def search_products(query='', category=None, brand=None, price_max=None, price_min=None, in_stock=None):
+    products = retrieve(
+        query or '', k=SEARCH_LIMIT, category=category, brand=brand,
+        max_price=price_max, min_price=price_min, in_stock=in_stock,
+    )
+    return {'products': [_card(p) for p in products]}, products
+
+
+def get_product(slug):
+    products = _lookup([slug])
+    if not products:
+        raise ToolError(f'Товар «{slug}» не найден')
+    product = products[0]
+    card = _card(product)
+    card['description'] = (product.short_description or product.description or '')[:DESCRIPTION_CHARS]
+    card['attributes'] = _attributes(products).get(product.pk, {})
+    return card, products
+
+
+def compare(ids):
+    if not isinstance(ids, list) or len(ids) < 2:
+        raise ToolError('Нужно минимум два товара')
+    products = _lookup(ids[:COMPARE_LIMIT])
+    if len(products) < 2:
+        raise ToolError('Найдено меньше двух товаров для сравнения')
+    attributes = _attributes(products)
+    names = sorted({name for values in attributes.values() for name in values})
+    return {
+        'products': [_card(p) for p in products],
+        'attributes': {name: [attributes.get(p.pk, {}).get(name) for p in products] for name in names},
+    }, products
+
+
+_IMPLEMENTATIONS = {
+    'search_products': search_products,
+    'get_product': get_product,
+    'compare': compare,
+}
+
+
+# ── Execution ─────────────────────────────────────────────────────────────────
+
+class _Stats:
+    def __init__(self):
+        self.calls = {}
+
+    def record(self, name, seconds, ok, cached):
+        entry = self.calls.setdefault(name, {
+            'calls': 0, 'errors': 0, 'cached': 0, 'latencies': deque(maxlen=LATENCY_SAMPLES),
+        })
+        entry['calls'] += 1
+        entry['errors'] += not ok
+        entry['cached'] += cached
+        entry['latencies'].append(seconds)
+
+    def snapshot(self):
+        result = {}
+        for name, entry in self.calls.items():
+            latencies = sorted(entry['latencies'])
+            result[name] = {
+                'calls': entry['calls'],
+                'errors': entry['errors'],
+                'cached': entry['cached'],
+                'latency_p50_ms': round(latencies[len(latencies) // 2] * 1000, 1),
+                'latency_p95_ms': round(latencies[int(len(latencies) * 0.95)] * 1000, 1),
+                'latency_max_ms': round(latencies[-1] * 1000, 1),
+            }
+        return result
+
+
+_stats = _Stats()
+
+
+def metrics():
+    return _stats.snapshot()
+
+
+def _arguments(call):
+    arguments = call.get('function', {}).get('arguments') or {}
+    if isinstance(arguments, str):
+        # Some models send the arguments JSON-encoded
+        try:
+            arguments = json.loads(arguments)
+        except ValueError:
+            raise ToolError('Аргументы должны быть JSON-объектом')
+    if not isinstance(arguments, dict):
+        raise ToolError('Аргументы должны быть JSON-объектом')
+    return arguments
+
+
+def run_tool(call):
+    """
+    Execute one tool call from the model.
+    Returns (tool message for the conversation, products it returned)
+    """
+    name = call.get('function', {}).get('name', '')
+    started = time.perf_counter()
+    ok, cached, products = True, False, []
+    try:
+        implementation = _IMPLEMENTATIONS.get(name)
+        if implementation is None:
+            raise ToolError(f'Нет такого инструмента: {name}')
+        arguments = {k: v for k, v in _arguments(call).items() if v not in (None, '')}
+        key = 'ai_chat:tool:{}:{}:{}'.format(
+            name, catalog_version(),
+            hashlib.sha256(json.dumps(arguments, sort_keys=True, ensure_ascii=False).encode()).hexdigest()[:32],
+        )
+        entry = cache.get(key)
+        if entry is not None:
+            cached = True
+            result = entry['result']
+            products = _lookup(entry['product_ids'])
+        else:
+            try:
+                result, products = implementation(**arguments)
+            except (TypeError, ValueError, ArithmeticError):
+                raise ToolError(f'Неверные аргументы для {name}')
+            cache.set(key, {'result': result, 'product_ids': [str(p.pk) for p in products]},
+                      settings.AI_TOOL_CACHE_TTL)
+    except ToolError as exc:
+        ok = False
+        result = {'error': str(exc)}
+    elapsed = time.perf_counter() - started
+    _stats.record(name or '?', elapsed, ok, cached)
+    logger.info('Tool %s (%s) took %.1f ms', name, 'cached' if cached else 'ok' if ok else 'error', elapsed * 1000)
+    return {'role': 'tool', 'tool_name': name, 'content': json.dumps(result, ensure_ascii=False)}, products
+
+
+def run_tools(calls):
+    """Execute a round of tool calls; returns (tool messages, products found)"""
+    messages, products = [], []
+    for call in calls:
+        message, found = run_tool(call)
+        messages.append(message)
+        products.extend(found)
+    return messages, products
+
+
+arun_tools = sync_to_async(run_tools)
@@ -8,4 +8,5 @@ urlpatterns = [
     path('send/', views.send_message, name='send'),
     path('new-session/', views.new_session, name='new_session'),
     path('session/<int:session_id>/', views.session_history, name='session_history'),
+    path('metrics/', views.llm_metrics, name='metrics'),
 ]
\ No newline at end of file
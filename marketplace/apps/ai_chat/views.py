@@ -1,36 +1,49 @@
-from django.shortcuts import render, get_object_or_404, redirect
+import asyncio
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, aget_object_or_404, redirect
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
 import json
 from .models import ChatSession, ChatMessage
-from .ollama_service import chat_with_ollama, is_ollama_available
+from . import response_cache
+from .context import aload_history, aqueue_summary
+from .backends import get_router
+from .scheduler import Busy, get_scheduler, metrics
+from .tools import metrics as tool_metrics
+from .ollama_service import (
+    OllamaError, ToolRound, abuild_messages, achat_with_ollama, astream_ollama, is_ollama_available,
+    merge_products,
+)
 
 
-def get_or_create_session(request):
+async def get_or_create_session(request):
     """Get or create chat session"""
-    if request.user.is_authenticated:
-        session = ChatSession.objects.filter(user=request.user, is_active=True).first()
+    user = await request.auser()
+    if user.is_authenticated:
+        session = await ChatSession.objects.filter(user=user, is_active=True).afirst()
         if not session:
-            session = ChatSession.objects.create(user=request.user, title='Новый чат')
+            session = await ChatSession.objects.acreate(user=user, title='Новый чат')
     else:
         if not request.session.session_key:
-            request.session.create()
-        session = ChatSession.objects.filter(
+            await request.session.acreate()
+        session = await ChatSession.objects.filter(
             session_key=request.session.session_key, user=None, is_active=True
-        ).first()
+        ).afirst()
         if not session:
-            session = ChatSession.objects.create(session_key=request.session.session_key)
+            session = await ChatSession.objects.acreate(session_key=request.session.session_key)
     return session
 
 
-def chat_view(request):
-    session = get_or_create_session(request)
-    messages = session.get_context(limit=50)
+async def chat_view(request):
+    user = await request.auser()
+    session = await get_or_create_session(request)
+    messages = await session.aget_context(limit=50)
     sessions = []
-    if request.user.is_authenticated:
-        sessions = ChatSession.objects.filter(user=request.user).order_by('-updated_at')[:10]
+    if user.is_authenticated:
+        sessions = [s async for s in ChatSession.objects.filter(user=user).order_by('-updated_at')[:10]]
 
     context = {
         'session': session,
@@ -38,11 +51,12 @@ def chat_view(request):
         'sessions': sessions,
         'ollama_available': is_ollama_available(),
     }
-    return render(request, 'ai_chat/chat.html', context)
+    # Context processors query the database, so the template renders on the sync thread
+    return await sync_to_async(render)(request, 'ai_chat/chat.html', context)
 
 
 @require_POST
-def send_message(request):
+async def send_message(request):
     try:
         data = json.loads(request.body)
         user_message = data.get('message', '').strip()
@@ -57,36 +71,96 @@ def send_message(request):
         return JsonResponse({'error': 'Message too long'}, status=400)
 
     # Get session
-    if session_id and request.user.is_authenticated:
-        session = get_object_or_404(ChatSession, pk=session_id, user=request.user)
+    user = await request.auser()
+    if session_id and user.is_authenticated:
+        session = await aget_object_or_404(ChatSession, pk=session_id, user=user)
     else:
-        session = get_or_create_session(request)
+        session = await get_or_create_session(request)
+
+    # Get history: the turns after the session summary, trimmed to the token budget later
+    history = await aload_history(session)
+
+    # Repeated opening questions are answered from the cache, without a generation slot
+    cached = None if session.summary else await response_cache.alookup(history, user_message)
+    if cached is not None:
+        await ChatMessage.objects.acreate(session=session, role='user', content=user_message)
+        if data.get('stream'):
+            return _event_stream(_replay_reply(session, user_message, cached))
+        await _save_reply(session, user_message, cached.text, cached.products, history)
+        return JsonResponse({
+            'response': cached.text,
+            'products': await _serialize_products(cached.products),
+            'session_id': str(session.id),
+            'cached': True,
+        })
+
+    # Turn the message away before storing it if the assistant is saturated
+    backend = get_router().pick()
+    scheduler = get_scheduler(backend.name, backend.concurrency)
+    queue_key = f'session:{session.id}'
+    try:
+        scheduler.check(queue_key)
+    except Busy as e:
+        return _busy_response(e, scheduler)
 
     # Save user message
-    ChatMessage.objects.create(session=session, role='user', content=user_message)
+    await ChatMessage.objects.acreate(session=session, role='user', content=user_message)
 
-    # Get history
-    history = list(session.messages.order_by('-created_at')[1:9])  # exclude just-added
-    history.reverse()
+    if data.get('stream'):
+        return _event_stream(_stream_reply(session, user_message, history, backend, scheduler, queue_key))
 
     # Get AI response
-    ai_response, mentioned_products = chat_with_ollama(history, user_message)
+    # A client disconnect cancels this view, and with it the Ollama request
+    try:
+        async with scheduler.slot(queue_key):
+            ai_response, mentioned_products = await achat_with_ollama(
+                history, user_message, use_cache=False, summary=session.summary, backend=backend,
+                queue_key=queue_key,
+            )
+    except Busy as e:
+        return _busy_response(e, scheduler)
+    await _save_reply(session, user_message, ai_response, mentioned_products, history)
+
+    return JsonResponse({
+        'response': ai_response,
+        'products': await _serialize_products(mentioned_products),
+        'session_id': str(session.id),
+    })
+
+
+def _event_stream(body):
+    response = StreamingHttpResponse(body, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _busy_response(exc, scheduler):
+    response = JsonResponse({'error': str(exc), 'busy': True}, status=503)
+    response['Retry-After'] = max(int(scheduler.expected_wait()), 5)
+    return response
 
-    # Save assistant message
-    ai_msg = ChatMessage.objects.create(session=session, role='assistant', content=ai_response)
+
+async def _save_reply(session, user_message, reply, mentioned_products, history):
+    ai_msg = await ChatMessage.objects.acreate(session=session, role='assistant', content=reply)
     if mentioned_products:
-        ai_msg.mentioned_products.set(mentioned_products)
+        await ai_msg.mentioned_products.aset(mentioned_products)
 
     # Update session title if first message
-    if session.messages.count() == 2:
+    if not history and not session.summary:
         session.title = user_message[:50]
-        session.save()
+        await session.asave(update_fields=['title', 'updated_at'])
     else:
-        session.save(update_fields=['updated_at'])
+        await session.asave(update_fields=['updated_at'])
+
+    # Older turns are folded into the session summary in the background
+    await aqueue_summary(session, [*history, ChatMessage(content=user_message), ai_msg])
+
 
-    # Serialize mentioned products
+@sync_to_async
+def _serialize_products(products):
     products_data = []
-    for p in mentioned_products:
+    for p in products:
         img = p.get_main_image()
         products_data.append({
             'id': str(p.id),
@@ -96,11 +170,85 @@ def send_message(request):
             'image': img.image.url if img else None,
             'rating': str(p.avg_rating),
         })
+    return products_data
 
-    return JsonResponse({
-        'response': ai_response,
-        'products': products_data,
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _stream_reply(session, user_message, history, backend, scheduler, queue_key):
+    """
+    SSE body: `meta` (session and products), `queue` with the position while
+    waiting for a generation slot, a `token` per generated piece, `tool` and
+    `products` when the model looked something up in the catalog, then `done`
+    (or `error`, or `busy` if the wait ran out). The reply is saved when the
+    stream ends, also when the client goes away mid-answer: the server
+    cancels this generator, which closes the Ollama request, and the text
+    generated so far is kept.
+    """
+    ollama_messages, mentioned_products = await abuild_messages(history, user_message, summary=session.summary)
+    pieces = []
+    ticket = None
+    try:
+        yield _sse('meta', {
+            'session_id': str(session.id),
+            'products': await _serialize_products(mentioned_products),
+        })
+        try:
+            ticket = scheduler.admit(queue_key)
+            async for position in scheduler.wait(ticket):
+                yield _sse('queue', {'position': position})
+        except Busy as e:
+            yield _sse('busy', {'message': str(e)})
+            return
+        try:
+            async for piece in astream_ollama(ollama_messages, backend, queue_key):
+                if isinstance(piece, ToolRound):
+                    yield _sse('tool', {'names': piece.names})
+                    if piece.products:
+                        mentioned_products = merge_products(mentioned_products, piece.products)
+                        yield _sse('products', {'products': await _serialize_products(mentioned_products)})
+                    continue
+                pieces.append(piece)
+                yield _sse('token', {'text': piece})
+        except OllamaError as e:
+            if not pieces:
+                mentioned_products = []
+            pieces.append(('\n\n' if pieces else '') + str(e))
+            yield _sse('error', {'message': str(e)})
+            return
+        yield _sse('done', {})
+        await response_cache.astore(history, user_message, ''.join(pieces), mentioned_products)
+    finally:
+        if ticket is not None:
+            scheduler.release(ticket)
+        if pieces:
+            # Shielded: after a disconnect the surrounding task is being cancelled
+            await asyncio.shield(_save_reply(session, user_message, ''.join(pieces), mentioned_products, history))
+
+
+async def _replay_reply(session, user_message, cached):
+    """SSE body for a cached answer: the same events as a generated one, without the wait"""
+    yield _sse('meta', {
         'session_id': str(session.id),
+        'products': await _serialize_products(cached.products),
+        'cached': True,
+    })
+    for piece in response_cache.replay(cached.text):
+        yield _sse('token', {'text': piece})
+    yield _sse('done', {})
+    await asyncio.shield(_save_reply(session, user_message, cached.text, cached.products, []))
+
+
+@staff_member_required(login_url='/users/login/')
+async def llm_metrics(request):
+    """Scheduler queue depth and waits, LLM backend health, response cache hits and tool latencies, for this process"""
+    return JsonResponse({
+        **metrics(),
+        'health': get_router().snapshot(),
+        'response_cache': response_cache.stats,
+        'tools': tool_metrics(),
     })
 
 
@@ -114,11 +262,12 @@ def new_session(request):
     return JsonResponse({'session_id': str(session.id)})
 
 
-def session_history(request, session_id):
-    if request.user.is_authenticated:
-        session = get_object_or_404(ChatSession, pk=session_id, user=request.user)
+async def session_history(request, session_id):
+    user = await request.auser()
+    if user.is_authenticated:
+        session = await aget_object_or_404(ChatSession, pk=session_id, user=user)
     else:
-        session = get_object_or_404(ChatSession, pk=session_id, session_key=request.session.session_key)
+        session = await aget_object_or_404(ChatSession, pk=session_id, session_key=request.session.session_key)
 
-    messages = session.messages.order_by('created_at').values('role', 'content', 'created_at')
-    return JsonResponse({'messages': list(messages), 'title': session.title})
\ No newline at end of file
+    messages = [m async for m in session.messages.order_by('created_at').values('role', 'content', 'created_at')]
+    return JsonResponse({'messages': messages, 'title': session.title})
\ No newline at end of file
@@ -43,9 +43,15 @@ def add_to_cart(request, product_id, quantity=1):
     return cart_item, created
 
 
+def release_removed_holds(cart):
+    """Drop checkout reservations for products no longer in the cart"""
+    cart.reservations.exclude(product__in=cart.items.values('product')).delete()
+
+
 def remove_from_cart(request, item_id):
     cart = get_or_create_cart(request)
     CartItem.objects.filter(cart=cart, pk=item_id).delete()
+    release_removed_holds(cart)
 
 
 def update_cart_item(request, item_id, quantity):
@@ -54,6 +60,7 @@ def update_cart_item(request, item_id, quantity):
         item = CartItem.objects.get(cart=cart, pk=item_id)
         if quantity <= 0:
             item.delete()
+            release_removed_holds(cart)
         else:
             item.quantity = min(quantity, item.product.stock)
             item.save()
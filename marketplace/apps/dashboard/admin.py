@@ -1,3 +1,24 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import CustomerStats, ExportJob, ImportJob
+
+
+@admin.register(CustomerStats)
+class CustomerStatsAdmin(admin.ModelAdmin):
+    list_display = ['user', 'orders_count', 'total_spent', 'avg_basket', 'last_order_at']
+    search_fields = ['user__email']
+    raw_id_fields = ['user']
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ['dataset', 'format', 'status', 'rows', 'created_by', 'created_at', 'finished_at']
+    list_filter = ['status', 'dataset', 'format']
+    readonly_fields = ['rows', 'error', 'finished_at']
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'status', 'checkpoint', 'created_by', 'created_at', 'finished_at']
+    list_filter = ['status']
+    readonly_fields = ['checkpoint', 'stats', 'errors', 'error', 'finished_at']
@@ -4,4 +4,7 @@ from django.apps import AppConfig
 class DashboardConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.dashboard'
-    verbose_name = 'Панель управления'
\ No newline at end of file
+    verbose_name = 'Панель управления'
+
+    def ready(self):
+        from . import receivers  # noqa: F401
@@ -0,0 +1,93 @@
+"""
+Row counts for the dashboard lists.
+
+An exact COUNT(*) over millions of orders dominates a list page, and the
+Paginator used to run it on top of the view's own count. Large, lightly
+filtered lists use a cached counter (the KPI snapshot) or, on Postgres, the
+planner's row estimate from EXPLAIN; anything that comes out under
+EXACT_COUNT_BELOW is small enough to count exactly. CountedPaginator takes
+the resulting number instead of counting again.
+"""
+import json
+
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db import connection
+
+EXACT_COUNT_BELOW = 10_000
+
+
+def planner_estimate(queryset):
+    """Postgres' estimate of the rows `queryset` returns, or None elsewhere"""
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def count_rows(queryset, cached=None, estimate=True):
+    """
+    (count, is_estimate) for the list. `cached` is a counter kept elsewhere
+    for the same rows; without one the planner is asked. Text searches
+    should pass estimate=False: the planner guesses LIKE selectivity badly.
+    """
+    if estimate:
+        approximate = cached if cached is not None else planner_estimate(queryset)
+        if approximate is not None and approximate >= EXACT_COUNT_BELOW:
+            return approximate, True
+    return queryset.count(), False
+
+
+class CountedPaginator(Paginator):
+    """
+    Paginator over a precomputed count. With an estimate, pages are sliced
+    by per_page alone and the count is corrected from what a page actually
+    holds: a short page is the real end, a full last page means there may
+    be more.
+    """
+
+    def __init__(self, object_list, per_page, count, estimated=False, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.estimated = estimated
+        self._set_count(count)
+
+    def _set_count(self, count):
+        self.__dict__['count'] = count
+        self.__dict__.pop('num_pages', None)
+
+    def validate_number(self, number):
+        if not self.estimated:
+            return super().validate_number(number)
+        # An estimate may be low, so pages past it are still worth trying
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(self.error_messages['invalid_page'])
+        if number < 1:
+            raise EmptyPage(self.error_messages['min_page'])
+        return number
+
+    def page(self, number):
+        if not self.estimated:
+            return super().page(number)
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        object_list = list(self.object_list[bottom:bottom + self.per_page])
+        if object_list and len(object_list) < self.per_page:
+            # The real end: from here on the count is exact
+            self._set_count(bottom + len(object_list))
+            self.estimated = False
+        elif not object_list and number > 1:
+            # Ran past the end of an overestimate: count once and show the last page
+            self._set_count(self.object_list.count())
+            self.estimated = False
+            return self.page(self.num_pages)
+        elif number >= self.num_pages:
+            self._set_count(max(self.count, bottom + self.per_page + 1))
+        return self._get_page(object_list, number, self)
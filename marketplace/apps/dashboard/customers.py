@@ -0,0 +1,73 @@
+"""
+Denormalized customer lifetime stats.
+
+Each order event recomputes its customer's row from that customer's orders,
+so the result doesn't depend on the order events are processed in.
+reconcile() recomputes every row in one grouped pass.
+"""
+from decimal import Decimal
+
+from django.db.models import Count, Max, Q, Sum
+
+from apps.orders.models import Order
+from .models import CustomerStats
+
+_PAID = ~Q(status=Order.Status.CANCELLED)
+
+_AGGREGATES = {
+    'orders_count': Count('id'),
+    'paid_count': Count('id', filter=_PAID),
+    'total_spent': Sum('total', filter=_PAID),
+    'last_order_at': Max('created_at'),
+}
+
+_FIELDS = ['orders_count', 'total_spent', 'avg_basket', 'last_order_at']
+
+
+def _build(user_id, row):
+    total = row['total_spent'] or Decimal(0)
+    avg = (total / row['paid_count']).quantize(Decimal('0.01')) if row['paid_count'] else Decimal(0)
+    return CustomerStats(
+        user_id=user_id,
+        orders_count=row['orders_count'],
+        total_spent=total,
+        avg_basket=avg,
+        last_order_at=row['last_order_at'],
+    )
+
+
+def refresh_customer(user_id):
+    row = Order.objects.filter(user_id=user_id).aggregate(**_AGGREGATES)
+    stats = _build(user_id, row)
+    CustomerStats.objects.update_or_create(
+        user_id=user_id, defaults={field: getattr(stats, field) for field in _FIELDS}
+    )
+
+
+def reconcile(batch_size=1000):
+    """Rebuild every customer's row from raw orders; returns the number of customers"""
+    rows = (
+        Order.objects.values('user_id').annotate(**_AGGREGATES)
+        .order_by('user_id').iterator(chunk_size=batch_size)
+    )
+    seen, batch = 0, []
+    for row in rows:
+        batch.append(_build(row['user_id'], row))
+        if len(batch) >= batch_size:
+            seen += _upsert(batch)
+            batch = []
+    if batch:
+        seen += _upsert(batch)
+    CustomerStats.objects.filter(user__orders__isnull=True).delete()
+    return seen
+
+
+def _upsert(batch):
+    CustomerStats.objects.bulk_create(
+        batch, update_conflicts=True, unique_fields=['user'], update_fields=_FIELDS + ['updated_at']
+    )
+    return len(batch)
+
+
+def stats_for(user):
+    return CustomerStats.objects.filter(user=user).first() or CustomerStats(user=user)
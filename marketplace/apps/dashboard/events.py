@@ -0,0 +1,205 @@
+"""
+Live dashboard events over Server-Sent Events.
+
+Events are published once, by whoever caused them (a background task, the
+KPI refresh), onto a Redis pub/sub channel. Each web process keeps a single
+subscriber thread that fans every event out to the SSE streams of the staff
+connected to that process, so N open dashboards cost one Redis subscription
+per process and no database queries at all. Live events need the Redis
+cache: without it (local development) the fan-out runs in-process only, so
+a dashboard sees the events published by its own web process, i.e. those of
+eager-mode tasks, and nothing from a separate `run_worker`.
+
+Streams are async generators (the site runs under ASGI, see settings) and
+wait on an asyncio queue, so an open dashboard holds no worker thread. They
+are still closed after DASHBOARD_EVENTS_STREAM_LIFETIME seconds; the
+browser's EventSource reconnects and replays what it missed via
+Last-Event-ID.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'dashboard:events'
+SEQUENCE_KEY = 'dashboard:events:seq'
+COUNTERS_KEY = 'dashboard:events:counter:{}'
+BACKLOG = 200          # recent events kept per process for Last-Event-ID replay
+LISTENER_QUEUE = 100   # events buffered per connection before it starts dropping
+
+COUNTERS = ('pending_orders', 'pending_reviews', 'low_stock')
+
+_local_ids = itertools.count(1)
+
+
+def _redis():
+    """The raw Redis client behind the cache, or None if the cache isn't Redis"""
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+    except (ImportError, NotImplementedError):
+        return None
+
+
+def _format(event_id, event, data):
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines.append(f'event: {event}')
+    lines.append('data: ' + json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False))
+    return '\n'.join(lines) + '\n\n'
+
+
+# ── Fan-out ───────────────────────────────────────────────────────────────────
+
+class Listener:
+    """One stream's queue: filled from any thread, read from the stream's event loop"""
+
+    def __init__(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=LISTENER_QUEUE)
+
+    def put(self, message):
+        self._loop.call_soon_threadsafe(self._put, message)
+
+    def _put(self, message):
+        try:
+            self._queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # A stalled client; it catches up from the backlog on reconnect
+            pass
+
+    async def get(self, timeout):
+        return await asyncio.wait_for(self._queue.get(), timeout)
+
+
+class Broadcaster:
+    """Per-process fan-out from one subscription to every open stream"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._listeners = set()
+        self._backlog = deque(maxlen=BACKLOG)
+        self._reader = None
+        self._pid = os.getpid()
+
+    def subscribe(self, last_event_id=None):
+        """Register a stream (from its event loop); returns (listener, events missed since last_event_id)"""
+        listener = Listener()
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked worker: the parent's reader thread didn't come along
+                self._reader, self._pid = None, os.getpid()
+                self._listeners.clear()
+            self._start_reader()
+            self._listeners.add(listener)
+            missed = [] if last_event_id is None else [
+                message for message in self._backlog if message[0] > last_event_id
+            ]
+        return listener, missed
+
+    def unsubscribe(self, listener):
+        with self._lock:
+            self._listeners.discard(listener)
+
+    @property
+    def listeners(self):
+        return len(self._listeners)
+
+    def dispatch(self, event_id, event, data):
+        message = (event_id, event, data)
+        with self._lock:
+            self._backlog.append(message)
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener.put(message)
+            except RuntimeError:
+                # The stream's loop is gone; its generator unsubscribes when closed
+                pass
+
+    def _start_reader(self):
+        if self._reader is not None and self._reader.is_alive():
+            return
+        if _redis() is None:
+            return
+        self._reader = threading.Thread(target=self._read, name='dashboard-events', daemon=True)
+        self._reader.start()
+
+    def _read(self):
+        while True:
+            try:
+                pubsub = _redis().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CHANNEL)
+                for message in pubsub.listen():
+                    payload = json.loads(message['data'])
+                    self.dispatch(payload['id'], payload['event'], payload['data'])
+            except Exception:
+                logger.warning('Dashboard event subscription lost, reconnecting', exc_info=True)
+                time.sleep(1)
+
+
+broadcaster = Broadcaster()
+
+
+def publish(event, data):
+    """Send an event to every connected dashboard. Call after the change committed."""
+    redis = _redis()
+    if redis is None:
+        broadcaster.dispatch(next(_local_ids), event, data)
+        return
+    try:
+        event_id = redis.incr(SEQUENCE_KEY)
+        redis.publish(CHANNEL, json.dumps(
+            {'id': event_id, 'event': event, 'data': data}, cls=DjangoJSONEncoder
+        ))
+    except Exception:
+        # Live updates are best effort; the next KPI refresh resyncs counters
+        logger.warning('Could not publish dashboard event %s', event, exc_info=True)
+
+
+def publish_counters(**counts):
+    """Publish sidebar counters and remember them for streams that connect later"""
+    counts = {key: value for key, value in counts.items() if key in COUNTERS}
+    if not counts:
+        return
+    # One key per counter, so publishers of different counters never overwrite each other
+    cache.set_many({COUNTERS_KEY.format(key): value for key, value in counts.items()}, timeout=None)
+    publish('counters', counts)
+
+
+def current_counters(fallback=None):
+    keys = {COUNTERS_KEY.format(key): key for key in COUNTERS}
+    stored = cache.get_many(keys)
+    return {**(fallback or {}), **{keys[cache_key]: value for cache_key, value in stored.items()}}
+
+
+async def stream(last_event_id=None, counters=None):
+    """SSE body for one connection: current counters, missed events, then live ones"""
+    listener, missed = broadcaster.subscribe(last_event_id)
+    try:
+        yield f'retry: {settings.DASHBOARD_EVENTS_RETRY * 1000}\n\n'
+        if counters:
+            yield _format(None, 'counters', counters)
+        for message in missed:
+            yield _format(*message)
+
+        deadline = time.monotonic() + settings.DASHBOARD_EVENTS_STREAM_LIFETIME
+        while time.monotonic() < deadline:
+            try:
+                message = await listener.get(settings.DASHBOARD_EVENTS_KEEPALIVE)
+            except asyncio.TimeoutError:
+                # Keeps proxies from timing out the idle connection
+                yield ': keepalive\n\n'
+                continue
+            yield _format(*message)
+    finally:
+        broadcaster.unsubscribe(listener)
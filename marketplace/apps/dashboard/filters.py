@@ -0,0 +1,79 @@
+"""
+List filters shared by the dashboard list pages and their exports.
+
+Each function takes a base queryset and request.GET-like params and returns
+the filtered queryset plus the normalized filter values for the template.
+"""
+from django.db.models import F, Q
+
+from .search import search
+
+USER_SORTS = {
+    'new': ('-created_at',),
+    'spent': (F('customer_stats__total_spent').desc(nulls_last=True), '-created_at'),
+    'orders': (F('customer_stats__orders_count').desc(nulls_last=True), '-created_at'),
+    'basket': (F('customer_stats__avg_basket').desc(nulls_last=True), '-created_at'),
+    'last_order': (F('customer_stats__last_order_at').desc(nulls_last=True), '-created_at'),
+}
+
+
+def filter_orders(qs, params):
+    status = params.get('status', '')
+    query = params.get('q', '').strip()
+    date_from = params.get('date_from', '')
+    date_to = params.get('date_to', '')
+
+    if status:
+        qs = qs.filter(status=status)
+    qs = search('orders', qs, query)
+    if date_from:
+        qs = qs.filter(created_at__date__gte=date_from)
+    if date_to:
+        qs = qs.filter(created_at__date__lte=date_to)
+
+    return qs.order_by('-created_at'), {
+        'status': status, 'q': query, 'date_from': date_from, 'date_to': date_to,
+    }
+
+
+def filter_products(qs, params):
+    query = params.get('q', '').strip()
+    category_id = params.get('category', '')
+    stock_filter = params.get('stock', '')
+
+    qs = search('products', qs, query)
+    if category_id:
+        qs = qs.filter(category_id=category_id)
+    if stock_filter == 'low':
+        qs = qs.filter(stock__lte=5)
+    elif stock_filter == 'out':
+        qs = qs.filter(stock=0)
+
+    return qs.order_by('-created_at'), {
+        'q': query, 'category': category_id, 'stock': stock_filter,
+    }
+
+
+def filter_users(qs, params):
+    query = params.get('q', '').strip()
+    qs = search('users', qs, query)
+
+    segment = params.get('segment', '')
+    if segment == 'buyers':
+        qs = qs.filter(customer_stats__orders_count__gt=0)
+    elif segment == 'no_orders':
+        qs = qs.filter(Q(customer_stats__isnull=True) | Q(customer_stats__orders_count=0))
+
+    min_spent = params.get('min_spent', '').strip()
+    if min_spent.isdigit():
+        qs = qs.filter(customer_stats__total_spent__gte=int(min_spent))
+    else:
+        min_spent = ''
+
+    sort = params.get('sort', 'new')
+    if sort not in USER_SORTS:
+        sort = 'new'
+
+    return qs.order_by(*USER_SORTS[sort]), {
+        'q': query, 'segment': segment, 'min_spent': min_spent, 'sort': sort,
+    }
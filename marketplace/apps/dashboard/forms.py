@@ -43,3 +43,76 @@ class DashboardProductForm(forms.ModelForm):
                 })
             else:
                 field.widget.attrs.update({'class': text_classes})
+
+
+_INPUT_CLASSES = 'w-full px-3 py-2 border border-gray-200 rounded-xl text-sm outline-none focus:ring-2 focus:ring-yellow-400 bg-white'
+
+
+class BulkFeedForm(forms.Form):
+    FIELD_CHOICES = (('price', 'Цена'), ('old_price', 'Старая цена'), ('stock', 'Остаток'))
+
+    feed = forms.FileField(label='Файл CSV или JSON')
+    fields = forms.MultipleChoiceField(
+        label='Обновлять поля', choices=FIELD_CHOICES, initial=['price', 'stock'],
+        widget=forms.CheckboxSelectMultiple,
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['feed'].widget.attrs.update({'accept': '.csv,.json,text/csv,application/json'})
+
+    def clean_feed(self):
+        feed = self.cleaned_data['feed']
+        if not feed.name.lower().endswith(('.csv', '.json')):
+            raise forms.ValidationError('Поддерживаются только файлы .csv и .json')
+        return feed
+
+
+class ProductImportForm(forms.Form):
+    file = forms.FileField(label='Файл CSV или JSON Lines')
+    create_missing = forms.BooleanField(label='Создавать отсутствующие категории и бренды', required=False)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['file'].widget.attrs.update({'accept': '.csv,.jsonl,.ndjson,text/csv'})
+
+    def clean_file(self):
+        file = self.cleaned_data['file']
+        if not file.name.lower().endswith(('.csv', '.jsonl', '.ndjson')):
+            raise forms.ValidationError('Поддерживаются только файлы .csv и .jsonl')
+        return file
+
+
+class BulkRuleForm(forms.Form):
+    FIELD_CHOICES = BulkFeedForm.FIELD_CHOICES
+    OPERATION_CHOICES = (('percent', 'Изменить на %'), ('add', 'Прибавить'), ('set', 'Установить'))
+
+    category = forms.ModelChoiceField(
+        label='Категория', queryset=Category.objects.none(), required=False,
+        empty_label='Все категории',
+    )
+    brand = forms.ModelChoiceField(
+        label='Бренд', queryset=Brand.objects.none(), required=False, empty_label='Все бренды',
+    )
+    field = forms.ChoiceField(label='Поле', choices=FIELD_CHOICES)
+    operation = forms.ChoiceField(label='Операция', choices=OPERATION_CHOICES)
+    amount = forms.DecimalField(label='Значение', max_digits=12, decimal_places=2)
+    ending = forms.RegexField(
+        label='Округлить до окончания', regex=r'^\d{1,4}$', required=False,
+        help_text='Например, 990 — цены вида 12 990',
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['category'].queryset = Category.objects.filter(is_active=True).order_by('parent__name', 'name')
+        self.fields['brand'].queryset = Brand.objects.order_by('name')
+        for name, field in self.fields.items():
+            field.widget.attrs.update({'class': _INPUT_CLASSES})
+
+    def clean(self):
+        cleaned = super().clean()
+        if cleaned.get('field') == 'stock' and cleaned.get('ending'):
+            self.add_error('ending', 'Округление применяется только к ценам')
+        if cleaned.get('operation') == 'set' and cleaned.get('amount') is not None and cleaned['amount'] < 0:
+            self.add_error('amount', 'Значение не может быть отрицательным')
+        return cleaned
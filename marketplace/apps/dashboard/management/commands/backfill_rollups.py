@@ -0,0 +1,46 @@
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.dashboard import rollups
+from apps.orders.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily sales rollups from raw orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='First day to rebuild (YYYY-MM-DD); defaults to the first order')
+        parser.add_argument('--days', type=int, help='Rebuild only the last N days')
+        parser.add_argument('--window', type=int, default=30, help='Days per transaction (default 30)')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        if options['days']:
+            start = today - timedelta(days=options['days'] - 1)
+        elif options['since']:
+            try:
+                start = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError('--since must be YYYY-MM-DD')
+        else:
+            first = Order.objects.order_by('created_at').values_list('created_at', flat=True).first()
+            if first is None:
+                self.stdout.write('No orders, nothing to rebuild.')
+                return
+            start = timezone.localdate(first)
+
+        window = timedelta(days=max(options['window'], 1))
+        started = time.monotonic()
+        day = start
+        while day <= today:
+            end = min(day + window - timedelta(days=1), today)
+            rollups.rebuild(day, end)
+            self.stdout.write(f'  {day} … {end}')
+            day = end + timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt rollups {start} … {today} in {time.monotonic() - started:.1f}s'
+        ))
@@ -0,0 +1,47 @@
+import time
+
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.dashboard.bulk_updates import FIELDS, BulkUpdateError, apply_plan, plan_from_feed
+
+
+class Command(BaseCommand):
+    help = 'Update prices/stock from a supplier feed (CSV or JSON keyed by sku)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('feed', help='Path to a .csv or .json feed')
+        parser.add_argument('--fields', default=','.join(FIELDS),
+                            help=f'Comma-separated fields to update (default {",".join(FIELDS)})')
+        parser.add_argument('--apply', action='store_true', help='Write the changes (default: dry run)')
+
+    def handle(self, *args, **options):
+        fields = [f.strip() for f in options['fields'].split(',') if f.strip()]
+        unknown = set(fields) - set(FIELDS)
+        if unknown:
+            raise CommandError(f'Unknown fields: {", ".join(sorted(unknown))}')
+
+        started = time.monotonic()
+        try:
+            with open(options['feed'], 'rb') as fh:
+                plan = plan_from_feed(File(fh, name=options['feed']), fields)
+        except (OSError, BulkUpdateError) as exc:
+            raise CommandError(str(exc))
+        planned = time.monotonic() - started
+
+        self.stdout.write(
+            f'Planned in {planned:.1f}s: {len(plan["changes"])} to change, '
+            f'{plan["unchanged"]} unchanged, {plan["error_count"]} errors'
+        )
+        for row, sku, message in plan['errors'][:20]:
+            self.stdout.write(self.style.WARNING(f'  row {row} {sku}: {message}'))
+
+        if not options['apply']:
+            self.stdout.write('Dry run, nothing written (use --apply).')
+            return
+
+        started = time.monotonic()
+        updated, skipped = apply_plan(plan)
+        self.stdout.write(self.style.SUCCESS(
+            f'Updated {updated} products in {time.monotonic() - started:.1f}s ({skipped} skipped)'
+        ))
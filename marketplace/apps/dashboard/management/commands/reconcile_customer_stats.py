@@ -0,0 +1,16 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.dashboard.customers import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Recompute customer lifetime stats from raw orders (run nightly)'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        count = reconcile()
+        self.stdout.write(self.style.SUCCESS(
+            f'Reconciled {count} customers in {time.monotonic() - started:.1f}s'
+        ))
@@ -0,0 +1,78 @@
+"""
+Dashboard KPI snapshot.
+
+All KPIs come from one conditional aggregate per table. A background job
+recomputes them every DASHBOARD_KPI_REFRESH seconds and caches the result, so
+staff page loads only read the cache. The page shows how old the snapshot is.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from apps.orders.models import Order
+from apps.products.models import Product, Review
+from apps.users.models import User
+from . import events
+
+KPI_CACHE_KEY = 'dashboard:kpi'
+LOW_STOCK_THRESHOLD = 5
+
+
+def compute_kpis():
+    now = timezone.localtime()
+    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    month_start = today_start.replace(day=1)
+    not_cancelled = ~Q(status=Order.Status.CANCELLED)
+
+    orders = Order.objects.aggregate(
+        orders_today=Count('id', filter=Q(created_at__gte=today_start)),
+        orders_month=Count('id', filter=Q(created_at__gte=month_start)),
+        revenue_today=Sum('total', filter=Q(created_at__gte=today_start) & not_cancelled),
+        revenue_month=Sum('total', filter=Q(created_at__gte=month_start) & not_cancelled),
+        **{
+            f'status_{status}': Count('id', filter=Q(status=status))
+            for status in Order.Status.values
+        },
+    )
+    users = User.objects.aggregate(
+        total_users=Count('id'),
+        new_users_month=Count('id', filter=Q(created_at__gte=month_start)),
+    )
+    products = Product.objects.filter(is_active=True).aggregate(
+        total_products=Count('id'),
+        low_stock=Count('id', filter=Q(stock__lte=LOW_STOCK_THRESHOLD)),
+    )
+    reviews = Review.objects.aggregate(pending_reviews=Count('id', filter=Q(is_approved=False)))
+
+    status_counts = {status: orders.pop(f'status_{status}') for status in Order.Status.values}
+    stats = {
+        **orders,
+        **users,
+        **products,
+        **reviews,
+        'revenue_today': orders['revenue_today'] or 0,
+        'revenue_month': orders['revenue_month'] or 0,
+        'pending_orders': status_counts[Order.Status.PENDING],
+    }
+    return {'stats': stats, 'status_counts': status_counts, 'computed_at': timezone.now()}
+
+
+def refresh_kpi_snapshot():
+    snapshot = compute_kpis()
+    # Keep serving the last snapshot for a while if the worker stalls
+    cache.set(KPI_CACHE_KEY, snapshot, timeout=settings.DASHBOARD_KPI_REFRESH * 10)
+    # Resync live counters that were missed or changed outside the announced paths
+    events.publish_counters(**{key: snapshot['stats'][key] for key in events.COUNTERS})
+    return snapshot
+
+
+def get_kpi_snapshot():
+    snapshot = cache.get(KPI_CACHE_KEY)
+    if snapshot is None:
+        snapshot = refresh_kpi_snapshot()
+    age = timezone.now() - snapshot['computed_at']
+    snapshot['is_stale'] = age > timedelta(seconds=settings.DASHBOARD_KPI_REFRESH * 2)
+    return snapshot
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.11 on 2026-10-19 08:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('orders_count', models.PositiveIntegerField(default=0, verbose_name='Заказов')),
+                ('total_spent', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Потрачено')),
+                ('avg_basket', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Средний чек')),
+                ('last_order_at', models.DateTimeField(blank=True, null=True, verbose_name='Последний заказ')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='customer_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Статистика покупателя',
+                'verbose_name_plural': 'Статистика покупателей',
+                'indexes': [models.Index(fields=['total_spent'], name='dashboard_c_total_s_73638e_idx'), models.Index(fields=['orders_count'], name='dashboard_c_orders__d1e9a2_idx'), models.Index(fields=['last_order_at'], name='dashboard_c_last_or_2bd07d_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.11 on 2026-10-19 08:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0003_exportjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.FileField(upload_to='imports/%Y/%m/', verbose_name='Файл')),
+                ('status', models.CharField(choices=[('queued', 'В очереди'), ('running', 'Выполняется'), ('done', 'Готово'), ('failed', 'Ошибка')], default='queued', max_length=20, verbose_name='Статус')),
+                ('create_missing', models.BooleanField(default=False, verbose_name='Создавать категории и бренды')),
+                ('checkpoint', models.PositiveIntegerField(default=0, verbose_name='Обработано строк')),
+                ('stats', models.JSONField(blank=True, default=dict, verbose_name='Статистика')),
+                ('errors', models.JSONField(blank=True, default=list, verbose_name='Ошибки строк')),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='import_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Импорт товаров',
+                'verbose_name_plural': 'Импорты товаров',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
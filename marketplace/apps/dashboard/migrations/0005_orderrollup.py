@@ -0,0 +1,34 @@
+# Generated by Django 5.2.11 on 2026-10-19 09:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def mark_counted(apps, schema_editor):
+    # Existing orders are already in the rollups under their current status
+    Order = apps.get_model('orders', 'Order')
+    OrderRollup = apps.get_model('dashboard', 'OrderRollup')
+    table, orders = OrderRollup._meta.db_table, Order._meta.db_table
+    schema_editor.execute(f'INSERT INTO {table} (order_id, status) SELECT id, status FROM {orders}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0004_importjob'),
+        ('orders', '0006_trigram_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderRollup',
+            fields=[
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rollup', serialize=False, to='orders.order')),
+                ('status', models.CharField(blank=True, choices=[('pending', 'Ожидает оплаты'), ('paid', 'Оплачен'), ('processing', 'В обработке'), ('shipped', 'Отправлен'), ('delivered', 'Доставлен'), ('cancelled', 'Отменён'), ('refunded', 'Возврат')], max_length=20)),
+            ],
+            options={
+                'verbose_name': 'Учёт заказа в сводках',
+            },
+        ),
+        migrations.RunPython(mark_counted, migrations.RunPython.noop),
+    ]
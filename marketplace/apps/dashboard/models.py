@@ -1,3 +1,136 @@
+from django.conf import settings
 from django.db import models
 
-# Create your models here.
+from apps.orders.models import Order
+from apps.products.models import Category, Product
+
+
+# Daily rollups maintained incrementally from order events (see rollups.py).
+# Product and category rows count orders that are not cancelled; status rows
+# count every order by its current status. Days are in the local timezone.
+
+class DailyProductSales(models.Model):
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    orders = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Продажи товара за день'
+        unique_together = ('day', 'product')
+
+
+class DailyCategorySales(models.Model):
+    day = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='daily_sales')
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    orders = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Продажи категории за день'
+        unique_together = ('day', 'category')
+
+
+class DailyStatusSales(models.Model):
+    day = models.DateField()
+    status = models.CharField(max_length=20, choices=Order.Status.choices)
+    orders = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = 'Заказы по статусу за день'
+        unique_together = ('day', 'status')
+
+
+class OrderRollup(models.Model):
+    """The status an order is counted under in the daily rollups; blank until it is counted"""
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, primary_key=True, related_name='rollup')
+    status = models.CharField(max_length=20, choices=Order.Status.choices, blank=True)
+
+    class Meta:
+        verbose_name = 'Учёт заказа в сводках'
+
+
+class CustomerStats(models.Model):
+    """Lifetime order totals per customer, kept current by customers.py"""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='customer_stats'
+    )
+    orders_count = models.PositiveIntegerField('Заказов', default=0)
+    total_spent = models.DecimalField('Потрачено', max_digits=14, decimal_places=2, default=0)
+    avg_basket = models.DecimalField('Средний чек', max_digits=12, decimal_places=2, default=0)
+    last_order_at = models.DateTimeField('Последний заказ', null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Статистика покупателя'
+        verbose_name_plural = 'Статистика покупателей'
+        indexes = [
+            models.Index(fields=['total_spent']),
+            models.Index(fields=['orders_count']),
+            models.Index(fields=['last_order_at']),
+        ]
+
+
+class ExportJob(models.Model):
+    """A list export run in the background for ranges too big to stream"""
+
+    class Status(models.TextChoices):
+        QUEUED = 'queued', 'В очереди'
+        RUNNING = 'running', 'Выполняется'
+        DONE = 'done', 'Готово'
+        FAILED = 'failed', 'Ошибка'
+
+    dataset = models.CharField('Данные', max_length=20)
+    format = models.CharField('Формат', max_length=10)
+    params = models.JSONField('Фильтры', default=dict, blank=True)
+    status = models.CharField('Статус', max_length=20, choices=Status.choices, default=Status.QUEUED)
+    file = models.FileField(upload_to='exports/%Y/%m/', blank=True)
+    rows = models.PositiveIntegerField('Строк', default=0)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='export_jobs'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Экспорт'
+        verbose_name_plural = 'Экспорты'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f'{self.dataset}.{self.format} ({self.get_status_display()})'
+
+
+class ImportJob(models.Model):
+    """A catalog import uploaded from the dashboard and run by the worker"""
+
+    class Status(models.TextChoices):
+        QUEUED = 'queued', 'В очереди'
+        RUNNING = 'running', 'Выполняется'
+        DONE = 'done', 'Готово'
+        FAILED = 'failed', 'Ошибка'
+
+    file = models.FileField('Файл', upload_to='imports/%Y/%m/')
+    status = models.CharField('Статус', max_length=20, choices=Status.choices, default=Status.QUEUED)
+    create_missing = models.BooleanField('Создавать категории и бренды', default=False)
+    checkpoint = models.PositiveIntegerField('Обработано строк', default=0)
+    stats = models.JSONField('Статистика', default=dict, blank=True)
+    errors = models.JSONField('Ошибки строк', default=list, blank=True)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='import_jobs'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Импорт товаров'
+        verbose_name_plural = 'Импорты товаров'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f'{self.file.name.rsplit("/", 1)[-1]} ({self.get_status_display()})'
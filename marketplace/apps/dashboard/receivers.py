@@ -0,0 +1,27 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from apps.orders.signals import order_placed, order_status_changed
+from apps.products.models import Review
+from .tasks import announce_order, announce_pending_reviews, refresh_customer_stats, sync_order_rollups
+
+
+@receiver(order_placed)
+def queue_order_placed_work(sender, order, **kwargs):
+    sync_order_rollups.delay(order_id=order.pk)
+    refresh_customer_stats.delay(user_id=order.user_id)
+    announce_order.delay(order_id=order.pk)
+
+
+@receiver(order_status_changed)
+def queue_status_change_work(sender, order, old_status, new_status, **kwargs):
+    sync_order_rollups.delay(order_id=order.pk)
+    refresh_customer_stats.delay(user_id=order.user_id)
+    announce_order.delay(order_id=order.pk, old_status=old_status)
+
+
+@receiver(post_save, sender=Review)
+def queue_review_count(sender, instance, created, **kwargs):
+    # Bulk moderation updates querysets and announces the count itself
+    if created and not instance.is_approved:
+        announce_pending_reviews.delay()
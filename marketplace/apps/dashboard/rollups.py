@@ -0,0 +1,165 @@
+"""
+Incremental daily sales rollups.
+
+Order events adjust the rollup rows with relative F() updates. Each order
+remembers the status it is counted under (OrderRollup), and an event just
+moves it from there to the order's current status, under a row lock: a
+retried or duplicated event finds nothing left to do, and events handled out
+of order still end with the order counted once, under its latest status.
+rebuild() recomputes whole day ranges from raw orders in streamed batches.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from apps.orders.models import Order, OrderItem
+from apps.products.models import Product
+from .models import DailyCategorySales, DailyProductSales, DailyStatusSales, OrderRollup
+
+CANCELLED = Order.Status.CANCELLED
+
+
+def _bump(model, keys, **deltas):
+    """Add deltas to the row identified by keys, creating it on first use"""
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    if model.objects.filter(**keys).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**keys, **deltas)
+    except IntegrityError:
+        model.objects.filter(**keys).update(**updates)
+
+
+def _apply_lines(order, day, sign):
+    lines = (
+        order.items.values('product_id', 'product__category_id')
+        .annotate(revenue=Sum(F('price') * F('quantity')), quantity=Sum('quantity'))
+        .order_by()
+    )
+    categories = defaultdict(lambda: [0, 0])
+    for line in lines:
+        _bump(
+            DailyProductSales, {'day': day, 'product_id': line['product_id']},
+            quantity=sign * line['quantity'], revenue=sign * line['revenue'], orders=sign,
+        )
+        totals = categories[line['product__category_id']]
+        totals[0] += line['quantity']
+        totals[1] += line['revenue']
+    for category_id, (quantity, revenue) in categories.items():
+        _bump(
+            DailyCategorySales, {'day': day, 'category_id': category_id},
+            quantity=sign * quantity, revenue=sign * revenue, orders=sign,
+        )
+
+
+def sync_order(order_id):
+    """Count an order under its current status, taking it off the one it was counted under"""
+    order = Order.objects.filter(pk=order_id).first()
+    if order is None:
+        return
+    with transaction.atomic():
+        OrderRollup.objects.get_or_create(order=order)
+        counted = OrderRollup.objects.select_for_update().get(order=order)
+        # Read after taking the lock, so concurrent events see each other's result
+        order.refresh_from_db(fields=['status'])
+        if counted.status == order.status:
+            return
+        day = timezone.localdate(order.created_at)
+        old_status, new_status = counted.status, order.status
+        if old_status:
+            _bump(DailyStatusSales, {'day': day, 'status': old_status}, orders=-1, revenue=-order.total)
+        _bump(DailyStatusSales, {'day': day, 'status': new_status}, orders=1, revenue=order.total)
+        was_counted, is_counted = old_status not in ('', CANCELLED), new_status != CANCELLED
+        if was_counted != is_counted:
+            _apply_lines(order, day, 1 if is_counted else -1)
+        counted.status = new_status
+        counted.save(update_fields=['status'])
+
+
+def _bulk_insert(model, rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(model(**row))
+        if len(batch) >= batch_size:
+            model.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        model.objects.bulk_create(batch)
+
+
+def rebuild(start, end, batch_size=2000):
+    """Recompute rollups for days start..end (inclusive) from raw orders"""
+    window = {'order__created_at__date__gte': start, 'order__created_at__date__lte': end}
+    items = OrderItem.objects.filter(**window).exclude(order__status=CANCELLED)
+    day = TruncDate('order__created_at')
+
+    orders = Order.objects.filter(created_at__date__gte=start, created_at__date__lte=end)
+
+    with transaction.atomic():
+        for model in (DailyProductSales, DailyCategorySales, DailyStatusSales):
+            model.objects.filter(day__gte=start, day__lte=end).delete()
+        OrderRollup.objects.filter(**window).delete()
+
+        _bulk_insert(DailyProductSales, (
+            items.annotate(day=day).values('day', 'product_id')
+            .annotate(revenue=Sum(F('price') * F('quantity')), quantity=Sum('quantity'),
+                      orders=Count('order', distinct=True))
+            .order_by().iterator(chunk_size=batch_size)
+        ), batch_size)
+        _bulk_insert(DailyCategorySales, (
+            items.annotate(day=day, category_id=F('product__category_id')).values('day', 'category_id')
+            .annotate(revenue=Sum(F('price') * F('quantity')), quantity=Sum('quantity'),
+                      orders=Count('order', distinct=True))
+            .order_by().iterator(chunk_size=batch_size)
+        ), batch_size)
+        _bulk_insert(DailyStatusSales, (
+            orders.annotate(day=TruncDate('created_at')).values('day', 'status')
+            .annotate(orders=Count('id'), revenue=Sum('total'))
+            .order_by().iterator(chunk_size=batch_size)
+        ), batch_size)
+        _bulk_insert(OrderRollup, (
+            {'order_id': row['id'], 'status': row['status']}
+            for row in orders.values('id', 'status').order_by().iterator(chunk_size=batch_size)
+        ), batch_size)
+
+
+def _range_start(days):
+    return timezone.localdate() - timedelta(days=days - 1)
+
+
+def revenue_series(days):
+    """Daily (labels, revenue, orders) for the last `days` days, zero-filled"""
+    start = _range_start(days)
+    rows = {
+        row['day']: row for row in
+        DailyStatusSales.objects.filter(day__gte=start).exclude(status=CANCELLED)
+        .values('day').annotate(revenue=Sum('revenue'), orders=Sum('orders')).order_by()
+    }
+    labels, revenue, orders = [], [], []
+    for i in range(days):
+        day = start + timedelta(days=i)
+        row = rows.get(day)
+        labels.append(day.strftime('%d.%m'))
+        revenue.append(float(row['revenue']) if row else 0)
+        orders.append(row['orders'] if row else 0)
+    return labels, revenue, orders
+
+
+def top_products(days, limit=5):
+    rows = list(
+        DailyProductSales.objects.filter(day__gte=_range_start(days), product__is_active=True)
+        .values('product_id').annotate(revenue=Sum('revenue'), units=Sum('quantity'))
+        .order_by('-revenue')[:limit]
+    )
+    products = Product.objects.in_bulk([row['product_id'] for row in rows])
+    result = []
+    for row in rows:
+        product = products[row['product_id']]
+        product.revenue, product.units_sold = row['revenue'], row['units']
+        result.append(product)
+    return result
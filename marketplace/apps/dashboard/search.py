@@ -0,0 +1,71 @@
+"""
+Staff search over orders, products and users.
+
+Substring search goes through `icontains`, which Postgres runs as
+UPPER(col::text) LIKE UPPER('%term%'); the trigram GIN indexes in the
+models' Meta.indexes cover exactly that expression. Orders also match their
+customer's account email, through the index on users.email.
+
+A term that is a complete order number or SKU is looked up by its unique
+index instead.
+"""
+import re
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+
+from apps.orders.numbering import SERIAL_DIGITS, is_valid_order_number
+
+SEARCH_FIELDS = {
+    'orders': ('order_number', 'full_name', 'phone', 'email', 'user__email'),
+    'products': ('name', 'sku'),
+    'users': ('email', 'first_name', 'last_name', 'phone'),
+}
+
+LEGACY_ORDER_NUMBER_DIGITS = 10
+_SKU_RE = re.compile(r'^[\w.\-/]+$')
+
+
+def _contains(fields, term):
+    return reduce(or_, (Q(**{f'{field}__icontains': term}) for field in fields))
+
+
+def search_orders(qs, term):
+    if is_valid_order_number(term):
+        # A pasted order number: one unique-index lookup
+        return qs.filter(order_number=term)
+    if term.isdigit() and len(term) == LEGACY_ORDER_NUMBER_DIGITS:
+        # Old random numbers have ten digits, so do phone numbers
+        return qs.filter(Q(order_number=term) | Q(phone__icontains=term))
+    if term.isdigit() and len(term) == SERIAL_DIGITS + 1:
+        # Twelve digits with a bad check digit: a mistyped number
+        return qs.none()
+    return qs.filter(_contains(SEARCH_FIELDS['orders'], term))
+
+
+def search_products(qs, term):
+    if _SKU_RE.match(term) and qs.filter(sku=term).exists():
+        return qs.filter(sku=term)
+    return qs.filter(_contains(SEARCH_FIELDS['products'], term))
+
+
+def search_users(qs, term):
+    if '@' in term and qs.filter(email=term).exists():
+        return qs.filter(email=term)
+    return qs.filter(_contains(SEARCH_FIELDS['users'], term))
+
+
+_SEARCHES = {
+    'orders': search_orders,
+    'products': search_products,
+    'users': search_users,
+}
+
+
+def search(dataset, qs, term):
+    """Narrow qs (a queryset of `dataset`) to rows matching the staff search term"""
+    term = term.strip()
+    if not term:
+        return qs
+    return _SEARCHES[dataset](qs, term)
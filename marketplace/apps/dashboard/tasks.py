@@ -0,0 +1,117 @@
+from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.orders.models import Order
+from apps.products.importer import ProductImporter, read_rows
+from apps.products.models import Product, Review
+from apps.tasks.queue import task
+from . import customers, events, exports, rollups
+from .models import ExportJob, ImportJob
+from .metrics import LOW_STOCK_THRESHOLD, refresh_kpi_snapshot
+
+
+@task(every=settings.DASHBOARD_KPI_REFRESH, max_attempts=1)
+def refresh_dashboard_kpis():
+    refresh_kpi_snapshot()
+
+
+@task()
+def sync_order_rollups(order_id):
+    rollups.sync_order(order_id)
+
+
+@task(max_attempts=1)
+def announce_order(order_id, old_status=None):
+    """Push a new order (or a status change) and the counters it moves to open dashboards"""
+    order = Order.objects.filter(pk=order_id).first()
+    if order is None:
+        return
+    events.publish('order.created' if old_status is None else 'order.status', {
+        'id': str(order.pk),
+        'number': order.order_number,
+        'customer': order.full_name,
+        'total': order.total,
+        'status': order.status,
+        'status_display': order.get_status_display(),
+        'old_status': old_status,
+        'url': reverse('dashboard:order_detail', args=[order.pk]),
+    })
+
+    counters = {'pending_orders': Order.objects.filter(status=Order.Status.PENDING).count()}
+    low_stock = Product.objects.filter(is_active=True, stock__lte=LOW_STOCK_THRESHOLD)
+    if old_status is None:
+        running_low = list(
+            low_stock.filter(pk__in=order.items.values('product_id')).values('name', 'sku', 'stock')
+        )
+        if running_low:
+            events.publish('stock.low', {
+                'products': running_low,
+                'url': reverse('dashboard:products') + '?stock=low',
+            })
+            counters['low_stock'] = low_stock.count()
+    elif order.status == Order.Status.CANCELLED:
+        # Cancelling put the items back on the shelf
+        counters['low_stock'] = low_stock.count()
+    events.publish_counters(**counters)
+
+
+@task(max_attempts=1)
+def announce_pending_reviews():
+    events.publish_counters(pending_reviews=Review.objects.filter(is_approved=False).count())
+
+
+@task()
+def refresh_customer_stats(user_id):
+    customers.refresh_customer(user_id)
+
+
+@task(every=24 * 60 * 60, max_attempts=1)
+def reconcile_customer_stats():
+    customers.reconcile()
+
+
+@task(max_attempts=1)
+def run_export(job_id):
+    job = ExportJob.objects.get(pk=job_id)
+    job.status = ExportJob.Status.RUNNING
+    job.save(update_fields=['status'])
+    try:
+        job.rows = exports.write_export(job)
+        job.status = ExportJob.Status.DONE
+    except Exception as exc:
+        job.status = ExportJob.Status.FAILED
+        job.error = str(exc)
+        raise
+    finally:
+        job.finished_at = timezone.now()
+        job.save()
+
+
+@task(max_attempts=3)
+def run_import(job_id):
+    """Import an uploaded catalog; a retry resumes from the saved checkpoint"""
+    job = ImportJob.objects.get(pk=job_id)
+    if job.status == ImportJob.Status.DONE:
+        return
+    ImportJob.objects.filter(pk=job.pk).update(status=ImportJob.Status.RUNNING, error='')
+
+    def progress(stats):
+        ImportJob.objects.filter(pk=job.pk).update(checkpoint=stats.checkpoint, stats=stats.as_dict())
+
+    importer = ProductImporter(create_missing=job.create_missing, on_progress=progress)
+    try:
+        with job.file.open('rb') as fh:
+            stats = importer.run(read_rows(fh, job.file.name), start=job.checkpoint)
+        job.status = ImportJob.Status.DONE
+        job.checkpoint = stats.checkpoint
+    except Exception as exc:
+        job.status = ImportJob.Status.FAILED
+        job.error = str(exc)
+        job.checkpoint = importer.stats.checkpoint
+        raise
+    finally:
+        job.stats = importer.stats.as_dict()
+        job.errors = (job.errors + importer.stats.errors)[:200]
+        job.finished_at = timezone.now()
+        job.save()
@@ -5,6 +5,7 @@ app_name = 'dashboard'
 
 urlpatterns = [
     path('', views.dashboard_home, name='home'),
+    path('events/', views.events_stream, name='events'),
 
     # Orders
     path('orders/', views.orders_list, name='orders'),
@@ -13,6 +14,10 @@ urlpatterns = [
     # Products
     path('products/', views.products_list, name='products'),
     path('products/add/', views.product_create, name='product_create'),
+    path('products/bulk/', views.products_bulk, name='products_bulk'),
+    path('products/import/', views.products_import, name='products_import'),
+    path('products/import/<int:pk>/status/', views.products_import_status, name='products_import_status'),
+    path('products/bulk/<str:token>/', views.products_bulk_preview, name='products_bulk_preview'),
     path('products/<uuid:pk>/toggle/', views.product_toggle, name='product_toggle'),
     path('products/<uuid:pk>/stock/', views.product_update_stock, name='product_stock'),
 
@@ -23,6 +28,13 @@ urlpatterns = [
     # Reviews
     path('reviews/', views.reviews_list, name='reviews'),
     path('reviews/<int:pk>/action/', views.review_action, name='review_action'),
+    path('reviews/bulk/', views.reviews_bulk_action, name='reviews_bulk'),
+
+    # Exports
+    path('export/<str:dataset>/', views.export_view, name='export'),
+    path('exports/', views.exports_list, name='exports'),
+    path('exports/<int:pk>/status/', views.export_status, name='export_status'),
+    path('exports/<int:pk>/download/', views.export_download, name='export_download'),
 
     # AI Chats
     path('chats/', views.chats_list, name='chats'),
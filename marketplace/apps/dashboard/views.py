@@ -1,18 +1,29 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
-from django.db.models import Sum, Count, Avg, Q
-from django.db.models.functions import TruncDay, TruncMonth
+from django.db import transaction
+from django.db.models import Count
 from django.utils import timezone
-from django.http import JsonResponse
-from datetime import timedelta
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
 import json
 
-from apps.orders.models import Order, OrderStatusHistory
+from apps.orders.models import Order
+from apps.orders.tasks import on_order_status_changed
 from apps.products.models import Product, Category, Review, ProductImage
+from apps.products.services import MODERATION_ACTIONS, moderate_reviews
 from apps.users.models import User
 from apps.ai_chat.models import ChatSession
-from .forms import DashboardProductForm
+from .bulk_updates import BulkUpdateError, PREVIEW_ROWS, apply_plan, get_plan, plan_from_feed, plan_from_rule
+from .forms import BulkFeedForm, BulkRuleForm, DashboardProductForm, ProductImportForm
+from . import rollups
+from . import events, exports
+from .counts import CountedPaginator, count_rows
+from .customers import stats_for
+from .filters import filter_orders, filter_products, filter_users
+from .metrics import get_kpi_snapshot
+from .models import ExportJob, ImportJob
+from .tasks import announce_pending_reviews, run_export, run_import
 
 
 # ── Helpers ───────────────────────────────────────────────────────────────────
@@ -23,115 +34,79 @@ def staff_required(view_func):
 
 # ── Dashboard home ─────────────────────────────────────────────────────────────
 
+CHART_RANGES = (14, 30, 90, 365)
+
+
 @staff_required
 def dashboard_home(request):
-    now = timezone.now()
-    today = now.date()
-    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    week_ago = now - timedelta(days=7)
-
-    # Key metrics
-    stats = {
-        'orders_today': Order.objects.filter(created_at__date=today).count(),
-        'orders_month': Order.objects.filter(created_at__gte=month_start).count(),
-        'revenue_today': Order.objects.filter(
-            created_at__date=today
-        ).exclude(status='cancelled').aggregate(s=Sum('total'))['s'] or 0,
-        'revenue_month': Order.objects.filter(
-            created_at__gte=month_start
-        ).exclude(status='cancelled').aggregate(s=Sum('total'))['s'] or 0,
-        'new_users_month': User.objects.filter(created_at__gte=month_start).count(),
-        'total_users': User.objects.count(),
-        'total_products': Product.objects.filter(is_active=True).count(),
-        'low_stock': Product.objects.filter(is_active=True, stock__lte=5).count(),
-        'pending_reviews': Review.objects.filter(is_approved=False).count(),
-        'pending_orders': Order.objects.filter(status='pending').count(),
-    }
+    kpi = get_kpi_snapshot()
 
-    # Revenue chart — last 14 days
-    revenue_data = (
-        Order.objects
-        .filter(created_at__gte=now - timedelta(days=14))
-        .exclude(status='cancelled')
-        .annotate(day=TruncDay('created_at'))
-        .values('day')
-        .annotate(total=Sum('total'), count=Count('id'))
-        .order_by('day')
-    )
-    chart_labels = []
-    chart_revenue = []
-    chart_orders = []
-    for row in revenue_data:
-        chart_labels.append(row['day'].strftime('%d.%m'))
-        chart_revenue.append(float(row['total']))
-        chart_orders.append(row['count'])
-
-    # Orders by status
-    status_counts = {
-        s: Order.objects.filter(status=s).count()
-        for s, _ in Order.Status.choices
-    }
+    # Revenue chart and top products over the selected range, from the rollups
+    chart_days = request.GET.get('range', '14')
+    chart_days = int(chart_days) if chart_days.isdigit() and int(chart_days) in CHART_RANGES else 14
+    chart_labels, chart_revenue, chart_orders = rollups.revenue_series(chart_days)
 
     # Recent orders
     recent_orders = Order.objects.select_related('user').order_by('-created_at')[:8]
 
-    # Top products by revenue
-    top_products = (
-        Product.objects
-        .filter(is_active=True)
-        .annotate(revenue=Sum('orderitem__price'))
-        .order_by('-revenue')[:5]
-    )
-
     context = {
-        'stats': stats,
+        'stats': kpi['stats'],
+        'kpi_computed_at': kpi['computed_at'],
+        'kpi_is_stale': kpi['is_stale'],
         'chart_labels': json.dumps(chart_labels),
         'chart_revenue': json.dumps(chart_revenue),
         'chart_orders': json.dumps(chart_orders),
-        'status_counts': status_counts,
+        'status_counts': kpi['status_counts'],
         'recent_orders': recent_orders,
-        'top_products': top_products,
+        'top_products': rollups.top_products(chart_days),
+        'chart_days': chart_days,
+        'chart_ranges': CHART_RANGES,
         'section': 'home',
     }
     return render(request, 'dashboard/home.html', context)
 
 
+# ── Live events ───────────────────────────────────────────────────────────────
+
+@staff_required
+def events_stream(request):
+    """Server-Sent Events: new orders, status changes, low stock and sidebar counters"""
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    kpi = get_kpi_snapshot()
+    counters = events.current_counters({key: kpi['stats'][key] for key in events.COUNTERS})
+    response = StreamingHttpResponse(
+        events.stream(int(last_event_id) if last_event_id.isdigit() else None, counters),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx: don't buffer the stream
+    return response
+
+
 # ── Orders ─────────────────────────────────────────────────────────────────────
 
 @staff_required
 def orders_list(request):
-    qs = Order.objects.select_related('user').prefetch_related('items').order_by('-created_at')
-
-    # Filters
-    status = request.GET.get('status')
-    search = request.GET.get('q', '').strip()
-    date_from = request.GET.get('date_from')
-    date_to = request.GET.get('date_to')
-
-    if status:
-        qs = qs.filter(status=status)
-    if search:
-        qs = qs.filter(
-            Q(order_number__icontains=search) |
-            Q(full_name__icontains=search) |
-            Q(user__email__icontains=search) |
-            Q(phone__icontains=search)
-        )
-    if date_from:
-        qs = qs.filter(created_at__date__gte=date_from)
-    if date_to:
-        qs = qs.filter(created_at__date__lte=date_to)
+    qs, filters = filter_orders(
+        Order.objects.select_related('user').prefetch_related('items'), request.GET
+    )
 
-    from django.core.paginator import Paginator
-    paginator = Paginator(qs, 25)
+    cached = None
+    if not (filters['q'] or filters['date_from'] or filters['date_to']):
+        status_counts = get_kpi_snapshot()['status_counts']
+        cached = status_counts.get(filters['status'], 0) if filters['status'] else sum(status_counts.values())
+    total, total_is_estimate = count_rows(qs, cached=cached, estimate=not filters['q'])
+    paginator = CountedPaginator(qs, 25, count=total, estimated=total_is_estimate)
     page_obj = paginator.get_page(request.GET.get('page'))
 
     context = {
         'page_obj': page_obj,
         'status_choices': Order.Status.choices,
-        'current_status': status,
-        'search': search,
-        'total': qs.count(),
+        'current_status': filters['status'],
+        'search': filters['q'],
+        'export_query': request.GET.urlencode(),
+        'total': paginator.count,
+        'total_is_estimate': paginator.estimated,
         'section': 'orders',
     }
     return render(request, 'dashboard/orders.html', context)
@@ -144,17 +119,24 @@ def order_detail(request, pk):
     if request.method == 'POST':
         new_status = request.POST.get('status')
         comment = request.POST.get('comment', '')
-        if new_status and new_status != order.status:
-            old_status = order.get_status_display()
-            order.status = new_status
-            order.save()
-            OrderStatusHistory.objects.create(
-                order=order,
-                status=new_status,
-                comment=comment or f'Статус изменён администратором с "{old_status}"',
-                created_by=request.user,
-            )
-            messages.success(request, f'Статус заказа обновлён: {order.get_status_display()}')
+        if new_status in Order.Status.values and new_status != order.status:
+            old_status, old_label = order.status, order.get_status_display()
+            with transaction.atomic():
+                # Only move from the status the admin was looking at
+                changed = Order.objects.filter(pk=order.pk, status=old_status).update(
+                    status=new_status, updated_at=timezone.now()
+                )
+                if changed:
+                    order.status = new_status
+                    on_order_status_changed(
+                        order, old_status,
+                        user_id=request.user.pk,
+                        comment=comment or f'Статус изменён администратором с "{old_label}"',
+                    )
+            if changed:
+                messages.success(request, f'Статус заказа обновлён: {order.get_status_display()}')
+            else:
+                messages.error(request, 'Статус заказа уже изменён другим пользователем.')
             return redirect('dashboard:order_detail', pk=pk)
 
     context = {
@@ -169,23 +151,12 @@ def order_detail(request, pk):
 
 @staff_required
 def products_list(request):
-    qs = Product.objects.select_related('category', 'brand').prefetch_related('images').order_by('-created_at')
-
-    search = request.GET.get('q', '').strip()
-    category_id = request.GET.get('category')
-    stock_filter = request.GET.get('stock')
-
-    if search:
-        qs = qs.filter(Q(name__icontains=search) | Q(sku__icontains=search))
-    if category_id:
-        qs = qs.filter(category_id=category_id)
-    if stock_filter == 'low':
-        qs = qs.filter(stock__lte=5)
-    elif stock_filter == 'out':
-        qs = qs.filter(stock=0)
+    qs, filters = filter_products(
+        Product.objects.select_related('category', 'brand').prefetch_related('images'), request.GET
+    )
 
-    from django.core.paginator import Paginator
-    paginator = Paginator(qs, 25)
+    count, is_estimate = count_rows(qs, estimate=not filters['q'])
+    paginator = CountedPaginator(qs, 25, count=count, estimated=is_estimate)
     page_obj = paginator.get_page(request.GET.get('page'))
 
     categories = Category.objects.filter(is_active=True, parent=None)
@@ -193,7 +164,8 @@ def products_list(request):
     context = {
         'page_obj': page_obj,
         'categories': categories,
-        'search': search,
+        'search': filters['q'],
+        'export_query': request.GET.urlencode(),
         'section': 'products',
     }
     return render(request, 'dashboard/products.html', context)
@@ -249,22 +221,117 @@ def product_update_stock(request, pk):
     return JsonResponse({'success': False}, status=405)
 
 
+@staff_required
+def products_bulk(request):
+    """Plan a bulk price/stock change from a feed or a rule, then preview it"""
+    feed_form = BulkFeedForm(prefix='feed')
+    rule_form = BulkRuleForm(prefix='rule')
+
+    if request.method == 'POST':
+        plan = None
+        try:
+            if request.POST.get('mode') == 'feed':
+                feed_form = BulkFeedForm(request.POST, request.FILES, prefix='feed')
+                if feed_form.is_valid():
+                    plan = plan_from_feed(feed_form.cleaned_data['feed'], feed_form.cleaned_data['fields'])
+            else:
+                rule_form = BulkRuleForm(request.POST, prefix='rule')
+                if rule_form.is_valid():
+                    data = rule_form.cleaned_data
+                    qs = Product.objects.all()
+                    scope = []
+                    if data['category']:
+                        qs = qs.filter(category__in=[data['category'], *data['category'].get_all_children()])
+                        scope.append(data['category'].name)
+                    if data['brand']:
+                        qs = qs.filter(brand=data['brand'])
+                        scope.append(data['brand'].name)
+                    field_label = dict(BulkRuleForm.FIELD_CHOICES)[data['field']]
+                    operation_label = dict(BulkRuleForm.OPERATION_CHOICES)[data['operation']]
+                    source = f"{field_label}: {operation_label} {data['amount']}"
+                    if data['ending']:
+                        source += f", окончание {data['ending']}"
+                    plan = plan_from_rule(
+                        qs, data['field'], data['operation'], data['amount'],
+                        ending=data['ending'] or None,
+                        source=f"{source} ({', '.join(scope) or 'все товары'})",
+                    )
+        except BulkUpdateError as exc:
+            messages.error(request, str(exc))
+        if plan is not None:
+            return redirect('dashboard:products_bulk_preview', token=plan['token'])
+
+    context = {
+        'feed_form': feed_form,
+        'rule_form': rule_form,
+        'section': 'products',
+    }
+    return render(request, 'dashboard/products_bulk.html', context)
+
+
+@staff_required
+def products_import(request):
+    """Upload a CSV/JSONL catalog; the import itself runs on the worker"""
+    form = ProductImportForm()
+    if request.method == 'POST':
+        form = ProductImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            job = ImportJob.objects.create(
+                file=form.cleaned_data['file'],
+                create_missing=form.cleaned_data['create_missing'],
+                created_by=request.user,
+            )
+            run_import.delay(job_id=job.pk)
+            messages.success(request, 'Импорт поставлен в очередь.')
+            return redirect('dashboard:products_import')
+
+    context = {
+        'form': form,
+        'jobs': ImportJob.objects.all()[:20],
+        'section': 'products',
+    }
+    return render(request, 'dashboard/products_import.html', context)
+
+
+@staff_required
+def products_import_status(request, pk):
+    job = get_object_or_404(ImportJob, pk=pk)
+    return JsonResponse({
+        'status': job.status,
+        'checkpoint': job.checkpoint,
+        'stats': job.stats,
+        'error': job.error,
+    })
+
+
+@staff_required
+def products_bulk_preview(request, token):
+    plan = get_plan(token)
+    if plan is None:
+        messages.error(request, 'План изменений устарел, сформируйте его заново.')
+        return redirect('dashboard:products_bulk')
+
+    if request.method == 'POST':
+        updated, skipped = apply_plan(plan)
+        messages.success(request, f'Обновлено товаров: {updated}.')
+        if skipped:
+            messages.warning(request, f'Пропущено {skipped}: товары изменились после предпросмотра.')
+        return redirect('dashboard:products')
+
+    context = {
+        'plan': plan,
+        'preview': plan['changes'][:PREVIEW_ROWS],
+        'section': 'products',
+    }
+    return render(request, 'dashboard/products_bulk_preview.html', context)
+
+
 # ── Users ──────────────────────────────────────────────────────────────────────
 
 @staff_required
 def users_list(request):
-    qs = User.objects.annotate(
-        orders_count=Count('orders'),
-        total_spent=Sum('orders__total'),
-    ).order_by('-created_at')
-
-    search = request.GET.get('q', '').strip()
-    if search:
-        qs = qs.filter(
-            Q(email__icontains=search) |
-            Q(first_name__icontains=search) |
-            Q(last_name__icontains=search)
-        )
+    # Totals come from the precomputed CustomerStats rows, not per-request aggregates
+    qs, filters = filter_users(User.objects.select_related('customer_stats'), request.GET)
 
     from django.core.paginator import Paginator
     paginator = Paginator(qs, 25)
@@ -272,7 +339,11 @@ def users_list(request):
 
     context = {
         'page_obj': page_obj,
-        'search': search,
+        'search': filters['q'],
+        'segment': filters['segment'],
+        'min_spent': filters['min_spent'],
+        'sort': filters['sort'],
+        'export_query': request.GET.urlencode(),
         'section': 'users',
     }
     return render(request, 'dashboard/users.html', context)
@@ -281,6 +352,7 @@ def users_list(request):
 @staff_required
 def user_detail(request, pk):
     user = get_object_or_404(User, pk=pk)
+    customer_stats = stats_for(user)
     orders = Order.objects.filter(user=user).order_by('-created_at')
     reviews = Review.objects.filter(user=user).select_related('product').order_by('-created_at')
 
@@ -297,7 +369,8 @@ def user_detail(request, pk):
         'profile_user': user,
         'orders': orders[:10],
         'reviews': reviews[:10],
-        'total_spent': orders.exclude(status='cancelled').aggregate(s=Sum('total'))['s'] or 0,
+        'customer_stats': customer_stats,
+        'total_spent': customer_stats.total_spent,
         'section': 'users',
     }
     return render(request, 'dashboard/user_detail.html', context)
@@ -315,41 +388,67 @@ def reviews_list(request):
     elif approved == '1':
         qs = qs.filter(is_approved=True)
 
-    from django.core.paginator import Paginator
-    paginator = Paginator(qs, 30)
+    # The pending counter is kept current by the moderation events
+    stats = get_kpi_snapshot()['stats']
+    pending_cached = events.current_counters(stats)['pending_reviews']
+    pending_count, _ = count_rows(Review.objects.filter(is_approved=False), cached=pending_cached)
+
+    count, is_estimate = count_rows(qs, cached=pending_count if approved == '0' else None)
+    paginator = CountedPaginator(qs, 30, count=count, estimated=is_estimate)
     page_obj = paginator.get_page(request.GET.get('page'))
 
     context = {
         'page_obj': page_obj,
-        'pending_count': Review.objects.filter(is_approved=False).count(),
+        'pending_count': pending_count,
         'section': 'reviews',
     }
     return render(request, 'dashboard/reviews.html', context)
 
 
+REVIEW_ACTION_RESULTS = {'approve': 'approved', 'reject': 'rejected', 'delete': 'deleted'}
+
+
 @staff_required
 def review_action(request, pk):
-    """Approve or delete review via AJAX POST"""
+    """Approve, reject or delete a single review via AJAX POST"""
     review = get_object_or_404(Review, pk=pk)
     action = request.POST.get('action')
+    if action not in MODERATION_ACTIONS:
+        return JsonResponse({'success': False}, status=400)
+
+    moderate_reviews(Review.objects.filter(pk=review.pk), action)
+    announce_pending_reviews.delay()
+    return JsonResponse({'success': True, 'action': REVIEW_ACTION_RESULTS[action]})
+
+
+@staff_required
+def reviews_bulk_action(request):
+    """
+    Moderate many reviews at once via AJAX POST: either the comma-separated
+    `ids`, or every pending review with `all_pending=1`.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False}, status=405)
+    action = request.POST.get('action')
+    if action not in MODERATION_ACTIONS:
+        return JsonResponse({'success': False}, status=400)
 
-    if action == 'approve':
-        review.is_approved = True
-        review.save()
-        review.product.update_rating()
-        return JsonResponse({'success': True, 'action': 'approved'})
-    elif action == 'reject':
-        review.is_approved = False
-        review.save()
-        review.product.update_rating()
-        return JsonResponse({'success': True, 'action': 'rejected'})
-    elif action == 'delete':
-        product = review.product
-        review.delete()
-        product.update_rating()
-        return JsonResponse({'success': True, 'action': 'deleted'})
-
-    return JsonResponse({'success': False}, status=400)
+    if request.POST.get('all_pending'):
+        reviews = Review.objects.filter(is_approved=False)
+    else:
+        ids = [i for i in request.POST.get('ids', '').split(',') if i.strip().isdigit()]
+        if not ids:
+            return JsonResponse({'success': False}, status=400)
+        reviews = Review.objects.filter(pk__in=ids)
+
+    changed, products = moderate_reviews(reviews, action)
+    announce_pending_reviews.delay()
+    return JsonResponse({
+        'success': True,
+        'action': REVIEW_ACTION_RESULTS[action],
+        'count': changed,
+        'products': products,
+    })
 
 
 # ── AI Chats ───────────────────────────────────────────────────────────────────
@@ -381,3 +480,69 @@ def chat_detail(request, pk):
         'section': 'chats',
     }
     return render(request, 'dashboard/chat_detail.html', context)
+
+
+# ── Exports ────────────────────────────────────────────────────────────────────
+
+EXPORT_BLOCK_SIZE = 256 * 1024
+
+@staff_required
+def export_view(request, dataset):
+    """Stream the filtered list as CSV/XLSX, or queue it as a background job"""
+    fmt = request.GET.get('format', 'csv')
+    if dataset not in exports.DATASETS or fmt not in exports.FORMATS:
+        raise Http404
+
+    if request.GET.get('background'):
+        params = {
+            key: value for key, value in request.GET.items()
+            if key not in ('format', 'background', 'page')
+        }
+        job = ExportJob.objects.create(
+            dataset=dataset, format=fmt, params=params, created_by=request.user
+        )
+        run_export.delay(job_id=job.pk)
+        messages.success(request, 'Экспорт поставлен в очередь.')
+        return redirect('dashboard:exports')
+
+    response = StreamingHttpResponse(
+        exports.export_chunks(dataset, fmt, request.GET),
+        content_type=exports.FORMATS[fmt][0],
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{exports.export_filename(dataset, fmt)}"'
+    )
+    return response
+
+
+@staff_required
+def exports_list(request):
+    context = {
+        'jobs': ExportJob.objects.all()[:50],
+        'section': 'exports',
+    }
+    return render(request, 'dashboard/exports.html', context)
+
+
+@staff_required
+def export_status(request, pk):
+    job = get_object_or_404(ExportJob, pk=pk)
+    return JsonResponse({
+        'status': job.status,
+        'rows': job.rows,
+        'error': job.error,
+        'download_url': (
+            reverse('dashboard:export_download', args=[job.pk])
+            if job.status == ExportJob.Status.DONE else None
+        ),
+    })
+
+
+@staff_required
+def export_download(request, pk):
+    job = get_object_or_404(ExportJob, pk=pk, status=ExportJob.Status.DONE)
+    file = job.file.open('rb')
+    response = FileResponse(file, as_attachment=True, filename=job.file.name.rsplit('/', 1)[-1])
+    # FileResponse streams a sync iterator, which ASGI reads into memory whole first
+    response.streaming_content = exports.async_chunks(iter(lambda: file.read(EXPORT_BLOCK_SIZE), b''))
+    return response
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Order, OrderItem, OrderStatusHistory
+from .models import Order, OrderItem, OrderStatusHistory, StockReservation
 
 
 class OrderItemInline(admin.TabularInline):
@@ -21,4 +21,11 @@ class OrderAdmin(admin.ModelAdmin):
     search_fields = ('order_number', 'user__email', 'full_name')
     readonly_fields = ('order_number', 'created_at', 'updated_at')
     inlines = [OrderItemInline, OrderStatusHistoryInline]
-    list_editable = ('status',)
\ No newline at end of file
+    list_editable = ('status',)
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ('product', 'cart', 'quantity', 'expires_at')
+    list_filter = ('expires_at',)
+    raw_id_fields = ('product', 'cart')
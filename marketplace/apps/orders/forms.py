@@ -29,4 +29,5 @@ class CheckoutForm(forms.Form):
     comment = forms.CharField(
         required=False, label='Комментарий к заказу',
         widget=forms.Textarea(attrs={'rows': 3, 'placeholder': 'Дополнительная информация...'})
-    )
\ No newline at end of file
+    )
+    idempotency_key = forms.UUIDField(required=False, widget=forms.HiddenInput)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.orders.services import release_expired_reservations
+
+
+class Command(BaseCommand):
+    help = 'Delete checkout stock reservations whose TTL has passed'
+
+    def handle(self, *args, **options):
+        deleted = release_expired_reservations()
+        self.stdout.write(f'Released {deleted} expired reservations.')
@@ -0,0 +1,102 @@
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from apps.cart.models import Cart, CartItem
+from apps.orders.models import Order
+from apps.orders.services import place_order, OutOfStockError
+from apps.products.models import Category, Product
+from apps.users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Run parallel checkouts against one low-stock product and verify nothing is oversold'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=50)
+        parser.add_argument('--stock', type=int, default=10)
+        parser.add_argument('--quantity', type=int, default=1, help='Units per buyer')
+        parser.add_argument('--keep', action='store_true', help='Keep generated data')
+
+    def handle(self, *args, **options):
+        buyers, stock, quantity = options['buyers'], options['stock'], options['quantity']
+        tag = uuid.uuid4().hex[:8]
+
+        category = Category.objects.create(name=f'stress-{tag}', slug=f'stress-{tag}')
+        product = Product.objects.create(
+            name=f'Stress product {tag}', category=category, description='stress test',
+            price=Decimal('1500.00'), stock=stock, sku=f'STRESS-{tag}',
+        )
+        users = [
+            User.objects.create(username=f'stress-{tag}-{i}', email=f'stress-{tag}-{i}@example.com')
+            for i in range(buyers)
+        ]
+        carts = []
+        for user in users:
+            cart = Cart.objects.create(user=user)
+            CartItem.objects.create(cart=cart, product=product, quantity=quantity)
+            carts.append(cart)
+
+        data = {
+            'full_name': 'Stress Test', 'email': 'stress@example.com', 'phone': '0',
+            'address': '-', 'city': '-', 'postal_code': '0', 'comment': '',
+        }
+        barrier = threading.Barrier(buyers)
+        results = {'placed': 0, 'rejected': 0, 'errors': []}
+        lock = threading.Lock()
+
+        def buyer(user, cart):
+            try:
+                barrier.wait()
+                place_order(user, cart, data)
+                outcome = 'placed'
+            except OutOfStockError:
+                outcome = 'rejected'
+            except Exception as e:
+                with lock:
+                    results['errors'].append(repr(e))
+                return
+            finally:
+                connection.close()
+            with lock:
+                results[outcome] += 1
+
+        threads = [threading.Thread(target=buyer, args=pair) for pair in zip(users, carts)]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+
+        product.refresh_from_db()
+        sold = Order.objects.filter(items__product=product).count() * quantity
+        expected = min(buyers, stock // quantity)
+
+        self.stdout.write(
+            f"{buyers} buyers in {elapsed:.2f}s: placed={results['placed']} "
+            f"rejected={results['rejected']} errors={len(results['errors'])} "
+            f"stock {stock} -> {product.stock}"
+        )
+        for error in results['errors'][:5]:
+            self.stderr.write(error)
+
+        ok = (
+            not results['errors']
+            and results['placed'] == expected
+            and product.stock == stock - sold
+        )
+
+        if not options['keep']:
+            Order.objects.filter(user__in=users).delete()
+            User.objects.filter(pk__in=[u.pk for u in users]).delete()
+            product.delete()
+            category.delete()
+
+        if not ok:
+            raise CommandError(f'Stock mismatch: sold {sold}, expected {expected}, left {product.stock}')
+        self.stdout.write(self.style.SUCCESS('No oversell detected.'))
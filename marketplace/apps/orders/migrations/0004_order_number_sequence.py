@@ -0,0 +1,29 @@
+from django.db import migrations
+
+SEQUENCE_NAME = 'orders_order_number_seq'
+SERIAL_START = 10 ** 10
+
+
+def create_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'CREATE SEQUENCE IF NOT EXISTS {SEQUENCE_NAME} START WITH {SERIAL_START} CACHE 1'
+    )
+
+
+def drop_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP SEQUENCE IF EXISTS {SEQUENCE_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_stockreservation'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_sequence, drop_sequence),
+    ]
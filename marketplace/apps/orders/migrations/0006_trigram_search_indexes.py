@@ -0,0 +1,33 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+from django.db.models.functions import Upper
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('orders', '0005_order_idempotency_key'),
+        ('products', '0003_trigram_search_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='order',
+            index=GinIndex(OpClass(Upper('order_number'), name='gin_trgm_ops'), name='orders_order_order_number_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='order',
+            index=GinIndex(OpClass(Upper('full_name'), name='gin_trgm_ops'), name='orders_order_full_name_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='order',
+            index=GinIndex(OpClass(Upper('phone'), name='gin_trgm_ops'), name='orders_order_phone_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='order',
+            index=GinIndex(OpClass(Upper('email'), name='gin_trgm_ops'), name='orders_order_email_trgm'),
+        ),
+    ]
@@ -1,6 +1,9 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
+from django.db.models.functions import Upper
 from apps.users.models import User
 from apps.products.models import Product
+from apps.cart.models import Cart
 import uuid
 
 
@@ -39,20 +42,29 @@ class Order(models.Model):
     shipped_at = models.DateTimeField(null=True, blank=True)
     delivered_at = models.DateTimeField(null=True, blank=True)
 
+    # Checkout form token: replays of the same submission map back to this order
+    idempotency_key = models.UUIDField(null=True, blank=True, unique=True, editable=False)
+
     class Meta:
         verbose_name = 'Заказ'
         verbose_name_plural = 'Заказы'
         ordering = ['-created_at']
-        indexes = [models.Index(fields=['user', 'status'])]
+        indexes = [
+            models.Index(fields=['user', 'status']),
+            # Staff search (apps.dashboard.search): icontains runs as UPPER(col) LIKE
+            GinIndex(OpClass(Upper('order_number'), name='gin_trgm_ops'), name='orders_order_order_number_trgm'),
+            GinIndex(OpClass(Upper('full_name'), name='gin_trgm_ops'), name='orders_order_full_name_trgm'),
+            GinIndex(OpClass(Upper('phone'), name='gin_trgm_ops'), name='orders_order_phone_trgm'),
+            GinIndex(OpClass(Upper('email'), name='gin_trgm_ops'), name='orders_order_email_trgm'),
+        ]
 
     def __str__(self):
         return f"Заказ #{self.order_number}"
 
     def save(self, *args, **kwargs):
         if not self.order_number:
-            import random
-            import string
-            self.order_number = ''.join(random.choices(string.digits, k=10))
+            from .numbering import allocate_order_number
+            self.order_number = allocate_order_number()
         super().save(*args, **kwargs)
 
     def get_status_color(self):
@@ -94,4 +106,22 @@ class OrderStatusHistory(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
 
     class Meta:
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+
+
+class StockReservation(models.Model):
+    """Soft hold on stock while a buyer is on the checkout page"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Резерв товара'
+        verbose_name_plural = 'Резервы товаров'
+        unique_together = ('cart', 'product')
+        indexes = [models.Index(fields=['product', 'expires_at'])]
+
+    def __str__(self):
+        return f"{self.product_id} x{self.quantity} до {self.expires_at:%H:%M}"
@@ -0,0 +1,241 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Order, OrderItem, StockReservation
+from .tasks import on_order_placed, on_order_status_changed
+from apps.products.models import Product
+
+
+FREE_DELIVERY_FROM = 1000
+DELIVERY_COST = 299
+
+
+class OutOfStockError(Exception):
+    """Raised when the cart asks for more than is left on the shelf"""
+
+    def __init__(self, shortages):
+        # shortages: list of (product, requested, available)
+        self.shortages = shortages
+        names = ', '.join(p.name for p, _, _ in shortages)
+        super().__init__(f'Недостаточно товара на складе: {names}')
+
+
+class _StockConflict(Exception):
+    pass
+
+
+def calculate_delivery(subtotal):
+    return 0 if subtotal >= FREE_DELIVERY_FROM else DELIVERY_COST
+
+
+def _stock_delta(quantities, sign):
+    """CASE expression shifting every product's stock by its own quantity"""
+    return Case(
+        *[When(pk=pk, then=F('stock') + sign * qty) for pk, qty in quantities.items()],
+        default=F('stock'),
+        output_field=IntegerField(),
+    )
+
+
+def _held_by_others(cart):
+    """Subquery: units of the outer product held by other carts' active reservations"""
+    held = (
+        StockReservation.objects
+        .filter(product=OuterRef('pk'), expires_at__gt=timezone.now())
+        .exclude(cart=cart)
+        .values('product')
+        .annotate(total=Sum('quantity'))
+        .values('total')
+    )
+    return Coalesce(Subquery(held), 0, output_field=IntegerField())
+
+
+def decrement_stock(quantities, cart=None):
+    """
+    Take {product_id: quantity} off the shelf in a single conditional UPDATE.
+    Rows without enough stock are left untouched, so the caller compares the
+    row count and rolls back: concurrent checkouts can never oversell.
+    Units reserved by other carts are treated as unavailable.
+    """
+    if not quantities:
+        return True  # an empty Q() would match, and update, every product
+    held = _held_by_others(cart)
+    condition = Q()
+    for pk, qty in quantities.items():
+        condition |= Q(pk=pk, stock__gte=held + Value(qty))
+    updated = Product.objects.filter(condition).update(stock=_stock_delta(quantities, -1))
+    return updated == len(quantities)
+
+
+def increment_stock(quantities):
+    if quantities:
+        Product.objects.filter(pk__in=quantities).update(stock=_stock_delta(quantities, 1))
+
+
+def find_shortages(quantities, cart=None):
+    products = (
+        Product.objects.filter(pk__in=quantities)
+        .annotate(held=_held_by_others(cart))
+        .only('id', 'name', 'stock')
+    )
+    shortages = []
+    for p in products:
+        available = max(p.stock - p.held, 0)
+        if available < quantities[p.pk]:
+            shortages.append((p, quantities[p.pk], available))
+    return shortages
+
+
+def reserve_cart(cart):
+    """
+    Hold the cart's quantities for STOCK_RESERVATION_TTL seconds.
+    Each product is held up to what other carts haven't already reserved.
+    Returns a list of (product, requested, held) for items that could not be
+    fully held. Four queries whatever the cart size.
+
+    The product rows are locked (in pk order, so concurrent carts can't
+    deadlock) before availability is read, so two checkouts can't both hold
+    the last unit. Renewing a hold keeps its expiry: reloading the page
+    doesn't hold stock past STOCK_RESERVATION_TTL.
+    """
+    items = [item for item in cart.items.all() if item.quantity > 0]
+    quantities = {item.product_id: item.quantity for item in items}
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=settings.STOCK_RESERVATION_TTL)
+
+    with transaction.atomic():
+        list(Product.objects.select_for_update().filter(pk__in=quantities).order_by('pk').values_list('pk'))
+        # Read after the lock, so holds committed while waiting for it are seen
+        products = Product.objects.filter(pk__in=quantities).annotate(held=_held_by_others(cart))
+        holds, shortages = [], []
+        for p in products:
+            requested = quantities[p.pk]
+            available = max(p.stock - p.held, 0)
+            if available < requested:
+                shortages.append((p, requested, available))
+            if available:
+                holds.append(StockReservation(
+                    cart=cart, product=p, quantity=min(requested, available), expires_at=expires_at
+                ))
+
+        # Expired holds start over with a fresh expiry; live ones keep theirs
+        cart.reservations.filter(
+            ~Q(product__in=[h.product_id for h in holds]) | Q(expires_at__lte=now)
+        ).delete()
+        StockReservation.objects.bulk_create(
+            holds,
+            update_conflicts=True,
+            unique_fields=['cart', 'product'],
+            update_fields=['quantity'],
+        )
+    return shortages
+
+
+def release_cart(cart):
+    cart.reservations.all().delete()
+
+
+def release_expired_reservations():
+    deleted, _ = StockReservation.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
+
+
+def find_submitted_order(user, idempotency_key):
+    if not idempotency_key:
+        return None
+    return Order.objects.filter(user=user, idempotency_key=idempotency_key).first()
+
+
+def place_order(user, cart, data, idempotency_key=None):
+    """
+    Turn the cart into an order.
+    Runs a fixed number of queries whatever the cart size; raises
+    OutOfStockError (with nothing written) if any item can't be covered.
+    A replay of an idempotency_key that is already being placed waits on the
+    unique index and returns the original order instead of a duplicate.
+    """
+    items = [item for item in cart.items.select_related('product') if item.quantity > 0]
+    quantities = {item.product_id: item.quantity for item in items}
+
+    subtotal = sum(item.get_total_price() for item in items)
+    delivery = calculate_delivery(subtotal)
+
+    try:
+        with transaction.atomic():
+            order = Order.objects.create(
+                user=user,
+                full_name=data['full_name'],
+                email=data['email'],
+                phone=data['phone'],
+                address=data['address'],
+                city=data['city'],
+                postal_code=data['postal_code'],
+                comment=data.get('comment', ''),
+                subtotal=subtotal,
+                delivery_cost=delivery,
+                total=subtotal + delivery,
+                idempotency_key=idempotency_key,
+            )
+            OrderItem.objects.bulk_create([
+                OrderItem(
+                    order=order,
+                    product=item.product,
+                    product_name=item.product.name,
+                    product_sku=item.product.sku,
+                    price=item.product.price,
+                    quantity=item.quantity,
+                )
+                for item in items
+            ])
+            if not decrement_stock(quantities, cart):
+                raise _StockConflict
+
+            # The cart is cleared here so the buyer never sees it refilled;
+            # everything else happens in the background pipeline.
+            cart.items.all().delete()
+            release_cart(cart)
+            on_order_placed(order)
+    except _StockConflict:
+        raise OutOfStockError(find_shortages(quantities, cart))
+    except IntegrityError:
+        order = find_submitted_order(user, idempotency_key)
+        if order is None:
+            raise
+
+    return order
+
+
+def cancel_order(order, user, comment='Отменён пользователем'):
+    """
+    Cancel a pending/paid order and put its items back on the shelf.
+    The order row is locked while its status flips, so a double submit can't
+    restore the same stock twice. Returns False if the order can't be cancelled.
+    """
+    with transaction.atomic():
+        # Lock the row so the status we move away from is the one we replace
+        old_status = (
+            Order.objects.select_for_update()
+            .filter(pk=order.pk, status__in=(Order.Status.PENDING, Order.Status.PAID))
+            .values_list('status', flat=True)
+            .first()
+        )
+        if old_status is None:
+            return False
+        Order.objects.filter(pk=order.pk).update(
+            status=Order.Status.CANCELLED, updated_at=timezone.now()
+        )
+
+        quantities = defaultdict(int)
+        for product_id, qty in order.items.values_list('product_id', 'quantity'):
+            quantities[product_id] += qty
+        increment_stock(quantities)
+
+        order.status = Order.Status.CANCELLED
+        on_order_status_changed(order, old_status, user_id=user.pk, comment=comment)
+    return True
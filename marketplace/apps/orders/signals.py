@@ -0,0 +1,10 @@
+from django.dispatch import Signal
+
+# Both are sent inside the transaction that changes the order, so receivers
+# should only queue background work (which then commits atomically with it).
+
+# kwargs: order
+order_placed = Signal()
+
+# kwargs: order, old_status, new_status
+order_status_changed = Signal()
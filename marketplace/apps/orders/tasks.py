@@ -0,0 +1,25 @@
+from apps.recommendations.tasks import refresh_recommendations
+from .models import OrderStatusHistory
+from .signals import order_placed, order_status_changed
+
+
+def record_status_change(order, user_id=None, comment=''):
+    # The audit trail is written with the change itself, in its transaction
+    OrderStatusHistory.objects.create(
+        order=order, status=order.status, comment=comment, created_by_id=user_id
+    )
+
+
+def on_order_placed(order):
+    """Record the order's first status and queue the post-order pipeline; each step retries on its own"""
+    record_status_change(order, user_id=order.user_id)
+    refresh_recommendations.delay(user_id=order.user_id)
+    order_placed.send(sender=order.__class__, order=order)
+
+
+def on_order_status_changed(order, old_status, user_id=None, comment=''):
+    """Record the change and queue its pipeline; call inside the transaction that flips the status"""
+    record_status_change(order, user_id=user_id, comment=comment)
+    order_status_changed.send(
+        sender=order.__class__, order=order, old_status=old_status, new_status=order.status
+    )
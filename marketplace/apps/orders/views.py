@@ -1,14 +1,24 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db import transaction
-from .models import Order, OrderItem, OrderStatusHistory
+from django.conf import settings
+import uuid
+from .models import Order
 from .forms import CheckoutForm
+from .services import (
+    place_order, cancel_order, calculate_delivery, reserve_cart, find_submitted_order, OutOfStockError,
+)
 from apps.cart.services import get_or_create_cart
 
 
 @login_required
 def checkout_view(request):
+    if request.method == 'POST':
+        # Double submit or replayed POST: answer with the order already placed
+        order = find_submitted_order(request.user, _idempotency_key(request))
+        if order:
+            return redirect('orders:success', pk=order.pk)
+
     cart = get_or_create_cart(request)
     items = cart.items.select_related('product').prefetch_related('product__images')
 
@@ -19,45 +29,18 @@ def checkout_view(request):
     if request.method == 'POST':
         form = CheckoutForm(request.POST)
         if form.is_valid():
-            with transaction.atomic():
-                subtotal = cart.get_total_price()
-                delivery = 0 if subtotal >= 1000 else 299
-                total = subtotal + delivery
-
-                order = Order.objects.create(
-                    user=request.user,
-                    full_name=form.cleaned_data['full_name'],
-                    email=form.cleaned_data['email'],
-                    phone=form.cleaned_data['phone'],
-                    address=form.cleaned_data['address'],
-                    city=form.cleaned_data['city'],
-                    postal_code=form.cleaned_data['postal_code'],
-                    comment=form.cleaned_data.get('comment', ''),
-                    subtotal=subtotal,
-                    delivery_cost=delivery,
-                    total=total,
+            try:
+                order = place_order(
+                    request.user, cart, form.cleaned_data,
+                    idempotency_key=form.cleaned_data.get('idempotency_key'),
                 )
-
-                for item in items:
-                    OrderItem.objects.create(
-                        order=order,
-                        product=item.product,
-                        product_name=item.product.name,
-                        product_sku=item.product.sku,
-                        price=item.product.price,
-                        quantity=item.quantity,
+            except OutOfStockError as e:
+                for product, requested, available in e.shortages:
+                    messages.error(
+                        request,
+                        f'«{product.name}»: в наличии только {available} шт., в корзине {requested}.'
                     )
-                    # Reduce stock
-                    item.product.__class__.objects.filter(pk=item.product.pk).update(
-                        stock=item.product.stock - item.quantity
-                    )
-
-                OrderStatusHistory.objects.create(
-                    order=order, status=order.status, created_by=request.user
-                )
-
-                # Clear cart
-                cart.items.all().delete()
+                return redirect('cart:cart')
 
             messages.success(request, f'Заказ #{order.order_number} успешно оформлен!')
             return redirect('orders:success', pk=order.pk)
@@ -68,11 +51,19 @@ def checkout_view(request):
             'phone': request.user.phone,
             'address': request.user.address,
             'city': request.user.city,
+            'idempotency_key': uuid.uuid4(),
         }
         form = CheckoutForm(initial=initial)
 
+        # Hold stock while the buyer fills in the form
+        for product, requested, held in reserve_cart(cart):
+            messages.warning(
+                request,
+                f'«{product.name}»: доступно только {held} шт. из {requested} — остальное уже в резерве.'
+            )
+
     subtotal = cart.get_total_price()
-    delivery = 0 if subtotal >= 1000 else 299
+    delivery = calculate_delivery(subtotal)
 
     return render(request, 'orders/checkout.html', {
         'form': form,
@@ -80,9 +71,17 @@ def checkout_view(request):
         'subtotal': subtotal,
         'delivery': delivery,
         'total': subtotal + delivery,
+        'reservation_minutes': settings.STOCK_RESERVATION_TTL // 60,
     })
 
 
+def _idempotency_key(request):
+    try:
+        return uuid.UUID(request.POST.get('idempotency_key', ''))
+    except ValueError:
+        return None
+
+
 @login_required
 def order_success_view(request, pk):
     order = get_object_or_404(Order, pk=pk, user=request.user)
@@ -107,18 +106,7 @@ def order_detail_view(request, pk):
 @login_required
 def cancel_order_view(request, pk):
     order = get_object_or_404(Order, pk=pk, user=request.user)
-    if order.status in (Order.Status.PENDING, Order.Status.PAID):
-        order.status = Order.Status.CANCELLED
-        order.save()
-        OrderStatusHistory.objects.create(
-            order=order, status=Order.Status.CANCELLED,
-            comment='Отменён пользователем', created_by=request.user
-        )
-        # Restore stock
-        for item in order.items.all():
-            item.product.__class__.objects.filter(pk=item.product.pk).update(
-                stock=item.product.stock + item.quantity
-            )
+    if cancel_order(order, request.user):
         messages.success(request, 'Заказ отменён.')
     else:
         messages.error(request, 'Невозможно отменить этот заказ.')
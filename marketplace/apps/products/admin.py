@@ -1,5 +1,7 @@
 from django.contrib import admin
 from .models import Category, Brand, Product, ProductImage, Attribute, ProductAttribute, Review
+from .services import moderate_reviews
+from .tasks import update_product_ratings
 
 
 @admin.register(Category)
@@ -42,10 +44,28 @@ class ReviewAdmin(admin.ModelAdmin):
     list_display = ('product', 'user', 'rating', 'is_approved', 'created_at')
     list_filter = ('rating', 'is_approved')
     list_editable = ('is_approved',)
-    actions = ['approve_reviews']
+    actions = ['approve_reviews', 'reject_reviews']
+
+    def _moderate(self, request, queryset, action, verb):
+        changed, products = moderate_reviews(queryset, action)
+        self.message_user(request, f'{verb}: {changed}. Рейтинг будет пересчитан у товаров: {products}.')
 
     def approve_reviews(self, request, queryset):
-        queryset.update(is_approved=True)
-        for review in queryset:
-            review.product.update_rating()
-    approve_reviews.short_description = 'Одобрить выбранные отзывы'
\ No newline at end of file
+        self._moderate(request, queryset, 'approve', 'Одобрено отзывов')
+    approve_reviews.short_description = 'Одобрить выбранные отзывы'
+
+    def reject_reviews(self, request, queryset):
+        self._moderate(request, queryset, 'reject', 'Снято с публикации')
+    reject_reviews.short_description = 'Снять с публикации выбранные отзывы'
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        update_product_ratings.delay(product_ids=[obj.product_id])
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        update_product_ratings.delay(product_ids=[obj.product_id])
+
+    def delete_queryset(self, request, queryset):
+        # Used by the built-in "delete selected" action
+        moderate_reviews(queryset, 'delete')
\ No newline at end of file
@@ -125,6 +125,16 @@ UI_TRANSLATIONS = {
     'user': 'Пользователь',
     'spent': 'Потрачено',
     'registered': 'Зарегистрирован',
+    'avg_basket': 'Средний чек',
+    'last_order': 'Последний заказ',
+    'sort_newest_users': 'Новые',
+    'sort_by_spent': 'По сумме покупок',
+    'sort_by_orders': 'По числу заказов',
+    'sort_by_basket': 'По среднему чеку',
+    'sort_by_last_order': 'По дате заказа',
+    'buyers': 'Покупатели',
+    'no_orders': 'Без заказов',
+    'spent_from': 'Потрачено от, ₸',
     'status': 'Статус',
     'staff': 'Персонал',
     'active': 'Активен',
@@ -137,6 +147,13 @@ UI_TRANSLATIONS = {
     'buyer': 'Покупатель',
     'sum': 'Сумма',
     'date': 'Дата',
+    'export': 'Экспорт',
+    'exports': 'Экспорты',
+    'export_background': 'В фоне',
+    'export_background_hint': 'Большие выгрузки готовятся в фоне и появятся на странице экспортов',
+    'export_data': 'Данные',
+    'export_rows': 'Строк',
+    'download': 'Скачать',
     'all': 'Все',
     'date_from': 'Дата от',
     'date_to': 'Дата до',
@@ -161,7 +178,11 @@ UI_TRANSLATIONS = {
     'pending_reviews_alert': 'отзывов на модерации →',
     'low_stock_alert': 'товаров заканчивается →',
     'revenue_14_days': 'Выручка за 14 дней',
+    'revenue_chart': 'Выручка',
+    'days_short': 'дн.',
     'order_statuses': 'Статусы заказов',
+    'stats_updated': 'Данные обновлены',
+    'ago': 'назад',
     'recent_orders': 'Последние заказы',
     'all_link': 'Все →',
     'top_products': 'Топ товаров',
@@ -178,6 +199,11 @@ UI_TRANSLATIONS = {
     'delete': '🗑 Удалить',
     'reviews_empty': 'Отзывов нет',
     'delete_review_confirm': 'Удалить отзыв?',
+    'select_all': 'Выбрать все',
+    'selected_word': 'выбрано',
+    'approve_all_pending': '✅ Одобрить все ожидающие',
+    'approve_all_pending_confirm': 'Одобрить все отзывы на модерации?',
+    'delete_reviews_confirm': 'Удалить выбранные отзывы?',
     'session': 'Сессия',
     'messages_count': 'Сообщений',
     'updated': 'Обновлён',
@@ -201,6 +227,39 @@ UI_TRANSLATIONS = {
     'total_lower': 'всего',
     'orders_empty_short': 'Заказов нет',
     'add_product': 'Добавить товар',
+    'bulk_update': 'Массовое обновление',
+    'bulk_from_feed': 'Из файла поставщика',
+    'bulk_feed_hint': 'CSV (разделитель , или ;) или JSON с колонкой sku и любыми из price, old_price, stock. Пустые ячейки не меняют значение.',
+    'bulk_by_rule': 'По правилу',
+    'bulk_rule_hint': 'Например: +10% к ценам категории с округлением до 990.',
+    'preview_changes': 'Предпросмотр изменений',
+    'apply_changes': 'Применить изменения',
+    'will_change': 'Изменится',
+    'unchanged_word': 'Без изменений',
+    'errors_word': 'Ошибки',
+    'increase': 'рост',
+    'decrease': 'снижение',
+    'was_word': 'Было',
+    'becomes_word': 'Станет',
+    'row_word': 'Строка',
+    'shown_first': 'Показаны первые',
+    'plan_expires': 'План хранится 30 минут.',
+    'apply_confirm': 'Применить изменения к товарам?',
+    'live_new_order': 'Новый заказ',
+    'live_order_status': 'Статус заказа',
+    'live_low_stock': 'Заканчивается на складе',
+    'live_new_orders': 'Новых заказов с момента загрузки',
+    'live_refresh': 'Обновить',
+    'import_products': 'Импорт товаров',
+    'import_hint': 'CSV или JSON Lines: sku, name, category, brand, price, old_price, stock, description; колонки attr:<Название> — характеристики, images — ссылки через |. Существующие артикулы пропускаются.',
+    'start_import': 'Начать импорт',
+    'file_word': 'Файл',
+    'import_progress': 'Ход импорта',
+    'rows_done': 'Обработано',
+    'created_word': 'Создано',
+    'skipped_word': 'Пропущено',
+    'images_word': 'Фото',
+    'rows_per_second': 'строк/с',
     'product_info': 'Информация о товаре',
     'product_description': 'Описание товара',
     'product_media_settings': 'Фото и настройки',
@@ -360,6 +419,16 @@ UI_TRANSLATIONS = {
     'user': 'Пайдаланушы',
     'spent': 'Жұмсалды',
     'registered': 'Тіркелген',
+    'avg_basket': 'Орташа чек',
+    'last_order': 'Соңғы тапсырыс',
+    'sort_newest_users': 'Жаңалар',
+    'sort_by_spent': 'Сатып алу сомасы бойынша',
+    'sort_by_orders': 'Тапсырыс саны бойынша',
+    'sort_by_basket': 'Орташа чек бойынша',
+    'sort_by_last_order': 'Тапсырыс күні бойынша',
+    'buyers': 'Сатып алушылар',
+    'no_orders': 'Тапсырыссыз',
+    'spent_from': 'Жұмсалғаны, ₸ бастап',
     'status': 'Статус',
     'staff': 'Қызметкер',
     'active': 'Белсенді',
@@ -372,6 +441,13 @@ UI_TRANSLATIONS = {
     'buyer': 'Сатып алушы',
     'sum': 'Сома',
     'date': 'Күн',
+    'export': 'Экспорт',
+    'exports': 'Экспорттар',
+    'export_background': 'Фонда',
+    'export_background_hint': 'Үлкен экспорттар фонда дайындалып, экспорттар бетінде пайда болады',
+    'export_data': 'Деректер',
+    'export_rows': 'Жолдар',
+    'download': 'Жүктеу',
     'all': 'Барлығы',
     'date_from': 'Күннен',
     'date_to': 'Күнге дейін',
@@ -396,7 +472,11 @@ UI_TRANSLATIONS = {
     'pending_reviews_alert': 'пікір модерацияда →',
     'low_stock_alert': 'тауар таусылып келеді →',
     'revenue_14_days': '14 күндегі табыс',
+    'revenue_chart': 'Табыс',
+    'days_short': 'күн',
     'order_statuses': 'Тапсырыс статустары',
+    'stats_updated': 'Деректер жаңартылды',
+    'ago': 'бұрын',
     'recent_orders': 'Соңғы тапсырыстар',
     'all_link': 'Барлығы →',
     'top_products': 'Үздік тауарлар',
@@ -413,6 +493,11 @@ UI_TRANSLATIONS = {
     'delete': '🗑 Жою',
     'reviews_empty': 'Пікірлер жоқ',
     'delete_review_confirm': 'Пікірді жою керек пе?',
+    'select_all': 'Барлығын таңдау',
+    'selected_word': 'таңдалды',
+    'approve_all_pending': '✅ Күтудегілердің барлығын мақұлдау',
+    'approve_all_pending_confirm': 'Модерациядағы барлық пікірді мақұлдау керек пе?',
+    'delete_reviews_confirm': 'Таңдалған пікірлерді жою керек пе?',
     'session': 'Сессия',
     'messages_count': 'Хабарламалар',
     'updated': 'Жаңартылды',
@@ -436,6 +521,39 @@ UI_TRANSLATIONS = {
     'total_lower': 'барлығы',
     'orders_empty_short': 'Тапсырыс жоқ',
     'add_product': 'Тауар қосу',
+    'bulk_update': 'Жаппай жаңарту',
+    'bulk_from_feed': 'Жеткізуші файлынан',
+    'bulk_feed_hint': 'sku бағаны және price, old_price, stock бағандарының кез келгені бар CSV (бөлгіш , немесе ;) немесе JSON. Бос ұяшықтар мәнді өзгертпейді.',
+    'bulk_by_rule': 'Ереже бойынша',
+    'bulk_rule_hint': 'Мысалы: санат бағаларына +10%, 990-ға дейін дөңгелектеу.',
+    'preview_changes': 'Өзгерістерді алдын ала қарау',
+    'apply_changes': 'Өзгерістерді қолдану',
+    'will_change': 'Өзгереді',
+    'unchanged_word': 'Өзгеріссіз',
+    'errors_word': 'Қателер',
+    'increase': 'өсу',
+    'decrease': 'төмендеу',
+    'was_word': 'Болды',
+    'becomes_word': 'Болады',
+    'row_word': 'Жол',
+    'shown_first': 'Алғашқылары көрсетілген',
+    'plan_expires': 'Жоспар 30 минут сақталады.',
+    'apply_confirm': 'Өзгерістерді тауарларға қолдану керек пе?',
+    'live_new_order': 'Жаңа тапсырыс',
+    'live_order_status': 'Тапсырыс мәртебесі',
+    'live_low_stock': 'Қоймада таусылып барады',
+    'live_new_orders': 'Бет жүктелгеннен бергі жаңа тапсырыстар',
+    'live_refresh': 'Жаңарту',
+    'import_products': 'Тауарларды импорттау',
+    'import_hint': 'CSV немесе JSON Lines: sku, name, category, brand, price, old_price, stock, description; attr:<Атауы> бағандары — сипаттамалар, images — | арқылы сілтемелер. Бар артикулдар өткізіліп жіберіледі.',
+    'start_import': 'Импортты бастау',
+    'file_word': 'Файл',
+    'import_progress': 'Импорт барысы',
+    'rows_done': 'Өңделді',
+    'created_word': 'Құрылды',
+    'skipped_word': 'Өткізілді',
+    'images_word': 'Фото',
+    'rows_per_second': 'жол/с',
     'product_info': 'Тауар туралы ақпарат',
     'product_description': 'Тауар сипаттамасы',
     'product_media_settings': 'Фото және баптаулар',
@@ -595,6 +713,16 @@ UI_TRANSLATIONS = {
     'user': 'User',
     'spent': 'Spent',
     'registered': 'Registered',
+    'avg_basket': 'Avg. basket',
+    'last_order': 'Last order',
+    'sort_newest_users': 'Newest',
+    'sort_by_spent': 'By amount spent',
+    'sort_by_orders': 'By orders',
+    'sort_by_basket': 'By avg. basket',
+    'sort_by_last_order': 'By last order',
+    'buyers': 'Buyers',
+    'no_orders': 'No orders',
+    'spent_from': 'Spent from, ₸',
     'status': 'Status',
     'staff': 'Staff',
     'active': 'Active',
@@ -607,6 +735,13 @@ UI_TRANSLATIONS = {
     'buyer': 'Buyer',
     'sum': 'Amount',
     'date': 'Date',
+    'export': 'Export',
+    'exports': 'Exports',
+    'export_background': 'In background',
+    'export_background_hint': 'Large exports are prepared in the background and appear on the exports page',
+    'export_data': 'Data',
+    'export_rows': 'Rows',
+    'download': 'Download',
     'all': 'All',
     'date_from': 'Date from',
     'date_to': 'Date to',
@@ -631,7 +766,11 @@ UI_TRANSLATIONS = {
     'pending_reviews_alert': 'reviews awaiting moderation →',
     'low_stock_alert': 'products running low →',
     'revenue_14_days': 'Revenue for 14 days',
+    'revenue_chart': 'Revenue',
+    'days_short': 'd',
     'order_statuses': 'Order statuses',
+    'stats_updated': 'Stats updated',
+    'ago': 'ago',
     'recent_orders': 'Recent orders',
     'all_link': 'All →',
     'top_products': 'Top products',
@@ -648,6 +787,11 @@ UI_TRANSLATIONS = {
     'delete': '🗑 Delete',
     'reviews_empty': 'No reviews',
     'delete_review_confirm': 'Delete review?',
+    'select_all': 'Select all',
+    'selected_word': 'selected',
+    'approve_all_pending': '✅ Approve all pending',
+    'approve_all_pending_confirm': 'Approve every review awaiting moderation?',
+    'delete_reviews_confirm': 'Delete the selected reviews?',
     'session': 'Session',
     'messages_count': 'Messages',
     'updated': 'Updated',
@@ -671,6 +815,39 @@ UI_TRANSLATIONS = {
     'total_lower': 'total',
     'orders_empty_short': 'No orders',
     'add_product': 'Add product',
+    'bulk_update': 'Bulk update',
+    'bulk_from_feed': 'From a supplier feed',
+    'bulk_feed_hint': 'CSV (comma or semicolon) or JSON with an sku column and any of price, old_price, stock. Empty cells leave the value unchanged.',
+    'bulk_by_rule': 'By rule',
+    'bulk_rule_hint': "E.g. +10% on a category's prices, rounded to end in 990.",
+    'preview_changes': 'Preview changes',
+    'apply_changes': 'Apply changes',
+    'will_change': 'Will change',
+    'unchanged_word': 'Unchanged',
+    'errors_word': 'Errors',
+    'increase': 'up',
+    'decrease': 'down',
+    'was_word': 'Was',
+    'becomes_word': 'New',
+    'row_word': 'Row',
+    'shown_first': 'Showing first',
+    'plan_expires': 'The plan is kept for 30 minutes.',
+    'apply_confirm': 'Apply the changes to products?',
+    'live_new_order': 'New order',
+    'live_order_status': 'Order status',
+    'live_low_stock': 'Running low on stock',
+    'live_new_orders': 'New orders since this page loaded',
+    'live_refresh': 'Refresh',
+    'import_products': 'Import products',
+    'import_hint': 'CSV or JSON Lines: sku, name, category, brand, price, old_price, stock, description; attr:<Name> columns become attributes, images is a |-separated list of URLs. Existing SKUs are skipped.',
+    'start_import': 'Start import',
+    'file_word': 'File',
+    'import_progress': 'Progress',
+    'rows_done': 'Rows done',
+    'created_word': 'Created',
+    'skipped_word': 'Skipped',
+    'images_word': 'Images',
+    'rows_per_second': 'rows/s',
     'product_info': 'Product information',
     'product_description': 'Product description',
     'product_media_settings': 'Photo and settings',
@@ -743,6 +920,8 @@ UI_TRANSLATIONS['ru'].update({
     'ai_help_choose': '🤖 AI поможет выбрать',
     'checkout_title': 'Оформление заказа',
     'checkout_step': 'Оформление',
+    'reserved_for': 'Товары зарезервированы за вами на',
+    'minutes_short': 'мин',
     'confirmation_step': 'Подтверждение',
     'contact_details': '👤 Контактные данные',
     'delivery_address': '🚚 Адрес доставки',
@@ -801,6 +980,8 @@ UI_TRANSLATIONS['ru'].update({
     'ai_disclaimer': 'AI работает на Ollama · Ответы генерируются локально · Не является финансовым советом',
     'you_short': 'Я',
     'ai_error': '⚠️ Не удалось получить ответ. Попробуйте ещё раз.',
+    'ai_queue_position': 'В очереди: {n}',
+    'ai_searching_catalog': 'Ищу в каталоге…',
     'new_chat_started': 'Новый чат начат!',
     'ask_about_products': 'Спросите меня о товарах',
     'suggestions': ['Найти смартфон до 30000₸', 'Лучшие ноутбуки для работы', 'Подобрать подарок на день рождения', 'Сравнить наушники', 'Что популярно сейчас?'],
@@ -840,6 +1021,8 @@ UI_TRANSLATIONS['kk'].update({
     'ai_help_choose': '🤖 AI таңдауға көмектеседі',
     'checkout_title': 'Тапсырысты рәсімдеу',
     'checkout_step': 'Рәсімдеу',
+    'reserved_for': 'Тауарлар сізге брондалды:',
+    'minutes_short': 'мин',
     'confirmation_step': 'Растау',
     'contact_details': '👤 Байланыс деректері',
     'delivery_address': '🚚 Жеткізу мекенжайы',
@@ -898,6 +1081,8 @@ UI_TRANSLATIONS['kk'].update({
     'ai_disclaimer': 'AI Ollama арқылы жұмыс істейді · Жауаптар жергілікті жасалады · Қаржылық кеңес емес',
     'you_short': 'Мен',
     'ai_error': '⚠️ Жауап алу мүмкін болмады. Қайталап көріңіз.',
+    'ai_queue_position': 'Кезекте: {n}',
+    'ai_searching_catalog': 'Каталогтан іздеп жатырмын…',
     'new_chat_started': 'Жаңа чат басталды!',
     'ask_about_products': 'Маған тауарлар туралы сұрақ қойыңыз',
     'suggestions': ['30000₸ дейін смартфон табу', 'Жұмысқа арналған үздік ноутбуктер', 'Туған күнге сыйлық таңдау', 'Құлаққаптарды салыстыру', 'Қазір не танымал?'],
@@ -937,6 +1122,8 @@ UI_TRANSLATIONS['en'].update({
     'ai_help_choose': '🤖 AI can help choose',
     'checkout_title': 'Checkout',
     'checkout_step': 'Checkout',
+    'reserved_for': 'Items are reserved for you for',
+    'minutes_short': 'min',
     'confirmation_step': 'Confirmation',
     'contact_details': '👤 Contact details',
     'delivery_address': '🚚 Delivery address',
@@ -995,6 +1182,8 @@ UI_TRANSLATIONS['en'].update({
     'ai_disclaimer': 'AI runs on Ollama · Answers are generated locally · Not financial advice',
     'you_short': 'You',
     'ai_error': '⚠️ Could not get a response. Please try again.',
+    'ai_queue_position': 'In queue: {n}',
+    'ai_searching_catalog': 'Searching the catalog…',
     'new_chat_started': 'New chat started!',
     'ask_about_products': 'Ask me about products',
     'suggestions': ['Find a smartphone under 30000₸', 'Best laptops for work', 'Pick a birthday gift', 'Compare headphones', 'What is popular now?'],
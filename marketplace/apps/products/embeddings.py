@@ -0,0 +1,119 @@
+"""
+Text embeddings for products and search queries.
+
+OllamaEmbedder calls /api/embed with OLLAMA_EMBED_MODEL (a multilingual
+model, so ru/kk/en queries land near the same products) on the first Ollama
+server in LLM_BACKENDS.
+HashingEmbedder is a deterministic offline stand-in (hashed words and
+character trigrams) for development and tests; it matches spelling, not
+meaning. PRODUCT_EMBEDDER picks one.
+"""
+import hashlib
+import re
+import zlib
+
+import httpx
+import numpy as np
+from django.conf import settings
+
+DESCRIPTION_CHARS = 2000
+_WORD_RE = re.compile(r'\w+')
+
+
+class EmbeddingError(Exception):
+    pass
+
+
+def embedding_server():
+    """(URL, headers) of the Ollama server that embeds: the first Ollama entry in LLM_BACKENDS"""
+    for config in settings.LLM_BACKENDS:
+        if config.get('type', 'ollama') == 'ollama':
+            headers = {'Authorization': f"Bearer {config['api_key']}"} if config.get('api_key') else {}
+            return config['url'], headers
+    return settings.OLLAMA_BASE_URL, {}
+
+
+class OllamaEmbedder:
+    batch_size = 32
+    local = False  # a network call; query embeddings are made off the request path
+
+    def __init__(self, model=None, base_url=None, timeout=30.0):
+        self.model = model or settings.OLLAMA_EMBED_MODEL
+        self.name = f'ollama:{self.model}'
+        url, headers = embedding_server()
+        self._client = httpx.Client(base_url=base_url or url, headers=headers, timeout=timeout)
+
+    def embed(self, texts):
+        """float32 matrix, one L2-normalized row per text"""
+        rows = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            try:
+                response = self._client.post('/api/embed', json={'model': self.model, 'input': batch})
+                response.raise_for_status()
+                rows.extend(response.json()['embeddings'])
+            except (httpx.HTTPError, KeyError, ValueError) as exc:
+                raise EmbeddingError(f'Ollama embeddings failed: {exc}') from exc
+        return normalize(np.asarray(rows, dtype=np.float32))
+
+
+class HashingEmbedder:
+    local = True
+
+    def __init__(self, dim=256):
+        self.dim = dim
+        self.name = f'hashing:{dim}'
+
+    def _features(self, text):
+        for word in _WORD_RE.findall(text.lower().replace('ё', 'е')):
+            yield word, 1.0
+            padded = f'#{word}#'
+            for i in range(len(padded) - 2):
+                yield padded[i:i + 3], 0.5
+
+    def embed(self, texts):
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, weight in self._features(text):
+                h = zlib.crc32(feature.encode())
+                matrix[row, h % self.dim] += weight if h & 0x80000000 else -weight
+        return normalize(matrix)
+
+
+def normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+QUERY_TIMEOUT = 3.0  # a background query embedding gives up after this, not the batch timeout
+_embedders = {}
+
+
+def get_embedder(for_queries=False):
+    if for_queries not in _embedders:
+        if settings.PRODUCT_EMBEDDER == 'hashing':
+            _embedders[for_queries] = HashingEmbedder()
+        else:
+            _embedders[for_queries] = OllamaEmbedder(timeout=QUERY_TIMEOUT if for_queries else 30.0)
+    return _embedders[for_queries]
+
+
+def product_text(row, attributes=()):
+    """What gets embedded for a product: name, brand, category, descriptions and attributes"""
+    parts = [row['name']]
+    if row.get('brand__name'):
+        parts.append(f"Бренд: {row['brand__name']}")
+    if row.get('category__name'):
+        parts.append(f"Категория: {row['category__name']}")
+    if row.get('short_description'):
+        parts.append(row['short_description'])
+    parts.extend(f'{name}: {value}{f" {unit}" if unit else ""}' for name, value, unit in attributes)
+    if row.get('description'):
+        parts.append(row['description'][:DESCRIPTION_CHARS])
+    return '\n'.join(parts)
+
+
+def fingerprint(text):
+    """Stable 64-bit digest of the embedded text; unchanged text isn't re-embedded"""
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), 'little', signed=True)
@@ -0,0 +1,439 @@
+"""
+Streaming catalog import.
+
+Rows are read lazily from CSV or JSON Lines and written in batches: one
+slug query, one bulk_create for products and one for their attributes per
+batch. Categories, brands and attributes are resolved from in-memory maps
+loaded once. Images are fetched (http/https, public addresses only) or
+copied (local paths) on a thread pool while the next batches are processed.
+The importer reports a checkpoint (rows fully done, images included) so an
+interrupted run can resume where it stopped; SKUs that already exist are
+skipped, which makes re-running a range harmless. An existing product that
+has no images yet (a run stopped before they were saved) gets the row's
+images fetched again.
+"""
+import csv
+import io
+import ipaddress
+import json
+import os
+import socket
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+import httpx
+from PIL import Image as PILImage
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .models import (
+    Attribute, Brand, Category, Product, ProductAttribute, ProductImage, allocate_slugs,
+)
+
+BATCH_SIZE = 500
+IMAGE_WORKERS = 8
+IMAGE_TIMEOUT = 15
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+MAX_IMAGE_REDIRECTS = 5
+MAX_ERRORS = 200
+MAX_PENDING_BATCHES = 4  # batches whose images may still be downloading
+
+_TRUE = {'1', 'true', 'yes', 'да', 'y'}
+
+
+class ImportFileError(Exception):
+    """The file itself can't be read (as opposed to a bad row)"""
+
+
+class ImportStats:
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.skipped = 0
+        self.failed = 0
+        self.images = 0
+        self.image_errors = 0
+        self.errors = []        # (row, sku, message), first MAX_ERRORS
+        self.checkpoint = 0     # rows fully imported, images included
+        self.started = time.monotonic()
+
+    def error(self, row, sku, message, failed=True):
+        if failed:
+            self.failed += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((row, sku, message))
+
+    @property
+    def rows_per_second(self):
+        elapsed = time.monotonic() - self.started
+        return self.rows / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self):
+        return {
+            'rows': self.rows, 'created': self.created, 'skipped': self.skipped,
+            'failed': self.failed, 'images': self.images, 'image_errors': self.image_errors,
+            'checkpoint': self.checkpoint, 'rows_per_second': round(self.rows_per_second, 1),
+        }
+
+
+# ── Reading ───────────────────────────────────────────────────────────────────
+
+def read_rows(fileobj, name):
+    """
+    Yield (row number, dict) from a binary file. `.jsonl`/`.ndjson` files are
+    JSON Lines; anything else is CSV. CSV columns `attr:<Name>` become
+    attributes and `images` is a `|`-separated list.
+    """
+    if name.lower().endswith(('.jsonl', '.ndjson')):
+        for number, line in enumerate(io.TextIOWrapper(fileobj, encoding='utf-8-sig'), start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError as exc:
+                yield number, {'_error': f'некорректный JSON: {exc}'}
+                continue
+            yield number, item if isinstance(item, dict) else {'_error': 'строка не является объектом'}
+        return
+
+    text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    try:
+        sample = text.read(4096)
+        text.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        for number, row in enumerate(csv.DictReader(text, dialect=dialect), start=2):
+            item = {'attributes': {}}
+            for key, value in row.items():
+                if not key:
+                    continue
+                key = key.strip()
+                if key.lower().startswith('attr:'):
+                    if value not in (None, ''):
+                        item['attributes'][key[5:].strip()] = value
+                elif key.lower() == 'images':
+                    item['images'] = [v.strip() for v in (value or '').split('|') if v.strip()]
+                else:
+                    item[key.lower()] = value
+            yield number, item
+    except UnicodeDecodeError:
+        raise ImportFileError('Файл должен быть в кодировке UTF-8')
+
+
+def _decimal(value, field, required=False):
+    if value in (None, ''):
+        if required:
+            raise ValueError(f'не заполнено поле {field}')
+        return None
+    try:
+        result = Decimal(str(value).replace(' ', '').replace('\xa0', '').replace(',', '.'))
+    except InvalidOperation:
+        raise ValueError(f'{field}: не число ({value!r})')
+    if result < 0:
+        raise ValueError(f'{field}: отрицательное значение')
+    return result
+
+
+# ── Lookups ───────────────────────────────────────────────────────────────────
+
+class _Lookup:
+    """name/slug -> id map for a small table, loaded once, optionally creating rows"""
+
+    def __init__(self, model, create):
+        self.model = model
+        self.create = create
+        self.ids = {}
+        for pk, name, slug in model.objects.values_list('pk', 'name', 'slug'):
+            self.ids[name.strip().lower()] = pk
+            self.ids[slug] = pk
+
+    def resolve(self, value):
+        key = str(value).strip()
+        if not key:
+            return None
+        pk = self.ids.get(key.lower()) or self.ids.get(key)
+        if pk is None and self.create:
+            max_length = self.model._meta.get_field('slug').max_length
+            slug = slugify(key, allow_unicode=True)[:max_length] or uuid.uuid4().hex[:12]
+            obj, _ = self.model.objects.get_or_create(slug=slug, defaults={'name': key})
+            pk = self.ids[key.lower()] = self.ids[slug] = obj.pk
+        return pk
+
+
+class _AttributeLookup:
+    def __init__(self):
+        self.ids = {name.strip().lower(): pk for pk, name in Attribute.objects.values_list('pk', 'name')}
+
+    def resolve_many(self, names):
+        missing = {n.strip() for n in names if n.strip() and n.strip().lower() not in self.ids}
+        if missing:
+            # Attributes are free-form: create the new ones in one statement
+            Attribute.objects.bulk_create([Attribute(name=name) for name in sorted(missing)])
+            for pk, name in Attribute.objects.filter(name__in=missing).values_list('pk', 'name'):
+                self.ids[name.strip().lower()] = pk
+        return self.ids
+
+
+# ── Images ────────────────────────────────────────────────────────────────────
+
+def _public_address(host):
+    """An address of host, if all of them are on the public internet"""
+    try:
+        infos = socket.getaddrinfo(host, None, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError):
+        raise ValueError(f'не удалось найти адрес {host}')
+    addresses = [ipaddress.ip_address(info[4][0].split('%', 1)[0]) for info in infos]
+    if not addresses or any(not a.is_global or a.is_multicast for a in addresses):
+        raise ValueError('адрес изображения во внутренней сети')
+    return addresses[0]
+
+
+def _download(client, url):
+    """
+    GET an image from a public address. The connection goes to the address
+    that was checked (with the original Host and TLS name), so a DNS answer
+    that changes in between can't point it inside; redirects are followed by
+    hand and each target is checked the same way.
+    """
+    url = httpx.URL(url)
+    for _ in range(MAX_IMAGE_REDIRECTS + 1):
+        if url.scheme not in ('http', 'https'):
+            raise ValueError('поддерживаются только http и https')
+        address = _public_address(url.host)
+        with client.stream(
+            'GET', url.copy_with(host=str(address)),
+            headers={'Host': url.netloc.decode('ascii')},
+            extensions={'sni_hostname': url.host},
+        ) as response:
+            if response.is_redirect:
+                url = url.join(response.headers['location'])
+                continue
+            response.raise_for_status()
+            return _read_capped(response)
+    raise ValueError('слишком много перенаправлений')
+
+
+def _read_capped(response):
+    """The body, read only as far as MAX_IMAGE_BYTES"""
+    too_big = ValueError(f'изображение больше {MAX_IMAGE_BYTES // (1024 * 1024)} МБ')
+    length = response.headers.get('content-length', '')
+    if length.isdigit() and int(length) > MAX_IMAGE_BYTES:
+        raise too_big
+    data = bytearray()
+    for chunk in response.iter_bytes():
+        data += chunk
+        if len(data) > MAX_IMAGE_BYTES:
+            raise too_big
+    return bytes(data)
+
+
+def _fetch_image(client, source, images_dir):
+    """Download or copy one image into storage; returns the stored name"""
+    if source.startswith(('http://', 'https://')):
+        data = _download(client, source)
+    elif images_dir:
+        root = Path(images_dir).resolve()
+        path = (root / source).resolve()
+        if not path.is_relative_to(root):
+            raise ValueError('путь вне каталога изображений')
+        data = path.read_bytes()
+    else:
+        raise ValueError('локальные файлы разрешены только вместе с каталогом изображений')
+    if len(data) > MAX_IMAGE_BYTES:
+        raise ValueError(f'изображение больше {MAX_IMAGE_BYTES // (1024 * 1024)} МБ')
+    try:
+        PILImage.open(io.BytesIO(data)).verify()
+    except Exception:
+        raise ValueError('файл не является изображением')
+
+    ext = os.path.splitext(source.split('?', 1)[0])[1].lower()
+    if ext not in ('.jpg', '.jpeg', '.png', '.webp', '.gif'):
+        ext = '.jpg'
+    name = timezone.now().strftime('products/%Y/%m/') + uuid.uuid4().hex + ext
+    return default_storage.save(name, ContentFile(data))
+
+
+# ── Import ────────────────────────────────────────────────────────────────────
+
+class ProductImporter:
+    def __init__(self, create_missing=False, images_dir=None, batch_size=BATCH_SIZE,
+                 image_workers=IMAGE_WORKERS, on_progress=None):
+        self.create_missing = create_missing
+        self.images_dir = images_dir
+        self.batch_size = batch_size
+        self.image_workers = image_workers
+        self.on_progress = on_progress
+        self.stats = ImportStats()
+
+    def run(self, rows, start=0):
+        """
+        Import (row number, dict) pairs, skipping the first `start` rows
+        (a previous checkpoint). Returns ImportStats.
+        """
+        self.categories = _Lookup(Category, self.create_missing)
+        self.brands = _Lookup(Brand, self.create_missing)
+        self.attributes = _AttributeLookup()
+        self.stats.checkpoint = start
+        self._pending = []  # (rows done after this batch, [(future, ProductImage)])
+
+        with ThreadPoolExecutor(max_workers=self.image_workers) as pool, \
+                httpx.Client(timeout=IMAGE_TIMEOUT) as client:
+            self._pool, self._client = pool, client
+            batch, position = [], 0
+            for number, item in rows:
+                position += 1
+                if position <= start:
+                    continue
+                batch.append((number, item))
+                if len(batch) >= self.batch_size:
+                    self._import_batch(batch, position)
+                    batch = []
+            if batch:
+                self._import_batch(batch, position)
+            self._collect_images(wait=True)
+        return self.stats
+
+    def _parse(self, number, item):
+        if '_error' in item:
+            raise ValueError(item['_error'])
+        sku = str(item.get('sku') or '').strip()
+        name = str(item.get('name') or '').strip()
+        if not sku:
+            raise ValueError('пустой артикул')
+        if not name:
+            raise ValueError('пустое название')
+        category_id = self.categories.resolve(item.get('category') or '')
+        if category_id is None:
+            raise ValueError(f'категория не найдена: {item.get("category")!r}')
+        stock = _decimal(item.get('stock'), 'stock') or 0
+        if stock != int(stock):
+            raise ValueError('stock: должно быть целым')
+
+        attributes = item.get('attributes') or {}
+        if not isinstance(attributes, dict):
+            raise ValueError('attributes должен быть объектом')
+        images = item.get('images') or []
+        if isinstance(images, str):
+            images = [v.strip() for v in images.split('|') if v.strip()]
+
+        product = Product(
+            id=uuid.uuid4(),
+            sku=sku[:100],
+            name=name[:500],
+            category_id=category_id,
+            brand_id=self.brands.resolve(item.get('brand') or ''),
+            price=_decimal(item.get('price'), 'price', required=True),
+            old_price=_decimal(item.get('old_price'), 'old_price'),
+            stock=int(stock),
+            weight=_decimal(item.get('weight'), 'weight'),
+            description=str(item.get('description') or ''),
+            short_description=str(item.get('short_description') or '')[:500],
+            is_active=str(item.get('is_active', '1')).strip().lower() in _TRUE,
+        )
+        return product, attributes, images
+
+    def _import_batch(self, batch, position):
+        stats = self.stats
+        parsed = []
+        for number, item in batch:
+            stats.rows += 1
+            try:
+                parsed.append((number, *self._parse(number, item)))
+            except ValueError as exc:
+                stats.error(number, str(item.get('sku') or ''), str(exc))
+
+        existing = {
+            sku: Product(pk=pk, sku=sku, name=name) for pk, sku, name in
+            Product.objects.filter(sku__in=[p.sku for _, p, _, _ in parsed]).values_list('pk', 'sku', 'name')
+        }
+        with_images = set(
+            ProductImage.objects.filter(product__in=[p.pk for p in existing.values()])
+            .values_list('product_id', flat=True).distinct()
+        )
+        fresh, imageless, seen = [], [], set()
+        for number, product, attributes, images in parsed:
+            if product.sku in seen:
+                stats.skipped += 1
+                continue
+            seen.add(product.sku)
+            if product.sku in existing:
+                stats.skipped += 1
+                if images and existing[product.sku].pk not in with_images:
+                    imageless.append((existing[product.sku], images))
+                continue
+            fresh.append((product, attributes, images))
+
+        image_jobs = []
+        for product, images in imageless:
+            self._queue_images(product, images, image_jobs)
+        if fresh:
+            attribute_ids = self.attributes.resolve_many(
+                {name for _, attributes, _ in fresh for name in attributes}
+            )
+            self._create(fresh, attribute_ids)
+            stats.created += len(fresh)
+
+            for product, _, images in fresh:
+                self._queue_images(product, images, image_jobs)
+
+        self._pending.append((position, image_jobs))
+        self._collect_images(wait=False)
+
+    def _queue_images(self, product, images, image_jobs):
+        for order, source in enumerate(images):
+            future = self._pool.submit(_fetch_image, self._client, source, self.images_dir)
+            image_jobs.append((future, ProductImage(
+                product=product, alt=product.name[:200], order=order,
+            ), source))
+
+    def _create(self, fresh, attribute_ids):
+        for (product, _, _), slug in zip(fresh, allocate_slugs([p.name for p, _, _ in fresh])):
+            product.slug = slug
+        with transaction.atomic():
+            Product.objects.bulk_create([product for product, _, _ in fresh])
+            ProductAttribute.objects.bulk_create([
+                ProductAttribute(
+                    product=product,
+                    attribute_id=attribute_ids[name.strip().lower()],
+                    value=str(value)[:500],
+                )
+                for product, attributes, _ in fresh
+                for name, value in attributes.items()
+                if name.strip() and value not in (None, '')
+            ])
+
+    def _collect_images(self, wait):
+        """Save finished image rows and advance the checkpoint past complete batches"""
+        while self._pending:
+            position, jobs = self._pending[0]
+            # Block on the oldest batch once too many are in flight
+            behind = len(self._pending) > MAX_PENDING_BATCHES
+            if not (wait or behind) and not all(future.done() for future, _, _ in jobs):
+                break
+            self._pending.pop(0)
+            done, with_main = [], set()
+            for future, image, source in jobs:
+                try:
+                    image.image = future.result()
+                    # The first image that actually arrived is the main one
+                    image.is_main = image.product_id not in with_main
+                    with_main.add(image.product_id)
+                    done.append(image)
+                except Exception as exc:
+                    # The product itself is imported; only the image is missing
+                    self.stats.image_errors += 1
+                    self.stats.error('', image.product.sku, f'изображение {source}: {exc}', failed=False)
+            ProductImage.objects.bulk_create(done)
+            self.stats.images += len(done)
+            self.stats.checkpoint = position
+            if self.on_progress:
+                self.on_progress(self.stats)
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.products.embeddings import EmbeddingError
+from apps.products.vectors import sync_product_vectors
+
+
+class Command(BaseCommand):
+    help = 'Embed changed products and update the semantic search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Re-embed every active product and rebuild the index from scratch')
+
+    def handle(self, *args, **options):
+        def progress(stats):
+            self.stdout.write(f"  {stats['checked']} checked, {stats['embedded']} embedded")
+
+        try:
+            stats = sync_product_vectors(full=options['full'], on_progress=progress)
+        except EmbeddingError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            f"Embedded {stats['embedded']} products, removed {stats['removed']}; "
+            f"{stats['total']} in the index"
+        ))
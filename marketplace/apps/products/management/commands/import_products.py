@@ -0,0 +1,62 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.products.importer import BATCH_SIZE, IMAGE_WORKERS, ImportFileError, ProductImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Import products from a CSV or JSON Lines catalog (new SKUs only)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='Path to a .csv or .jsonl catalog')
+        parser.add_argument('--create-missing', action='store_true',
+                            help='Create categories and brands that do not exist yet')
+        parser.add_argument('--images-dir', help='Directory that local image paths are relative to')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help=f'Rows per transaction (default {BATCH_SIZE})')
+        parser.add_argument('--workers', type=int, default=IMAGE_WORKERS,
+                            help=f'Image download threads (default {IMAGE_WORKERS})')
+        parser.add_argument('--checkpoint', help='Checkpoint file (default <file>.checkpoint.json)')
+        parser.add_argument('--resume', action='store_true', help='Continue from the checkpoint file')
+
+    def handle(self, *args, **options):
+        checkpoint_path = options['checkpoint'] or options['file'] + '.checkpoint.json'
+        start = 0
+        if options['resume'] and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as fh:
+                start = json.load(fh).get('checkpoint', 0)
+            self.stdout.write(f'Resuming after row {start}')
+
+        def progress(stats):
+            with open(checkpoint_path, 'w') as fh:
+                json.dump(stats.as_dict(), fh)
+            self.stdout.write(
+                f'  {stats.checkpoint} rows done: {stats.created} created, {stats.skipped} skipped, '
+                f'{stats.failed} failed, {stats.images} images ({stats.rows_per_second:.0f} rows/s)'
+            )
+
+        importer = ProductImporter(
+            create_missing=options['create_missing'],
+            images_dir=options['images_dir'],
+            batch_size=max(options['batch_size'], 1),
+            image_workers=max(options['workers'], 1),
+            on_progress=progress,
+        )
+        try:
+            with open(options['file'], 'rb') as fh:
+                stats = importer.run(read_rows(fh, options['file']), start=start)
+        except (OSError, ImportFileError) as exc:
+            raise CommandError(str(exc))
+
+        for row, sku, message in stats.errors[:20]:
+            self.stdout.write(self.style.WARNING(f'  row {row} {sku}: {message}'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {stats.created} products, {stats.images} images '
+            f'({stats.skipped} existing, {stats.failed} failed, {stats.image_errors} image errors) '
+            f'at {stats.rows_per_second:.0f} rows/s'
+        ))
+        # Finished: a later --resume should start from the top again
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
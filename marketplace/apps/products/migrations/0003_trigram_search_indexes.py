@@ -0,0 +1,25 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.db import migrations
+from django.db.models.functions import Upper
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('products', '0002_initial'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddIndexConcurrently(
+            model_name='product',
+            index=GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='products_product_name_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='product',
+            index=GinIndex(OpClass(Upper('sku'), name='gin_trgm_ops'), name='products_product_sku_trgm'),
+        ),
+    ]
@@ -1,8 +1,13 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
+from django.db.models import Avg, Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Upper
+from django.utils import timezone
 from django.utils.text import slugify
 from django.core.validators import MinValueValidator, MaxValueValidator
 from apps.users.models import User
 import uuid
+from decimal import Decimal
 
 
 class Category(models.Model):
@@ -51,6 +56,79 @@ class Brand(models.Model):
         return self.name
 
 
+class ProductQuerySet(models.QuerySet):
+    def with_reserved(self):
+        """Annotate reserved_stock (active checkout holds) for cheap in_stock on listings"""
+        reservation = self.model._meta.get_field('reservations').related_model
+        held = (
+            reservation.objects
+            .filter(product=OuterRef('pk'), expires_at__gt=timezone.now())
+            .values('product')
+            .annotate(total=Sum('quantity'))
+            .values('total')
+        )
+        return self.annotate(
+            reserved_stock=Coalesce(Subquery(held), 0, output_field=models.IntegerField())
+        )
+
+
+def attach_reserved_stock(products):
+    """Set reserved_stock on already loaded products with one grouped query"""
+    products = [p for p in products if getattr(p, 'reserved_stock', None) is None]
+    if not products:
+        return
+    reservation = Product._meta.get_field('reservations').related_model
+    held = dict(
+        reservation.objects
+        .filter(product__in=products, expires_at__gt=timezone.now())
+        .values_list('product')
+        .annotate(total=Sum('quantity'))
+    )
+    for p in products:
+        p.reserved_stock = held.get(p.pk, 0)
+
+
+SLUG_MAX_LENGTH = 480  # leaves room for a "-<n>" suffix within max_length=500
+SLUG_LOOKUP_CHUNK = 200  # OR-ed lookups per query, well below SQLite's expression depth limit
+
+
+def allocate_slugs(names, taken=()):
+    """
+    Unique product slugs for many names with one query per
+    SLUG_LOOKUP_CHUNK distinct bases: existing "<base>" / "<base>-<n>" slugs
+    are read once and suffixes continue from the highest one. `taken` holds
+    slugs reserved elsewhere in the batch.
+    """
+    bases = [slugify(name, allow_unicode=True)[:SLUG_MAX_LENGTH].strip('-') or 'product' for name in names]
+    distinct = sorted(set(bases))
+    existing = set(taken)
+    for start in range(0, len(distinct), SLUG_LOOKUP_CHUNK):
+        query = models.Q()
+        for base in distinct[start:start + SLUG_LOOKUP_CHUNK]:
+            query |= models.Q(slug=base) | models.Q(slug__startswith=f'{base}-')
+        existing.update(Product.objects.filter(query).values_list('slug', flat=True))
+
+    next_suffix = {}
+    for slug in existing:
+        base, _, suffix = slug.rpartition('-')
+        if suffix.isdigit():
+            next_suffix[base] = max(next_suffix.get(base, 1), int(suffix) + 1)
+
+    slugs = []
+    for base in bases:
+        slug = base
+        if slug in existing:
+            n = next_suffix.get(base, 1)
+            slug = f'{base}-{n}'
+            while slug in existing:
+                n += 1
+                slug = f'{base}-{n}'
+            next_suffix[base] = n + 1
+        existing.add(slug)
+        slugs.append(slug)
+    return slugs
+
+
 class Product(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=500, verbose_name='Название')
@@ -81,6 +159,8 @@ class Product(models.Model):
     avg_rating = models.DecimalField(max_digits=3, decimal_places=2, default=0)
     reviews_count = models.PositiveIntegerField(default=0)
 
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Товар'
         verbose_name_plural = 'Товары'
@@ -90,6 +170,8 @@ class Product(models.Model):
             models.Index(fields=['category', 'is_active']),
             models.Index(fields=['price']),
             models.Index(fields=['avg_rating']),
+            GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='products_product_name_trgm'),
+            GinIndex(OpClass(Upper('sku'), name='gin_trgm_ops'), name='products_product_sku_trgm'),
         ]
 
     def __str__(self):
@@ -97,13 +179,7 @@ class Product(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = slugify(self.name, allow_unicode=True)
-            # Ensure unique slug
-            base_slug = self.slug
-            n = 1
-            while Product.objects.filter(slug=self.slug).exclude(pk=self.pk).exists():
-                self.slug = f"{base_slug}-{n}"
-                n += 1
+            self.slug = allocate_slugs([self.name])[0]
         super().save(*args, **kwargs)
 
     @property
@@ -112,19 +188,21 @@ class Product(models.Model):
             return int((1 - self.price / self.old_price) * 100)
         return 0
 
+    @property
+    def available_stock(self):
+        """Stock minus quantities held by other buyers' open checkouts"""
+        if getattr(self, 'reserved_stock', None) is None:
+            attach_reserved_stock([self])
+        return max(self.stock - self.reserved_stock, 0)
+
     @property
     def in_stock(self):
-        return self.stock > 0
+        return self.available_stock > 0
 
     def update_rating(self):
-        reviews = self.reviews.filter(is_approved=True)
-        count = reviews.count()
-        if count > 0:
-            total = sum(r.rating for r in reviews)
-            self.avg_rating = round(total / count, 2)
-        else:
-            self.avg_rating = 0
-        self.reviews_count = count
+        stats = self.reviews.filter(is_approved=True).aggregate(avg=Avg('rating'), count=Count('id'))
+        self.avg_rating = round(Decimal(str(stats['avg'])), 2) if stats['count'] else 0
+        self.reviews_count = stats['count']
         self.save(update_fields=['avg_rating', 'reviews_count'])
 
     def get_main_image(self):
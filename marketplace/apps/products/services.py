@@ -0,0 +1,58 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Avg, Count
+
+from .models import Product, Review
+from .tasks import update_product_ratings
+
+RATING_BATCH_SIZE = 1000
+MODERATION_ACTIONS = ('approve', 'reject', 'delete')
+
+
+def _rating(avg):
+    return Decimal(str(avg)).quantize(Decimal('0.01')) if avg is not None else Decimal(0)
+
+
+def recompute_ratings(product_ids):
+    """
+    Refresh avg_rating/reviews_count for many products: one grouped
+    aggregate and one bulk UPDATE per batch, whatever the number of reviews.
+    """
+    product_ids = list(set(product_ids))
+    for start in range(0, len(product_ids), RATING_BATCH_SIZE):
+        batch = product_ids[start:start + RATING_BATCH_SIZE]
+        stats = {
+            row['product_id']: row for row in
+            Review.objects.filter(product_id__in=batch, is_approved=True)
+            .values('product_id').annotate(avg=Avg('rating'), count=Count('id')).order_by()
+        }
+        Product.objects.bulk_update([
+            Product(
+                pk=pk,
+                avg_rating=_rating(stats[pk]['avg']) if pk in stats else Decimal(0),
+                reviews_count=stats[pk]['count'] if pk in stats else 0,
+            )
+            for pk in batch
+        ], ['avg_rating', 'reviews_count'])
+    return len(product_ids)
+
+
+def moderate_reviews(reviews, action):
+    """
+    Approve, reject or delete every review in the queryset with one
+    statement and queue one recomputation of the affected products' ratings.
+    Returns (reviews changed, products to recompute).
+    """
+    if action not in MODERATION_ACTIONS:
+        raise ValueError(f'Unknown moderation action: {action}')
+
+    with transaction.atomic():
+        product_ids = list(reviews.values_list('product_id', flat=True).distinct().order_by())
+        if action == 'delete':
+            changed, _ = reviews.delete()
+        else:
+            changed = reviews.update(is_approved=(action == 'approve'))
+        if product_ids:
+            update_product_ratings.delay(product_ids=product_ids)
+    return changed, len(product_ids)
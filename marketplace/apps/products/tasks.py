@@ -0,0 +1,15 @@
+from django.conf import settings
+
+from apps.tasks.queue import task
+from . import services
+from .vectors import sync_product_vectors
+
+
+@task()
+def update_product_ratings(product_ids):
+    services.recompute_ratings(product_ids)
+
+
+@task(every=settings.PRODUCT_VECTORS_REFRESH, max_attempts=1)
+def refresh_product_vectors():
+    sync_product_vectors()
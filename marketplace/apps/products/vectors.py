@@ -0,0 +1,480 @@
+"""
+Product embedding index with approximate nearest-neighbour search.
+
+Vectors live under PRODUCT_VECTORS_DIR as a memory-mapped .npy matrix,
+int8 with a per-row scale (4x smaller than float32, PRODUCT_VECTORS_DTYPE)
+or float32. Web processes map it read-only, so the page cache holds one copy
+whatever the number of workers.
+
+Search is IVF: k-means centroids split the rows into ~sqrt(N) lists and a
+query scores only the rows of its PRODUCT_VECTORS_NPROBE nearest lists.
+Small indexes are scanned exhaustively.
+
+sync_product_vectors() (the build_product_vectors command and a periodic
+task) updates the index in place: products whose embedded text changed
+since the last run are re-embedded into their row or appended, deactivated
+and deleted products are masked out, and the centroids are retrained once
+the index has doubled since they were trained. Row metadata (product ids,
+text fingerprints, list assignments) is a small .npz written per version;
+readers notice the new version in meta.json and reload it.
+
+Query embeddings never block a request on the embedding server: a query
+whose vector isn't cached is embedded by a small background pool, and the
+search waits at most `wait` seconds for it (none on the chat path) before
+going on without semantic matches. The vector is cached, so the next page,
+the follow-up message or the next user asking the same thing gets it.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .embeddings import EmbeddingError, fingerprint, get_embedder, product_text
+from .models import Product, ProductAttribute
+
+logger = logging.getLogger(__name__)
+
+IVF_MIN_ROWS = 5000          # below this a full scan is as fast as the lists
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE = 50_000
+SCAN_CHUNK = 65_536
+GROWTH = 1.5
+SYNC_CHUNK = 500
+RELOAD_CHECK = 10            # seconds between a reader's meta.json checks
+QUERY_CACHE_TTL = 24 * 60 * 60
+EMBEDDER_DOWN_KEY = 'vectors:embedder_down'
+EMBEDDER_DOWN_TTL = 30
+QUERY_EMBED_THREADS = 2
+QUERY_EMBED_BACKLOG = 100    # queries waiting for an embedding before new ones are skipped
+
+
+class VectorIndex:
+
+    def __init__(self, path, dim, dtype, model):
+        self.path = str(path)
+        self.meta = {
+            'dim': dim, 'dtype': dtype, 'model': model, 'count': 0, 'capacity': 0,
+            'generation': 0, 'version': 0, 'trained_rows': 0, 'synced_at': None,
+        }
+        self.vectors = self.scales = None
+        self.pks = np.zeros(0, dtype='V16')
+        self.fingerprints = np.zeros(0, dtype=np.int64)
+        self.alive = np.zeros(0, dtype=bool)
+        self.assign = np.zeros(0, dtype=np.int32)
+        self.centroids = np.zeros((0, dim), dtype=np.float32)
+        self._refresh_lookups()
+
+    # ── Files ─────────────────────────────────────────────────────────────────
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    @classmethod
+    def open(cls, path, writable=False):
+        """The index stored at path, or None if there is none yet"""
+        try:
+            with open(os.path.join(path, 'meta.json')) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None
+        index = cls(path, meta['dim'], meta['dtype'], meta['model'])
+        index.meta = meta
+        mode = 'r+' if writable else 'r'
+        generation = meta['generation']
+        if meta['capacity']:
+            index.vectors = np.load(index._file(f'vectors-{generation}.npy'), mmap_mode=mode)
+            index.scales = np.load(index._file(f'scales-{generation}.npy'), mmap_mode=mode)
+        with np.load(index._file(f"rows-{meta['version']}.npz")) as rows:
+            count = meta['count']
+            index.pks = rows['pks'][:count].copy()
+            index.fingerprints = rows['fingerprints'][:count].copy()
+            index.alive = rows['alive'][:count].copy()
+            index.assign = rows['assign'][:count].copy()
+            index.centroids = rows['centroids'].copy()
+        index._refresh_lookups()
+        return index
+
+    def save(self, synced_at=None):
+        """Write row metadata as a new version and point meta.json at it"""
+        if self.vectors is not None:
+            self.vectors.flush()
+            self.scales.flush()
+        old_version = self.meta['version']
+        self.meta['version'] = old_version + 1
+        if synced_at is not None:
+            self.meta['synced_at'] = synced_at.isoformat()
+        np.savez(
+            self._file(f"rows-{self.meta['version']}.npz"),
+            pks=self.pks, fingerprints=self.fingerprints, alive=self.alive,
+            assign=self.assign, centroids=self.centroids,
+        )
+        tmp = self._file('meta.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, self._file('meta.json'))
+        # Readers load a version's rows right after seeing it, so the previous one can go
+        for name in os.listdir(self.path):
+            if name.startswith('rows-') and name != f"rows-{self.meta['version']}.npz" \
+                    and name != f'rows-{old_version}.npz':
+                os.remove(self._file(name))
+
+    def _grow(self, needed):
+        """Move the matrix to a bigger file (a new generation; mapped readers keep the old one)"""
+        capacity = max(int(self.meta['capacity'] * GROWTH), needed, 1024)
+        generation = self.meta['generation'] + 1
+        dtype = np.int8 if self.meta['dtype'] == 'int8' else np.float32
+        vectors = np.lib.format.open_memmap(
+            self._file(f'vectors-{generation}.npy'), mode='w+', dtype=dtype,
+            shape=(capacity, self.meta['dim']),
+        )
+        scales = np.lib.format.open_memmap(
+            self._file(f'scales-{generation}.npy'), mode='w+', dtype=np.float32, shape=(capacity,),
+        )
+        count = self.meta['count']
+        if count:
+            vectors[:count] = self.vectors[:count]
+            scales[:count] = self.scales[:count]
+        old = self.meta['generation']
+        self.vectors, self.scales = vectors, scales
+        self.meta.update(capacity=capacity, generation=generation)
+        for name in (f'vectors-{old}.npy', f'scales-{old}.npy'):
+            if os.path.exists(self._file(name)):
+                os.remove(self._file(name))
+
+    # ── Writing ───────────────────────────────────────────────────────────────
+
+    def _encode(self, vectors):
+        if self.meta['dtype'] != 'int8':
+            return vectors.astype(np.float32), np.ones(len(vectors), dtype=np.float32)
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+    def upsert(self, pks, vectors, fingerprints):
+        """Write vectors for product pks, reusing their rows or appending"""
+        keys = [uuid.UUID(str(pk)).bytes for pk in pks]
+        rows = np.empty(len(keys), dtype=np.int64)
+        new = []
+        for i, key in enumerate(keys):
+            row = self._rows.get(key)
+            if row is None:
+                new.append(i)
+            else:
+                rows[i] = row
+        count = self.meta['count']
+        if new:
+            end = count + len(new)
+            if end > self.meta['capacity']:
+                self._grow(end)
+            rows[new] = np.arange(count, end)
+            self.pks = np.concatenate([self.pks, np.array([keys[i] for i in new], dtype='V16')])
+            self.fingerprints = np.concatenate([self.fingerprints, np.zeros(len(new), dtype=np.int64)])
+            self.alive = np.concatenate([self.alive, np.zeros(len(new), dtype=bool)])
+            self.assign = np.concatenate([self.assign, np.full(len(new), -1, dtype=np.int32)])
+            self.meta['count'] = end
+        encoded, scales = self._encode(vectors)
+        order = np.argsort(rows)
+        self.vectors[rows[order]] = encoded[order]
+        self.scales[rows[order]] = scales[order]
+        self.fingerprints[rows] = fingerprints
+        self.alive[rows] = True
+        if len(self.centroids):
+            self.assign[rows] = self._nearest_centroid(vectors)
+        self._refresh_lookups()
+
+    def remove(self, pks):
+        for pk in pks:
+            row = self._rows.get(uuid.UUID(str(pk)).bytes)
+            if row is not None:
+                self.alive[row] = False
+        self._refresh_lookups()
+
+    def needs_training(self):
+        alive = int(self.alive.sum())
+        if alive < IVF_MIN_ROWS:
+            return False
+        return not len(self.centroids) or alive > 2 * self.meta['trained_rows']
+
+    def train(self):
+        """Spherical k-means over a sample of the rows, then assign every row"""
+        live = np.flatnonzero(self.alive)
+        nlist = max(int(np.sqrt(len(live))), 1)
+        rng = np.random.default_rng(0)
+        sample = self._decode(np.sort(rng.choice(live, min(len(live), KMEANS_SAMPLE), replace=False)))
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)]
+        for _ in range(KMEANS_ITERATIONS):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            empty = np.bincount(labels, minlength=nlist) == 0
+            sums[empty] = centroids[empty]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1
+            centroids = sums / norms
+        self.centroids = centroids.astype(np.float32)
+        for start in range(0, self.meta['count'], SCAN_CHUNK):
+            rows = np.arange(start, min(start + SCAN_CHUNK, self.meta['count']))
+            self.assign[rows] = self._nearest_centroid(self._decode(rows))
+        self.meta['trained_rows'] = len(live)
+        self._refresh_lookups()
+
+    # ── Reading ───────────────────────────────────────────────────────────────
+
+    def _refresh_lookups(self):
+        self._rows = {key: row for row, key in enumerate(self.pks.tolist())}
+        live = np.flatnonzero(self.alive)
+        self.live_count = len(live)
+        if len(self.centroids) and self.live_count >= IVF_MIN_ROWS:
+            order = live[np.argsort(self.assign[live], kind='stable')]
+            bounds = np.searchsorted(self.assign[order], np.arange(len(self.centroids) + 1))
+            self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))]
+        else:
+            self._lists = None
+            self._live = live
+
+    def _decode(self, rows):
+        return self.vectors[rows].astype(np.float32) * self.scales[rows][:, None]
+
+    def _nearest_centroid(self, vectors):
+        return np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+
+    def vector(self, pk):
+        row = self._rows.get(uuid.UUID(str(pk)).bytes)
+        if row is None or not self.alive[row]:
+            return None
+        return self._decode(np.array([row]))[0]
+
+    def search(self, query, k=10, nprobe=None, exclude=()):
+        """[(product UUID, cosine similarity)] of the k nearest rows to query"""
+        if not self.live_count:
+            return []
+        if self._lists is None:
+            candidates = self._live
+        else:
+            nprobe = min(nprobe or settings.PRODUCT_VECTORS_NPROBE, len(self._lists))
+            nearest = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+            candidates = np.concatenate([self._lists[i] for i in nearest])
+        excluded = {self._rows.get(uuid.UUID(str(pk)).bytes) for pk in exclude}
+        best_rows, best_scores = [], []
+        for start in range(0, len(candidates), SCAN_CHUNK):
+            rows = candidates[start:start + SCAN_CHUNK]
+            scores = (self.vectors[rows].astype(np.float32) @ query) * self.scales[rows]
+            take = min(k + len(excluded), len(rows))
+            top = np.argpartition(-scores, take - 1)[:take]
+            best_rows.append(rows[top])
+            best_scores.append(scores[top])
+        rows, scores = np.concatenate(best_rows), np.concatenate(best_scores)
+        order = np.argsort(-scores)
+        return [
+            (uuid.UUID(bytes=self.pks[rows[i]].tobytes()), float(scores[i]))
+            for i in order if rows[i] not in excluded
+        ][:k]
+
+
+# ── Building ──────────────────────────────────────────────────────────────────
+
+def _product_rows(pks):
+    rows = Product.objects.filter(pk__in=pks).values(
+        'pk', 'name', 'short_description', 'description', 'brand__name', 'category__name',
+    )
+    attributes = {}
+    for product_id, name, value, unit in ProductAttribute.objects.filter(product_id__in=pks).values_list(
+        'product_id', 'attribute__name', 'value', 'attribute__unit',
+    ):
+        attributes.setdefault(product_id, []).append((name, value, unit))
+    return [(row['pk'], product_text(row, attributes.get(row['pk'], ()))) for row in rows]
+
+
+def sync_product_vectors(full=False, on_progress=None):
+    """
+    Bring the index in line with the catalog; returns counts. Products are
+    re-read when updated since the last sync (all of them with full=True)
+    and re-embedded only if their text changed.
+    """
+    embedder = get_embedder()
+    path = str(settings.PRODUCT_VECTORS_DIR)
+    os.makedirs(path, exist_ok=True)
+    started = timezone.now()
+    index = None if full else VectorIndex.open(path, writable=True)
+    if index is not None and index.meta['model'] != embedder.name:
+        index = None  # a different model's vectors can't be mixed in
+    stats = {'checked': 0, 'embedded': 0, 'removed': 0, 'total': 0}
+
+    active = dict(Product.objects.filter(is_active=True).values_list('pk', 'updated_at'))
+    if index is not None:
+        indexed = {uuid.UUID(bytes=key) for key, alive in zip(index.pks.tolist(), index.alive) if alive}
+        gone = indexed - set(active)
+        index.remove(gone)
+        stats['removed'] = len(gone)
+        synced_at = index.meta['synced_at']
+        if synced_at:
+            since = datetime.fromisoformat(synced_at)
+            active = {pk: updated for pk, updated in active.items() if updated >= since or pk not in indexed}
+
+    pending = list(active)
+    for start in range(0, len(pending), SYNC_CHUNK):
+        chunk = _product_rows(pending[start:start + SYNC_CHUNK])
+        stats['checked'] += len(chunk)
+        changed = []
+        for pk, text in chunk:
+            digest = fingerprint(text)
+            row = None if index is None else index._rows.get(pk.bytes)
+            if row is None or index.fingerprints[row] != digest or not index.alive[row]:
+                changed.append((pk, text, digest))
+        if changed:
+            vectors = embedder.embed([text for _, text, _ in changed])
+            if index is None:
+                for name in os.listdir(path):
+                    os.remove(os.path.join(path, name))
+                index = VectorIndex(path, vectors.shape[1], settings.PRODUCT_VECTORS_DTYPE, embedder.name)
+            index.upsert([pk for pk, _, _ in changed], vectors, [digest for _, _, digest in changed])
+            stats['embedded'] += len(changed)
+        if on_progress:
+            on_progress(stats)
+
+    if index is None:
+        return stats
+    if index.needs_training():
+        index.train()
+    index.save(synced_at=started)
+    stats['total'] = index.live_count
+    return stats
+
+
+# ── Querying ──────────────────────────────────────────────────────────────────
+
+class _Reader:
+    """The process' read-only view of the index, reloaded when a sync publishes a new version"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.index = None
+        self._version = None
+        self._checked = 0.0
+
+    def get(self):
+        now = time.monotonic()
+        if now - self._checked < RELOAD_CHECK:
+            return self.index
+        with self._lock:
+            if now - self._checked < RELOAD_CHECK:
+                return self.index
+            self._checked = now
+            try:
+                with open(os.path.join(settings.PRODUCT_VECTORS_DIR, 'meta.json')) as f:
+                    version = json.load(f)['version']
+                if version != self._version:
+                    self.index = VectorIndex.open(settings.PRODUCT_VECTORS_DIR)
+                    self._version = version
+            except (OSError, ValueError, KeyError):
+                # No index yet, or caught between a sync's writes: keep what we have
+                pass
+        return self.index
+
+
+_reader = _Reader()
+
+
+def get_vector_index():
+    return _reader.get()
+
+
+class _QueryEmbedder:
+    """Per-process background pool that embeds queries into the cache"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+        self._pending = {}
+
+    def submit(self, embedder, key, text):
+        """Future for the query's vector (deduplicated by key), or None if the backlog is full"""
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked worker: the parent's threads didn't come along
+                self._pool = ThreadPoolExecutor(QUERY_EMBED_THREADS, thread_name_prefix='query-embed')
+                self._pid = os.getpid()
+                self._pending = {}
+            future = self._pending.get(key)
+            if future is None:
+                if len(self._pending) >= QUERY_EMBED_BACKLOG:
+                    return None
+                future = self._pending[key] = self._pool.submit(self._embed, embedder, key, text)
+        return future
+
+    def _embed(self, embedder, key, text):
+        try:
+            vector = embedder.embed([text])[0]
+        except EmbeddingError:
+            logger.warning('Query embedding failed', exc_info=True)
+            # Queries go keyword-only for a while instead of each queueing up for a timeout
+            cache.set(EMBEDDER_DOWN_KEY, 1, EMBEDDER_DOWN_TTL)
+            return None
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+        cache.set(key, vector, QUERY_CACHE_TTL)
+        return vector
+
+
+_query_embedder = _QueryEmbedder()
+
+
+def embed_query(text, wait=0.0):
+    """
+    Query vector (cached per text), or None if the embedder is unavailable
+    or the vector isn't ready within `wait` seconds; it is still computed
+    and cached in the background then.
+    """
+    embedder = get_embedder(for_queries=True)
+    key = f'vectors:query:{embedder.name}:{fingerprint(text)}'
+    vector = cache.get(key)
+    if vector is not None:
+        return vector
+    if embedder.local:
+        vector = embedder.embed([text])[0]
+        cache.set(key, vector, QUERY_CACHE_TTL)
+        return vector
+    if cache.get(EMBEDDER_DOWN_KEY):
+        return None
+    future = _query_embedder.submit(embedder, key, text)
+    if future is None:
+        return None
+    try:
+        return future.result(timeout=wait)
+    except TimeoutError:
+        return None
+
+
+def semantic_search(text, k=20, min_score=None, wait=0.0):
+    """
+    [(product UUID, similarity)] for a free-text query; [] without an index
+    or when the query's embedding isn't ready within `wait` seconds.
+    """
+    index = get_vector_index()
+    if index is None or not text.strip():
+        return []
+    vector = embed_query(text, wait)
+    if vector is None or len(vector) != index.meta['dim']:
+        return []
+    min_score = settings.PRODUCT_SEMANTIC_MIN_SCORE if min_score is None else min_score
+    return [(pk, score) for pk, score in index.search(vector, k) if score >= min_score]
+
+
+def similar_product_ids(product, k=6):
+    """Nearest products to `product` by embedding, or None if it isn't indexed"""
+    index = get_vector_index()
+    vector = index.vector(product.pk) if index is not None else None
+    if vector is None:
+        return None
+    return [pk for pk, _ in index.search(vector, k, exclude=[product.pk])]
@@ -5,14 +5,15 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse
 from django.conf import settings
-from .models import Product, Category, Review, ProductView, Wishlist
+from .models import Product, Category, Review, ProductView, Wishlist, attach_reserved_stock
 from .forms import ReviewForm, ProductFilterForm
+from .vectors import semantic_search, similar_product_ids
 from apps.recommendations.engine import get_recommendations
 
 
 def home_view(request):
-    featured = Product.objects.filter(is_active=True, is_featured=True).prefetch_related('images')[:8]
-    new_arrivals = Product.objects.filter(is_active=True).order_by('-created_at').prefetch_related('images')[:8]
+    featured = Product.objects.filter(is_active=True, is_featured=True).with_reserved().prefetch_related('images')[:8]
+    new_arrivals = Product.objects.filter(is_active=True).with_reserved().order_by('-created_at').prefetch_related('images')[:8]
     top_categories = Category.objects.filter(is_active=True, parent=None).prefetch_related('children')[:8]
 
     # Personalized recommendations
@@ -30,7 +31,7 @@ def home_view(request):
 
 
 def catalog_view(request):
-    queryset = Product.objects.filter(is_active=True).prefetch_related('images').select_related('category', 'brand')
+    queryset = Product.objects.filter(is_active=True).with_reserved().prefetch_related('images').select_related('category', 'brand')
 
     # Category filter
     category_slug = request.GET.get('category')
@@ -44,11 +45,17 @@ def catalog_view(request):
     # Search
     search_query = request.GET.get('q', '').strip()
     if search_query:
+        # Keyword matches plus products close in meaning (other wording, language or spelling),
+        # if the query's embedding is cached or arrives within PRODUCT_SEMANTIC_QUERY_WAIT
+        semantic_ids = [pk for pk, _ in semantic_search(
+            search_query, k=settings.PRODUCT_SEMANTIC_CANDIDATES, wait=settings.PRODUCT_SEMANTIC_QUERY_WAIT,
+        )]
         queryset = queryset.filter(
             Q(name__icontains=search_query) |
             Q(description__icontains=search_query) |
             Q(sku__icontains=search_query) |
-            Q(brand__name__icontains=search_query)
+            Q(brand__name__icontains=search_query) |
+            Q(pk__in=semantic_ids)
         )
 
     # Price filter
@@ -99,7 +106,7 @@ def catalog_view(request):
 
 def product_detail_view(request, slug):
     product = get_object_or_404(
-        Product.objects.prefetch_related('images', 'attributes__attribute', 'reviews__user'),
+        Product.objects.with_reserved().prefetch_related('images', 'attributes__attribute', 'reviews__user'),
         slug=slug, is_active=True
     )
 
@@ -146,10 +153,15 @@ def product_detail_view(request, slug):
     if request.user.is_authenticated:
         in_wishlist = Wishlist.objects.filter(user=request.user, product=product).exists()
 
-    # Similar products
-    similar = Product.objects.filter(
-        category=product.category, is_active=True
-    ).exclude(pk=product.pk).prefetch_related('images')[:6]
+    # Similar products: nearest by embedding, or the same category while the product isn't indexed
+    similar_ids = similar_product_ids(product, k=6)
+    if similar_ids:
+        by_id = Product.objects.filter(pk__in=similar_ids, is_active=True).with_reserved().prefetch_related('images').in_bulk()
+        similar = [by_id[pk] for pk in similar_ids if pk in by_id]
+    else:
+        similar = Product.objects.filter(
+            category=product.category, is_active=True
+        ).exclude(pk=product.pk).with_reserved().prefetch_related('images')[:6]
 
     # Recommendations
     recommendations = get_recommendations(request.user if request.user.is_authenticated else None, limit=6, exclude_id=product.pk)
@@ -188,7 +200,10 @@ def toggle_wishlist(request, product_id):
 
 @login_required
 def wishlist_view(request):
-    wishlist = Wishlist.objects.filter(user=request.user).select_related('product').prefetch_related('product__images')
+    wishlist = list(
+        Wishlist.objects.filter(user=request.user).select_related('product').prefetch_related('product__images')
+    )
+    attach_reserved_stock(item.product for item in wishlist)
     return render(request, 'products/wishlist.html', {'wishlist': wishlist})
 
 
@@ -15,12 +15,16 @@ def get_recommendations(user=None, limit=8, exclude_id=None):
     Main recommendation function combining multiple strategies.
     Returns queryset of recommended products.
     """
-    from apps.products.models import Product, ProductView
+    from apps.products.models import Product, ProductView, attach_reserved_stock
     from apps.orders.models import OrderItem
 
-    cache_key = f"recs_{'u'+str(user.id) if user else 'anon'}_{exclude_id or 'none'}"
+    if user:
+        cache_key = f"recs_u{user.id}_v{_recs_version(user.id)}_{exclude_id or 'none'}"
+    else:
+        cache_key = f"recs_anon_{exclude_id or 'none'}"
     cached = cache.get(cache_key)
     if cached is not None:
+        attach_reserved_stock(cached)
         return cached
 
     if user and user.is_authenticated:
@@ -39,7 +43,22 @@ def get_recommendations(user=None, limit=8, exclude_id=None):
         recs = _popularity_recommendations(limit, exclude_id)
 
     cache.set(cache_key, recs, timeout=300)
-    return recs[:limit]
+    recs = recs[:limit]
+    attach_reserved_stock(recs)
+    return recs
+
+
+def _recs_version(user_id):
+    return cache.get_or_set(f'recs_version_u{user_id}', 1, timeout=None)
+
+
+def invalidate_recommendations(user_id):
+    """Orphan every cached recommendation list of the user by bumping its key version"""
+    key = f'recs_version_u{user_id}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 2, timeout=None)
 
 
 def _collaborative_recommendations(user, limit, exclude_id=None):
@@ -74,7 +93,7 @@ def _collaborative_recommendations(user, limit, exclude_id=None):
 
     # Get products bought by similar users but not by current user
     qs = Product.objects.filter(
-        orders__order__user_id__in=similar_user_ids,
+        orderitem__order__user_id__in=similar_user_ids,
         is_active=True, stock__gt=0,
     ).exclude(
         id__in=user_product_ids
@@ -83,7 +102,7 @@ def _collaborative_recommendations(user, limit, exclude_id=None):
         qs = qs.exclude(id=exclude_id)
 
     recommended = (
-        qs.annotate(freq=Count('orders'))
+        qs.annotate(freq=Count('orderitem'))
         .order_by('-freq', '-avg_rating')
         .prefetch_related('images')
         .distinct()[:limit]
@@ -0,0 +1,12 @@
+from apps.tasks.queue import task
+from apps.users.models import User
+from .engine import get_recommendations, invalidate_recommendations
+
+
+@task()
+def refresh_recommendations(user_id):
+    """Drop stale recommendations after a purchase and warm the home page list"""
+    invalidate_recommendations(user_id)
+    user = User.objects.filter(pk=user_id).first()
+    if user:
+        get_recommendations(user, limit=8)
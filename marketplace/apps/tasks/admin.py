@@ -0,0 +1,17 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import Task
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'attempts', 'max_attempts', 'run_at', 'finished_at')
+    list_filter = ('status', 'name')
+    search_fields = ('name',)
+    readonly_fields = ('created_at', 'finished_at', 'last_error')
+    actions = ['requeue']
+
+    def requeue(self, request, queryset):
+        queryset.update(status=Task.Status.QUEUED, attempts=0, run_at=timezone.now(), locked_until=None)
+    requeue.short_description = 'Поставить в очередь заново'
@@ -0,0 +1,53 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from apps.tasks.queue import queue_stats, schedule_periodic
+from apps.tasks.worker import Worker
+
+
+class Command(BaseCommand):
+    help = 'Run background task workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=1)
+        parser.add_argument('--poll-interval', type=float, default=1.0)
+        parser.add_argument('--once', action='store_true', help='Drain ready tasks and exit')
+        parser.add_argument('--stats', action='store_true', help='Print queue depth and exit')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            stats = queue_stats()
+            for status, n in stats['depth'].items():
+                self.stdout.write(f'{status:>8}: {n}')
+            self.stdout.write(f"oldest ready task waits {stats['oldest_ready_seconds']:.0f}s")
+            return
+
+        workers = [Worker(poll_interval=options['poll_interval']) for _ in range(options['threads'])]
+
+        if options['once']:
+            schedule_periodic()
+            processed = sum(w.run_once() for w in workers[:1])
+            self.stdout.write(f'Processed {processed} tasks.')
+            return
+
+        def stop(signum, frame):
+            for w in workers:
+                w.stopped = True
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+
+        def loop(worker):
+            try:
+                worker.run()
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=loop, args=(w,)) for w in workers]
+        for t in threads:
+            t.start()
+        self.stdout.write(f'{len(threads)} worker thread(s) started.')
+        for t in threads:
+            t.join()
@@ -0,0 +1,86 @@
+"""
+Lightweight DB-backed task queue.
+
+Side-effects are declared with @task in an app's tasks.py and queued with
+`func.delay(**kwargs)`; `@task(every=N)` also queues it every N seconds
+while a worker is running. The task row is written in the caller's transaction,
+so it becomes visible to workers only when the surrounding work commits.
+Workers are started with `manage.py run_worker`. With TASKS_ALWAYS_EAGER the
+task runs in-process right after commit instead (no worker needed), but
+nothing queues the periodic tasks: start `run_worker` as well and it runs
+them in its own process as they come due.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+def task(name=None, max_attempts=5, every=None):
+    def decorator(func):
+        task_name = name or f'{func.__module__}.{func.__name__}'
+        func.task_name = task_name
+        func.max_attempts = max_attempts
+        func.every = every
+        func.delay = lambda countdown=0, **kwargs: enqueue(task_name, countdown=countdown, **kwargs)
+        registry[task_name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, countdown=0, **kwargs):
+    func = registry[name]
+    if settings.TASKS_ALWAYS_EAGER:
+        transaction.on_commit(lambda: run_eagerly(name, kwargs))
+        return None
+    return Task.objects.create(
+        name=name,
+        payload=kwargs,
+        max_attempts=func.max_attempts,
+        run_at=timezone.now() + timedelta(seconds=countdown),
+    )
+
+
+def run_eagerly(name, kwargs):
+    try:
+        registry[name](**kwargs)
+    except Exception:
+        logger.exception('Eager task %s failed', name)
+
+
+def schedule_periodic():
+    """Queue due periodic tasks; the cache lock makes it once per interval across workers"""
+    for name, func in registry.items():
+        if func.every and cache.add(f'tasks:periodic:{name}', 1, timeout=func.every):
+            enqueue(name)
+
+
+def retry_delay(attempts):
+    """Exponential backoff: base, 2*base, 4*base ... capped"""
+    base = settings.TASKS_RETRY_BACKOFF
+    return min(base * 2 ** (attempts - 1), settings.TASKS_RETRY_BACKOFF_MAX)
+
+
+def queue_stats():
+    """Queue depth per status and the age of the oldest ready task"""
+    now = timezone.now()
+    counts = dict(
+        Task.objects.values_list('status').annotate(n=Count('id')).order_by()
+    )
+    oldest = Task.objects.filter(
+        status=Task.Status.QUEUED, run_at__lte=now
+    ).aggregate(oldest=Min('run_at'))['oldest']
+    return {
+        'depth': {status: counts.get(status, 0) for status in Task.Status.values},
+        'oldest_ready_seconds': (now - oldest).total_seconds() if oldest else 0,
+    }
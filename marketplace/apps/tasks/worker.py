@@ -0,0 +1,117 @@
+import logging
+import random
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Task
+from .queue import registry, retry_delay, schedule_periodic
+
+logger = logging.getLogger(__name__)
+
+
+class Worker:
+    def __init__(self, poll_interval=1.0, visibility_timeout=None):
+        self.poll_interval = poll_interval
+        self.visibility_timeout = visibility_timeout or settings.TASKS_VISIBILITY_TIMEOUT
+        self.stopped = False
+
+    def claim(self):
+        """Lock the next ready task; SKIP LOCKED lets many workers poll one table"""
+        now = timezone.now()
+        with transaction.atomic():
+            task = (
+                Task.objects.select_for_update(skip_locked=True)
+                .filter(
+                    Q(status=Task.Status.QUEUED, run_at__lte=now)
+                    | Q(status=Task.Status.RUNNING, locked_until__lt=now)
+                )
+                .order_by('run_at')
+                .first()
+            )
+            if task is None:
+                return None
+            task.status = Task.Status.RUNNING
+            task.attempts += 1
+            task.locked_until = now + timedelta(seconds=self.visibility_timeout)
+            task.save(update_fields=['status', 'attempts', 'locked_until'])
+        return task
+
+    @contextmanager
+    def heartbeat(self, task):
+        """
+        Keep extending the task's lock while it runs, so a job longer than the
+        visibility timeout isn't claimed by another worker meanwhile. Only a
+        worker that died stops the heartbeat and lets the task be taken back.
+        """
+        done = threading.Event()
+
+        def beat():
+            try:
+                while not done.wait(self.visibility_timeout / 3):
+                    extended = Task.objects.filter(
+                        pk=task.pk, status=Task.Status.RUNNING, attempts=task.attempts,
+                    ).update(locked_until=timezone.now() + timedelta(seconds=self.visibility_timeout))
+                    if not extended:
+                        logger.warning('Task %s #%s lost its lock', task.name, task.pk)
+                        return
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=beat, name=f'task-heartbeat-{task.pk}', daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            done.set()
+            thread.join()
+
+    def execute(self, task):
+        func = registry.get(task.name)
+        try:
+            if func is None:
+                raise LookupError(f'Unknown task {task.name}')
+            with self.heartbeat(task):
+                func(**task.payload)
+        except Exception:
+            task.last_error = traceback.format_exc()[-4000:]
+            if task.attempts < task.max_attempts:
+                delay = retry_delay(task.attempts) * random.uniform(0.8, 1.2)
+                task.status = Task.Status.QUEUED
+                task.run_at = timezone.now() + timedelta(seconds=delay)
+                logger.warning('Task %s #%s failed, retry in %.0fs', task.name, task.pk, delay)
+            else:
+                task.status = Task.Status.FAILED
+                task.finished_at = timezone.now()
+                logger.error('Task %s #%s failed permanently', task.name, task.pk)
+        else:
+            task.status = Task.Status.DONE
+            task.finished_at = timezone.now()
+            task.last_error = ''
+        task.locked_until = None
+        task.save(update_fields=['status', 'run_at', 'finished_at', 'last_error', 'locked_until'])
+
+    def run_once(self):
+        """Drain ready tasks; returns how many ran"""
+        processed = 0
+        while not self.stopped:
+            task = self.claim()
+            if task is None:
+                break
+            self.execute(task)
+            processed += 1
+        return processed
+
+    def run(self):
+        while not self.stopped:
+            close_old_connections()
+            schedule_periodic()
+            if not self.run_once():
+                time.sleep(self.poll_interval)
@@ -0,0 +1,33 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+from django.db.models.functions import Upper
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('products', '0003_trigram_search_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='user',
+            index=GinIndex(OpClass(Upper('email'), name='gin_trgm_ops'), name='users_user_email_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='user',
+            index=GinIndex(OpClass(Upper('first_name'), name='gin_trgm_ops'), name='users_user_first_name_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='user',
+            index=GinIndex(OpClass(Upper('last_name'), name='gin_trgm_ops'), name='users_user_last_name_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='user',
+            index=GinIndex(OpClass(Upper('phone'), name='gin_trgm_ops'), name='users_user_phone_trgm'),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
+from django.db.models.functions import Upper
 
 
 class User(AbstractUser):
@@ -17,6 +19,12 @@ class User(AbstractUser):
     class Meta:
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
+        indexes = [
+            GinIndex(OpClass(Upper('email'), name='gin_trgm_ops'), name='users_user_email_trgm'),
+            GinIndex(OpClass(Upper('first_name'), name='gin_trgm_ops'), name='users_user_first_name_trgm'),
+            GinIndex(OpClass(Upper('last_name'), name='gin_trgm_ops'), name='users_user_last_name_trgm'),
+            GinIndex(OpClass(Upper('phone'), name='gin_trgm_ops'), name='users_user_phone_trgm'),
+        ]
 
     def __str__(self):
         return self.email
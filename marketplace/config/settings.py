@@ -1,3 +1,4 @@
+import json
 import os 
 from pathlib import Path
 from dotenv import load_dotenv
@@ -19,6 +20,7 @@ DJANGO_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.humanize',
+    'django.contrib.postgres',
 ]
 
 THIRD_PARTY_APPS = [
@@ -34,6 +36,7 @@ LOCAL_APPS = [
     'apps.ai_chat',
     'apps.recommendations',
     'apps.dashboard',
+    'apps.tasks',
 ]
 
 INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
@@ -74,6 +77,10 @@ TEMPLATES = [
     },
 ]
 
+# Deployment is ASGI only: the chat, dashboard event and export responses are async
+# iterators, which a WSGI server buffers whole. Serve config.asgi:application (uvicorn,
+# daphne, ...); WSGI_APPLICATION only backs `manage.py runserver` in development.
+ASGI_APPLICATION = 'config.asgi.application'
 WSGI_APPLICATION = 'config.wsgi.application'
 
 DATABASES = {
@@ -137,12 +144,75 @@ LOGIN_URL = '/users/login/'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
 
-OLLAMA_BASE_URL = "http://localhost:11434"
-OLLAMA_MODEL = "gpt-oss:120b-cloud"
-OLLAMA_TIMEOUT = 600
+OLLAMA_BASE_URL = os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434')
+OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'gpt-oss:120b-cloud')
+OLLAMA_TIMEOUT = 600  # read timeout of backends that don't set their own 'timeout'
+OLLAMA_MAX_CONNECTIONS = 200  # per process, shared by all chats on the async path
+OLLAMA_MAX_KEEPALIVE = 50
+OLLAMA_HEALTH_INTERVAL = 10  # seconds between background health probes
+OLLAMA_HEALTH_FAILURES = 3  # failures in a row that open the circuit
+OLLAMA_HEALTH_COOLDOWN = 30  # seconds an open circuit waits before trying again
+
+# Chat LLM servers (apps.ai_chat.backends), as a JSON list in LLM_BACKENDS, e.g.
+# [{"name": "gpu1", "type": "ollama", "url": "http://gpu1:11434", "model": "qwen3:14b", "weight": 2},
+#  {"name": "vllm", "type": "openai", "url": "http://vllm:8000", "model": "Qwen/Qwen3-14B", "api_key": "..."}]
+LLM_BACKENDS = json.loads(os.getenv('LLM_BACKENDS', 'null')) or [
+    {'name': 'ollama', 'type': 'ollama', 'url': OLLAMA_BASE_URL, 'model': OLLAMA_MODEL},
+]
+
+AI_CATALOG_CONTEXT_REFRESH = 300  # seconds between rebuilds of the prompt's catalog summary
+AI_CATALOG_CONTEXT_DEBOUNCE = 30  # catalog changes within this window share one rebuild
+AI_RETRIEVAL_REFRESH = 60  # seconds between incremental updates of the chat product index
+AI_RETRIEVAL_REBUILD = 3600  # seconds before the index is rebuilt from scratch
+AI_RESPONSE_CACHE_TTL = 3600  # seconds an answer to an opening question is reused
+AI_RESPONSE_CACHE_SIMILARITY = 0.92  # embedding similarity for near-duplicate hits; None turns them off
+AI_RESPONSE_CACHE_QUESTIONS = 500  # recent questions compared for near-duplicates, per catalog snapshot
+AI_CONTEXT_TOKEN_BUDGET = 4000  # estimated prompt tokens: system prompt, products, summary, history, message
+AI_CONTEXT_MAX_MESSAGES = 40  # unsummarized messages read per request
+AI_SUMMARY_TRIGGER_TOKENS = 1500  # unsummarized history that schedules a summary update
+AI_SUMMARY_KEEP_TOKENS = 600  # most recent turns left out of the summary, sent verbatim
+AI_SUMMARY_MAX_TOKENS = 300  # length limit of the generated summary
+AI_TOOLS_ENABLED = True  # offer the catalog tools (apps.ai_chat.tools) to the model
+AI_TOOL_MAX_ROUNDS = 3  # rounds of tool calls before the model must answer
+AI_TOOL_CACHE_TTL = 60  # seconds a tool result is reused (per catalog snapshot)
+AI_TOOL_MAX_PRODUCTS = 8  # product cards shown with an answer
+
+# LLM admission control (apps.ai_chat.scheduler), per backend and process
+LLM_CONCURRENCY = 4  # generations sent to the backend at once
+LLM_QUEUE_MAX = 100  # waiting requests before new ones are turned away
+LLM_QUEUE_MAX_WAIT = 20  # seconds; a request expected to wait longer gets a fast "busy"
+LLM_EXPECTED_SECONDS = 10  # initial generation time estimate, refined from real runs
 
 PRODUCTS_PER_PAGE = 20
 
+# Product embeddings (apps.products.vectors): 'ollama', or 'hashing' for an offline stand-in
+PRODUCT_EMBEDDER = os.getenv('PRODUCT_EMBEDDER', 'ollama')
+OLLAMA_EMBED_MODEL = os.getenv('OLLAMA_EMBED_MODEL', 'bge-m3')
+PRODUCT_VECTORS_DIR = os.getenv('PRODUCT_VECTORS_DIR', str(BASE_DIR / 'var' / 'vectors'))
+PRODUCT_VECTORS_DTYPE = 'int8'  # or 'float32'; takes effect on the next full rebuild
+PRODUCT_VECTORS_REFRESH = 600  # seconds between incremental syncs of changed products
+PRODUCT_VECTORS_NPROBE = 8  # IVF lists scanned per query; more is slower and more exact
+PRODUCT_SEMANTIC_MIN_SCORE = 0.35  # cosine similarity below which a hit isn't relevant
+PRODUCT_SEMANTIC_CANDIDATES = 50  # semantic hits merged into catalog search
+PRODUCT_SEMANTIC_QUERY_WAIT = 0.25  # seconds catalog search waits for an uncached query embedding
+
+# Background tasks (apps.tasks). Eager mode runs tasks in-process after commit;
+# periodic tasks still need `manage.py run_worker`, which then runs them itself.
+TASKS_ALWAYS_EAGER = os.getenv('TASKS_ALWAYS_EAGER', str(DEBUG)) == 'True'
+TASKS_RETRY_BACKOFF = 5  # seconds before the first retry, doubled per attempt
+TASKS_RETRY_BACKOFF_MAX = 3600
+TASKS_VISIBILITY_TIMEOUT = 300  # a RUNNING task whose worker stopped renewing its lock this long is picked up again
+
+DASHBOARD_KPI_REFRESH = 60  # seconds between dashboard KPI snapshot refreshes
+# Live dashboard events travel over the Redis cache's pub/sub; with another cache
+# backend they only reach dashboards served by the process that published them.
+DASHBOARD_EVENTS_KEEPALIVE = 15  # seconds between SSE keepalive comments
+DASHBOARD_EVENTS_STREAM_LIFETIME = 300  # an SSE stream is closed (and reconnects) after this
+DASHBOARD_EVENTS_RETRY = 5  # seconds the browser waits before reconnecting
+
+STOCK_RESERVATION_TTL = 600  # seconds a checkout hold lasts
+ORDER_NUMBER_BLOCK_SIZE = 50  # serials prefetched per sequence round-trip
+
 if not DEBUG:
     SECURE_BROWSER_XSS_FILTER = True
     SECURE_CONTENT_TYPE_NOSNIFF = True